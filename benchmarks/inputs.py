@@ -0,0 +1,175 @@
+import os
+import random
+from typing import Any, Dict, List
+
+import numpy as np
+
+# The shapes of the generated repositories. Every repository also gets a .git directory
+# with `num_git_objects` files, since the filter has to skip it.
+REPO_SHAPES: Dict[str, Dict[str, Any]] = {
+    # A typical landing page that passes the filter
+    "small_site": {
+        "num_code_files": 4,
+        "num_style_files": 2,
+        "num_assets": 3,
+        "lines_per_file": 60,
+        "depth": 2,
+        "num_other_files": 5,
+        "num_git_objects": 200,
+    },
+    # A documentation site with many files, rejected on the number of code files
+    "wide": {
+        "num_code_files": 400,
+        "num_style_files": 20,
+        "num_assets": 100,
+        "lines_per_file": 40,
+        "depth": 1,
+        "num_other_files": 50,
+        "num_git_objects": 2000,
+    },
+    # Few files deep in the tree
+    "deep": {
+        "num_code_files": 5,
+        "num_style_files": 5,
+        "num_assets": 2,
+        "lines_per_file": 100,
+        "depth": 30,
+        "num_other_files": 60,
+        "num_git_objects": 500,
+    },
+    # Few but long files, rejected on the number of lines
+    "large_files": {
+        "num_code_files": 3,
+        "num_style_files": 1,
+        "num_assets": 0,
+        "lines_per_file": 50000,
+        "depth": 1,
+        "num_other_files": 0,
+        "num_git_objects": 200,
+    },
+}
+
+CODE_FILE_EXTENSIONS = ["html", "js", "md"]
+ASSET_FILE_EXTENSIONS = ["png", "jpg", "svg"]
+
+
+def make_screenshot(
+    width: int, height: int, background_ratio: float, seed: int = 0
+) -> np.ndarray:
+    """Generate a screenshot-like image: a white page with colored blocks and text-like lines
+
+    Args:
+        width: The width of the image.
+        height: The height of the image.
+        background_ratio: The approximate fraction of the pixels left white.
+        seed: The seed of the generation.
+
+    Returns:
+        np.ndarray: The image, as a uint8 array of shape (height, width, 3)
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    covered = np.zeros((height, width), dtype=bool)
+    target = (1 - background_ratio) * width * height
+    num_covered = 0
+    while num_covered < target:
+        block_width = int(rng.integers(width // 20, width // 3))
+        block_height = int(rng.integers(height // 30, height // 5))
+        x = int(rng.integers(0, width - block_width))
+        y = int(rng.integers(0, height - block_height))
+        color = rng.integers(0, 240, size=3, dtype=np.uint8)
+        image[y : y + block_height, x : x + block_width] = color
+        # Lines of "text" in a darker shade, every sixth row of pixels
+        image[y : y + block_height : 6, x : x + block_width] = color // 2
+        covered[y : y + block_height, x : x + block_width] = True
+        num_covered = int(covered.sum())
+    return image
+
+
+def make_screenshots(
+    width: int, height: int, background_ratio: float, num_images: int, seed: int = 0
+) -> List[np.ndarray]:
+    """Generate distinct screenshots of the same size and background ratio"""
+    return [
+        make_screenshot(width, height, background_ratio, seed=seed + i)
+        for i in range(num_images)
+    ]
+
+
+def make_repo(path: str, shape: str, seed: int = 0):
+    """Generate a repository of one of the REPO_SHAPES
+
+    Args:
+        path: The directory to create the repository in.
+        shape: The name of the shape.
+        seed: The seed of the generation.
+    """
+    spec = REPO_SHAPES[shape]
+    rng = random.Random(seed)
+
+    directories = [""]
+    for depth in range(1, spec["depth"]):
+        directories.append(os.path.join(directories[-1], f"dir{depth}"))
+
+    def write(relative_path: str, content: bytes):
+        file_path = os.path.join(path, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(content)
+
+    def text(num_lines: int) -> bytes:
+        words = ["<div>", "class", "var", "function", "{", "}", "color:", "#fff;"]
+        return "".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(1, 10))) + "\n"
+            for _ in range(num_lines)
+        ).encode("utf-8")
+
+    for i in range(spec["num_code_files"]):
+        ext = CODE_FILE_EXTENSIONS[i % len(CODE_FILE_EXTENSIONS)]
+        write(
+            os.path.join(rng.choice(directories), f"page{i}.{ext}"),
+            text(spec["lines_per_file"]),
+        )
+    for i in range(spec["num_style_files"]):
+        write(
+            os.path.join(rng.choice(directories), f"style{i}.css"),
+            text(spec["lines_per_file"]),
+        )
+    for i in range(spec["num_assets"]):
+        ext = ASSET_FILE_EXTENSIONS[i % len(ASSET_FILE_EXTENSIONS)]
+        write(
+            os.path.join(rng.choice(directories), f"image{i}.{ext}"),
+            rng.randbytes(2048),
+        )
+    for i in range(spec["num_other_files"]):
+        write(os.path.join(rng.choice(directories), f"data{i}.yml"), text(10))
+    write("_config.yml", text(5))
+    write("Gemfile", text(5))
+    for i in range(spec["num_git_objects"]):
+        write(
+            os.path.join(".git", "objects", f"{i % 256:02x}", f"{i:038x}"),
+            rng.randbytes(512),
+        )
+
+
+def make_hrefs(num_links: int, url: str, seed: int = 0) -> List[str]:
+    """Generate the hrefs of the links of a page, as found by find_clickable_elts
+
+    About half of them point to the website, and the others are duplicates, empty,
+    anchors, mail links or external links.
+    """
+    rng = random.Random(seed)
+    hrefs: List[str] = []
+    for i in range(num_links):
+        kind = rng.random()
+        if kind < 0.5:
+            hrefs.append(f"{url}/page{rng.randint(0, num_links // 4)}.html")
+        elif kind < 0.6:
+            hrefs.append("")
+        elif kind < 0.7:
+            hrefs.append(f"#section{i}")
+        elif kind < 0.8:
+            hrefs.append(f"mailto:user{i}@example.com")
+        else:
+            hrefs.append(f"https://example{rng.randint(0, 50)}.com/page{i}")
+    return hrefs
@@ -0,0 +1,338 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.inputs import REPO_SHAPES, make_hrefs, make_repo, make_screenshots
+from fetcher.filter import analyze_repo, analyze_repo_streaming, filter_repo_streaming
+from imaging.stats import compute_image_stats
+from main import ImageFilter, next_dates, previous_dates
+from renderer.utils import filter_clickable_elts
+
+# The metrics compared to the baseline, and whether lower is better
+COMPARED_METRICS = {"latency_p50_ms": True, "peak_memory_kb": True}
+
+SCREENSHOT_SIZES = [(1280, 720), (1920, 1080), (2560, 1440)]
+BACKGROUND_RATIOS = [0.5, 0.9, 0.99]
+
+
+class Benchmark:
+    """A function to measure, and the inputs it is called on in turn"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        inputs: List[Any],
+        units_per_call: float = 1.0,
+        unit: str = "calls",
+    ):
+        """
+        Args:
+            name: The name of the benchmark, "<function>/<input>".
+            func: The function to measure, called with one input.
+            inputs: The inputs, used in turn.
+            units_per_call: The amount of work done by one call, for the throughput.
+            unit: The unit of the work, e.g. "MPixels" or "files".
+        """
+        self.name: str = name
+        self.func: Callable[[Any], Any] = func
+        self.inputs: List[Any] = inputs
+        self.units_per_call: float = units_per_call
+        self.unit: str = unit
+
+
+def measure(
+    benchmark: Benchmark, min_time: float = 1.0, min_calls: int = 5, warmup: int = 1
+) -> Dict[str, Any]:
+    """Measure the latency, throughput and peak memory of a benchmark
+
+    The function is called until it has run for `min_time` seconds and at least `min_calls` times.
+    The peak memory is measured separately with tracemalloc (which slows the calls down),
+    on one call per input.
+
+    Returns:
+        Dict[str, Any]: The metrics of the benchmark
+    """
+    for i in range(warmup):
+        benchmark.func(benchmark.inputs[i % len(benchmark.inputs)])
+
+    latencies: List[int] = []
+    start = time.perf_counter_ns()
+    while len(latencies) < min_calls or time.perf_counter_ns() - start < min_time * 1e9:
+        item = benchmark.inputs[len(latencies) % len(benchmark.inputs)]
+        call_start = time.perf_counter_ns()
+        benchmark.func(item)
+        latencies.append(time.perf_counter_ns() - call_start)
+    latencies_ms = np.array(latencies) / 1e6
+
+    peak_memory = 0
+    tracemalloc.start()
+    try:
+        for item in benchmark.inputs:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            benchmark.func(item)
+            _, peak = tracemalloc.get_traced_memory()
+            peak_memory = max(peak_memory, peak - before)
+    finally:
+        tracemalloc.stop()
+
+    total_time = latencies_ms.sum() / 1000
+    return {
+        "calls": len(latencies),
+        "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "latency_p90_ms": round(float(np.percentile(latencies_ms, 90)), 4),
+        "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "throughput": round(len(latencies) * benchmark.units_per_call / total_time, 2),
+        "unit": f"{benchmark.unit}/s",
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+    }
+
+
+def get_benchmarks(work_dir: str, quick: bool = False) -> List[Benchmark]:
+    """Create the benchmarks and their inputs, which are the same from one run to the next
+
+    Args:
+        work_dir: A directory to generate the repositories in.
+        quick: Whether to only use the smallest inputs.
+    """
+    benchmarks: List[Benchmark] = []
+    num_images = 2 if quick else 4
+
+    # ImageFilter.check_image, with a new filter for each call so that no image is a duplicate
+    def check_image(image: np.ndarray):
+        ImageFilter().check_image(image)
+
+    def check_image_approximate(image: np.ndarray):
+        ImageFilter(approximate_stats=True).check_image(image)
+
+    sizes = SCREENSHOT_SIZES[:1] if quick else SCREENSHOT_SIZES
+    for width, height in sizes:
+        for background_ratio in BACKGROUND_RATIOS:
+            images = make_screenshots(width, height, background_ratio, num_images)
+            suffix = f"{width}x{height}/background_{background_ratio}"
+            megapixels = width * height / 1e6
+            benchmarks += [
+                Benchmark(
+                    f"check_image/{suffix}", check_image, images, megapixels, "MPixels"
+                ),
+                Benchmark(
+                    f"check_image_approximate/{suffix}",
+                    check_image_approximate,
+                    images,
+                    megapixels,
+                    "MPixels",
+                ),
+                Benchmark(
+                    f"compute_image_stats/{suffix}",
+                    compute_image_stats,
+                    images,
+                    megapixels,
+                    "MPixels",
+                ),
+            ]
+
+    # The analysis of repositories
+    shapes = ["small_site"] if quick else list(REPO_SHAPES.keys())
+    for shape in shapes:
+        repo_path = os.path.join(work_dir, shape)
+        make_repo(repo_path, shape)
+        num_files = sum(len(files) for _, _, files in os.walk(repo_path))
+        for func in [analyze_repo, analyze_repo_streaming, filter_repo_streaming]:
+            benchmarks.append(
+                Benchmark(
+                    f"{func.__name__}/{shape}", func, [repo_path], num_files, "files"
+                )
+            )
+
+    # The links to follow on a page
+    url = "http://localhost:4000"
+    for num_links in [100] if quick else [100, 10000]:
+        hrefs = make_hrefs(num_links, url)
+        benchmarks.append(
+            Benchmark(
+                f"filter_clickable_elts/{num_links}_links",
+                lambda hrefs: filter_clickable_elts(hrefs, url),
+                [hrefs],
+                num_links,
+                "links",
+            )
+        )
+
+    # Walking the search dates over ten years
+    args = argparse.Namespace(day_interval=7, query_created_after="2014-01-01")
+    num_windows = 52 * 10
+
+    def walk_dates_backwards(date: datetime.datetime):
+        date_start, date_next = date, date + datetime.timedelta(days=7)
+        for _ in range(num_windows):
+            date_start, date_next = previous_dates(date_start, date_next, args)
+
+    def walk_dates_forwards(date: datetime.datetime):
+        date_start, date_next = date - datetime.timedelta(days=7), date
+        for _ in range(num_windows):
+            date_start, date_next = next_dates(date_start, date_next, args)
+
+    benchmarks += [
+        Benchmark(
+            "previous_dates/10_years",
+            walk_dates_backwards,
+            [datetime.datetime(2024, 6, 1)],
+            num_windows,
+            "windows",
+        ),
+        Benchmark(
+            "next_dates/10_years",
+            walk_dates_forwards,
+            [datetime.datetime(2014, 1, 1)],
+            num_windows,
+            "windows",
+        ),
+    ]
+    return benchmarks
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float,
+) -> List[str]:
+    """List the metrics that are worse than in the baseline by more than `threshold` (relative)"""
+    regressions: List[str] = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, lower_is_better in COMPARED_METRICS.items():
+            value, reference = metrics[metric], baseline[name][metric]
+            if reference <= 0:
+                continue
+            change = (value - reference) / reference
+            if not lower_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append(
+                    f"{name}: {metric} went from {reference} to {value} ({change:+.0%})"
+                )
+    return regressions
+
+
+def get_environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def run(
+    names: Optional[List[str]] = None,
+    min_time: float = 1.0,
+    quick: bool = False,
+    verbose: bool = True,
+) -> Dict[str, Dict[str, Any]]:
+    """Run the benchmarks whose names contain one of `names` (all of them by default)"""
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        results: Dict[str, Dict[str, Any]] = {}
+        for benchmark in get_benchmarks(work_dir, quick=quick):
+            if names and not any(name in benchmark.name for name in names):
+                continue
+            results[benchmark.name] = measure(benchmark, min_time=min_time)
+            if verbose:
+                metrics = results[benchmark.name]
+                print(
+                    f"{benchmark.name:<60} p50 {metrics['latency_p50_ms']:>10.3f} ms"
+                    f"  p99 {metrics['latency_p99_ms']:>10.3f} ms"
+                    f"  {metrics['throughput']:>12.1f} {metrics['unit']:<12}"
+                    f"  peak {metrics['peak_memory_kb']:>10.1f} KB"
+                )
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths on synthetic inputs and compare them to a baseline"
+    )
+    parser.add_argument(
+        "names",
+        type=str,
+        nargs="*",
+        help="Only run the benchmarks whose names contain one of these, e.g. check_image",
+    )
+    parser.add_argument(
+        "--min_time",
+        type=float,
+        default=1.0,
+        help="The minimum time each benchmark runs for in seconds",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Only use the smallest inputs"
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default="bench_baseline.json",
+        help="The JSON file of the baseline to compare to",
+    )
+    parser.add_argument(
+        "--save_baseline",
+        action="store_true",
+        help="Save the results as the baseline (merged with the benchmarks that did not run)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="The relative increase of the median latency or the peak memory that fails the run",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="A JSON file to write the results to",
+    )
+    args = parser.parse_args()
+
+    results = run(args.names, min_time=args.min_time, quick=args.quick)
+    report = {"environment": get_environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    baseline: Optional[Dict[str, Any]] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        if baseline is not None:
+            report["results"] = {**baseline["results"], **results}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Saved the baseline to {args.baseline}")
+    elif baseline is not None:
+        regressions = compare(results, baseline["results"], args.threshold)
+        print(
+            f"Compared to {args.baseline} ({baseline['environment']['date']}): "
+            f"{len(regressions)} regressions beyond {args.threshold:.0%}"
+        )
+        for regression in regressions:
+            print(f"  {regression}")
+        if regressions:
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}. Pass --save_baseline to create one")
@@ -0,0 +1,477 @@
+import json
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .bundle_cache import normalize_gemfile
+from .failures import classify_failure
+
+# The Ruby side of the worker
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "build_worker.rb"
+)
+
+# The Gemfile the workers run with, the one given to the repositories without a Gemfile
+DEFAULT_GEMFILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Gemfile.default"
+)
+
+# The number of lines of stderr kept to find out why a build failed
+STDERR_TAIL_LINES = 50
+
+GEM_LINE = re.compile(r"^gem\s*\(?\s*\"([\w.-]+)\"(.*?)\)?$")
+VERSION_REQUIREMENT = re.compile(r"^(~>|>=|<=|!=|=|>|<)?\s*\d[\w.]*$")
+# Gems fetched from elsewhere than the gem server cannot be matched by version
+NON_RUBYGEMS_SOURCE = re.compile(
+    r"\b(git|github|gitlab|bitbucket|path|branch|ref|tag)\s*:|:(git|github|gitlab|bitbucket|path)\s*=>"
+)
+PLATFORM_OPTION = re.compile(r"\bplatforms?\s*:|:platforms?\s*=>")
+# Platforms the workers run on (MRI on Linux)
+LOCAL_PLATFORM = re.compile(r":(ruby|mri)\b")
+
+
+def parse_gemfile(gemfile_path: str) -> Optional[List[Tuple[str, List[str]]]]:
+    """List the gems a Gemfile asks for on this platform, with their version requirements
+
+    Only the plain declarative Gemfiles are understood (source, gem, group and platforms blocks).
+    The Gemfile is parsed, not evaluated: its Ruby code is never run.
+
+    Args:
+        gemfile_path (str): The path to the Gemfile
+
+    Returns:
+        Optional[List[Tuple[str, List[str]]]]: The name and the requirements (e.g. ["~> 4.3"]) of each gem,
+            or None if the Gemfile uses anything else (gemspec, gems from git or a path, conditions...)
+    """
+    with open(gemfile_path, "r", errors="replace") as f:
+        content = normalize_gemfile(f.read())
+
+    gems: List[Tuple[str, List[str]]] = []
+    # For each open block, whether its gems are for other platforms
+    skipped_blocks: List[bool] = []
+    for line in content.splitlines():
+        line = re.sub(r"\s+#[^\"]*$", "", line)
+        if re.match(r"^(source|ruby|git_source)\b", line):
+            continue
+        if re.match(r"^group\b.*\bdo$", line):
+            skipped_blocks.append(False)
+            continue
+        if re.match(r"^platforms?\b.*\bdo$", line):
+            skipped_blocks.append(not LOCAL_PLATFORM.search(line))
+            continue
+        if line == "end":
+            if not skipped_blocks:
+                return None
+            skipped_blocks.pop()
+            continue
+
+        match = GEM_LINE.match(line)
+        if match is None:
+            return None
+        name, options = match.groups()
+        if NON_RUBYGEMS_SOURCE.search(options):
+            return None
+        if any(skipped_blocks) or (
+            PLATFORM_OPTION.search(options) and not LOCAL_PLATFORM.search(options)
+        ):
+            continue
+        requirements = [
+            requirement.strip()
+            for requirement in re.findall(r"\"([^\"]*)\"", options)
+            if VERSION_REQUIREMENT.match(requirement.strip())
+        ]
+        gems.append((name, requirements))
+    if skipped_blocks:
+        return None
+    return gems
+
+
+class BuildResult:
+    """A class to store the outcome of a build by a worker"""
+
+    def __init__(self):
+        self.success: bool = False
+        self.compatible: bool = True  # False if the site should be built the usual way
+        self.reason: Optional[str] = None  # Why the site is not compatible
+        # The category of the failure (see deployment.failures)
+        self.failure: Optional[str] = None
+        self.error: Optional[str] = None  # The error raised by Jekyll
+        self.duration: float = 0.0  # The time the build took in the worker, in seconds
+        self.destination: Optional[str] = None  # The directory of the built site
+
+
+class BuildWorker:
+    """A Ruby process building Jekyll sites one after the other (see build_worker.rb)"""
+
+    def __init__(
+        self, gemfile: str, startup_timeout: float = 60, verbose: bool = False
+    ):
+        """
+        Args:
+            gemfile: The Gemfile the worker loads its gems from.
+            startup_timeout: The maximum time allowed to load Jekyll and its plugins, in seconds.
+            verbose: Whether to print the output of Jekyll.
+
+        Raises:
+            Exception: If the worker does not start
+        """
+        self.verbose: bool = verbose
+        self.num_builds: int = 0  # The number of sites built, successfully or not
+        self.stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        self._responses: queue.Queue = queue.Queue()
+        self.process = subprocess.Popen(
+            ["bundle", "exec", "ruby", WORKER_SCRIPT],
+            env={**os.environ, "BUNDLE_GEMFILE": gemfile},
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self._threads = [
+            threading.Thread(target=self._read_responses, daemon=True),
+            threading.Thread(target=self._read_stderr, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        try:
+            hello = self._receive(startup_timeout)
+        except Exception:
+            self.close()
+            raise
+        if not hello.get("ready"):
+            self.close()
+            raise Exception(f"The build worker failed to start: {hello.get('error')}")
+        self.initial_memory: Optional[int] = self.memory()
+
+    def _read_responses(self):
+        try:
+            for line in iter(self.process.stdout.readline, b""):
+                try:
+                    self._responses.put(json.loads(line))
+                except ValueError:
+                    pass  # Not a response
+        except (OSError, ValueError):
+            pass  # The stream was closed
+        self._responses.put(None)
+
+    def _read_stderr(self):
+        try:
+            for line in iter(self.process.stderr.readline, b""):
+                decoded_line = line.decode("utf-8", errors="replace").strip()
+                self.stderr_tail.append(decoded_line)
+                if self.verbose:
+                    print(f"\t> \033[91mStderr: {decoded_line}\033[0m")
+        except (OSError, ValueError):
+            pass
+
+    def _receive(self, timeout: float) -> Dict[str, Any]:
+        """Wait for the next response of the worker
+
+        Raises:
+            TimeoutError: If the worker did not answer in time
+            Exception: If the worker exited
+        """
+        try:
+            response = self._responses.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"The build worker did not answer in {timeout} seconds")
+        if response is None:
+            self._responses.put(None)  # The next calls fail too
+            tail = " | ".join(list(self.stderr_tail)[-3:])
+            raise Exception(f"The build worker exited: {tail}")
+        return response
+
+    def request(self, request: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """Send a build request and wait for its response (see build_worker.rb for the format)
+
+        Raises:
+            TimeoutError: If the build takes longer than `timeout` seconds
+            Exception: If the worker exited
+        """
+        self.stderr_tail.clear()
+        try:
+            self.process.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise Exception(f"The build worker exited: {e}")
+        return self._receive(timeout)
+
+    def memory(self) -> Optional[int]:
+        """The resident memory of the worker in bytes, None if it cannot be read"""
+        try:
+            with open(f"/proc/{self.process.pid}/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def close(self, timeout: float = 5):
+        """Stop the worker, killing it if it does not exit on its own"""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.process.wait()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        if not any(thread.is_alive() for thread in self._threads):
+            self.process.stdout.close()
+            self.process.stderr.close()
+
+
+class BuildWorkerPool:
+    """A pool of long-lived Ruby processes building Jekyll sites in-process.
+
+    A new Ruby process per site pays for the interpreter boot, the Bundler resolution and
+    the loading of Jekyll's plugins before building anything. The workers pay for it once,
+    with the gems of a single Gemfile. Sites whose Gemfile, plugins or theme need gems the
+    workers did not load (or another version of them) are reported as not compatible, to be
+    built the usual way. Each worker is recycled after `max_builds` sites or once its memory
+    grew by more than `max_memory_growth_mb`.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        gemfile: str = DEFAULT_GEMFILE,
+        max_builds: int = 100,
+        max_memory_growth_mb: float = 512,
+        startup_timeout: float = 120,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            size: The maximum number of workers alive at the same time.
+            gemfile: The Gemfile of the workers, installed with `bundle install` if needed.
+            max_builds: The number of sites a worker builds before being recycled.
+            max_memory_growth_mb: The memory a worker may gain since it started before being recycled, in MB.
+            startup_timeout: The maximum time allowed for a worker to start, in seconds.
+            verbose: Whether to print the progress.
+        """
+        self.size: int = size
+        self.gemfile: str = os.path.abspath(gemfile)
+        self.max_builds: int = max_builds
+        self.max_memory_growth: int = int(max_memory_growth_mb * 1024 * 1024)
+        self.startup_timeout: float = startup_timeout
+        self.verbose: bool = verbose
+        self.num_builds: int = 0
+        self.num_failed: int = 0
+        self.num_incompatible: int = 0
+        self.num_started: int = 0
+        self.num_recycled: int = 0
+        self._installed: Optional[bool] = None
+        self._install_lock = threading.Lock()
+        self._idle: List[BuildWorker] = []
+        self._num_alive: int = 0
+        self._closed: bool = False
+        self._condition = threading.Condition()
+
+    def __enter__(self) -> "BuildWorkerPool":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _install(self) -> bool:
+        """Install the gems of the workers once. Returns whether they are installed."""
+        with self._install_lock:
+            if self._installed is None:
+                env = {**os.environ, "BUNDLE_GEMFILE": self.gemfile}
+                output = None if self.verbose else subprocess.DEVNULL
+                check = subprocess.run(
+                    ["bundle", "check"], env=env, stdout=output, stderr=output
+                )
+                if check.returncode != 0:
+                    install = subprocess.run(
+                        ["bundle", "install"], env=env, stdout=output
+                    )
+                    self._installed = install.returncode == 0
+                else:
+                    self._installed = True
+                if not self._installed:
+                    print(
+                        f"Failed to install the gems of {self.gemfile} for the build workers"
+                    )
+            return self._installed
+
+    def acquire(self) -> BuildWorker:
+        """Take an idle worker, starting a new one if none is idle
+
+        Raises:
+            Exception: If the pool is closed or the worker does not start
+        """
+        dead: List[BuildWorker] = []
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise ValueError("The build worker pool is closed")
+                if self._idle:
+                    worker = self._idle.pop()
+                    if worker.process.poll() is None:
+                        break
+                    self._remove(worker)
+                    dead.append(worker)
+                    continue
+                if self._num_alive < self.size:
+                    # Reserve the slot, the worker is started outside of the lock
+                    self._num_alive += 1
+                    self.num_started += 1
+                    worker = None
+                    break
+                self._condition.wait()
+        for dead_worker in dead:
+            dead_worker.close()
+        if worker is not None:
+            return worker
+
+        try:
+            worker = BuildWorker(
+                self.gemfile, startup_timeout=self.startup_timeout, verbose=self.verbose
+            )
+        except Exception:
+            with self._condition:
+                self._num_alive -= 1
+                self._condition.notify()
+            raise
+        if self.verbose:
+            print("Started a new build worker.")
+        return worker
+
+    def _remove(self, worker: BuildWorker):
+        """Free the slot of a worker, which is stopped once the lock is released. Must be called with the lock held."""
+        self._num_alive -= 1
+        self._condition.notify()
+
+    def release(self, worker: BuildWorker, broken: bool = False):
+        """Give a worker back to the pool, recycling it if it is broken, worn out or too large"""
+        memory = worker.memory()
+        grown = (
+            memory is not None
+            and worker.initial_memory is not None
+            and memory - worker.initial_memory > self.max_memory_growth
+        )
+        with self._condition:
+            recycle = (
+                broken or self._closed or grown or worker.num_builds >= self.max_builds
+            )
+            if recycle:
+                if not broken and not self._closed:
+                    self.num_recycled += 1
+                self._remove(worker)
+            else:
+                self._idle.append(worker)
+                self._condition.notify()
+        if recycle:
+            # A broken worker may be stuck in a build, it is killed right away
+            worker.close(timeout=0 if broken else 5)
+
+    def build(
+        self, repo_path: str, baseurl: str = "", timeout: float = 30
+    ) -> BuildResult:
+        """Build a site into its `_site` directory with a worker
+
+        Args:
+            repo_path (str): The path to the repository, with its Gemfile and config already set up.
+            baseurl (str, optional): The base URL of the site. Defaults to "".
+            timeout (float, optional): The maximum time allowed for the build in seconds. Defaults to 30.
+
+        Returns:
+            BuildResult: The outcome of the build. If it is not compatible, nothing was built.
+        """
+        result = BuildResult()
+        gemfile_path = os.path.join(repo_path, "Gemfile")
+        gems = parse_gemfile(gemfile_path) if os.path.exists(gemfile_path) else []
+        if gems is None:
+            result.reason = "the Gemfile is not a plain list of gems"
+        elif not self._install():
+            result.reason = "the gems of the build workers are not installed"
+        if result.reason is not None:
+            result.compatible = False
+            with self._condition:
+                self.num_incompatible += 1
+            return result
+
+        try:
+            worker = self.acquire()
+        except Exception as e:
+            result.compatible = False
+            result.reason = f"no build worker: {e}"
+            return result
+
+        broken = False
+        try:
+            response = worker.request(
+                {
+                    "source": os.path.abspath(repo_path),
+                    "destination": os.path.join(os.path.abspath(repo_path), "_site"),
+                    "baseurl": baseurl,
+                    "gems": gems,
+                },
+                timeout=timeout,
+            )
+            if response.get("incompatible"):
+                result.compatible = False
+                result.reason = response["incompatible"]
+            elif response.get("ok"):
+                result.success = True
+                result.duration = response.get("duration", 0.0)
+                result.destination = response.get("destination")
+            else:
+                result.error = response.get("error")
+                result.failure = (
+                    classify_failure([result.error or ""] + list(worker.stderr_tail))
+                    or "unknown"
+                )
+            # Only the sites actually built wear the worker out
+            worker.num_builds += int(result.compatible)
+        except TimeoutError as e:
+            broken = True
+            result.failure = "timeout"
+            result.error = str(e)
+        except Exception as e:
+            # The site may have crashed the worker, it gets another chance the usual way
+            broken = True
+            result.compatible = False
+            result.reason = str(e)
+        finally:
+            self.release(worker, broken=broken)
+
+        with self._condition:
+            self.num_builds += int(result.success)
+            self.num_failed += int(result.compatible and not result.success)
+            self.num_incompatible += int(not result.compatible)
+        return result
+
+    def close(self):
+        """Stop all the idle workers. Workers in use are stopped when released."""
+        with self._condition:
+            self._closed = True
+            workers = self._idle
+            self._idle = []
+            for worker in workers:
+                self._remove(worker)
+            self._condition.notify_all()
+        for worker in workers:
+            worker.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "built": self.num_builds,
+                "failed": self.num_failed,
+                "incompatible": self.num_incompatible,
+                "workers_started": self.num_started,
+                "workers_recycled": self.num_recycled,
+            }
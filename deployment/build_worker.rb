@@ -0,0 +1,93 @@
+# Builds Jekyll sites one after the other in a single Ruby process, so that the
+# interpreter boot, the Bundler resolution and the plugin loading are paid once.
+# Driven by deployment/build_worker.py: each request is a JSON line on stdin,
+# each response a JSON line on stdout. Jekyll logs go to stderr.
+#
+# Request:  {"source": ..., "destination": ..., "baseurl": ..., "gems": [[name, [requirement, ...]], ...]}
+# Response: {"ok": true, "duration": seconds, "destination": path}
+#        or {"ok": false, "incompatible": reason} if the site needs what the worker did not load
+#        or {"ok": false, "error": message} if the build failed
+
+protocol = STDOUT.dup
+protocol.sync = true
+# Whatever the gems print must not end up in the responses
+STDOUT.reopen(STDERR)
+$stdout = $stderr
+
+require "json"
+
+def respond(protocol, response)
+  protocol.puts(JSON.generate(response))
+end
+
+begin
+  Bundler.require(:jekyll_plugins) if defined?(Bundler) && ENV["BUNDLE_GEMFILE"]
+  require "jekyll"
+rescue Exception => e
+  respond(protocol, { "ready" => false, "error" => "#{e.class}: #{e.message}" })
+  exit 1
+end
+
+def loaded_version(name)
+  spec = Gem.loaded_specs[name]
+  spec&.version
+end
+
+# Find why a site cannot be built by this worker, nil if it can
+def incompatibility(request, config)
+  (request["gems"] || []).each do |name, requirements|
+    version = loaded_version(name)
+    return "#{name} is not in the bundle of the worker" if version.nil?
+
+    requirement = Gem::Requirement.new(*requirements)
+    return "#{name} #{version} does not satisfy #{requirement}" unless requirement.satisfied_by?(version)
+  end
+
+  # Plugins and themes come from the bundle of the worker. Local plugins are Ruby code
+  # that would stay loaded for the next sites.
+  (Array(config["plugins"]) + Array(config["gems"]) + Array(config["theme"])).each do |name|
+    next unless name.is_a?(String)
+    return "#{name} is not in the bundle of the worker" if loaded_version(name).nil?
+  end
+  plugins_dirs = Array(config["plugins_dir"]).map { |dir| File.expand_path(dir, request["source"]) }
+  return "the site has local plugins" if plugins_dirs.any? { |dir| Dir.exist?(dir) }
+
+  nil
+end
+
+def build(request)
+  source = File.expand_path(request["source"])
+  config = Jekyll.configuration(
+    "source" => source,
+    "destination" => File.expand_path(request["destination"] || File.join(source, "_site")),
+    "baseurl" => request["baseurl"] || "",
+    "quiet" => true
+  )
+  reason = incompatibility(request, config)
+  return { "ok" => false, "incompatible" => reason } unless reason.nil?
+
+  start = Process.clock_gettime(Process::CLOCK_MONOTONIC)
+  # The caches of the previous sites are of no use and would keep growing
+  Jekyll::Cache.clear if defined?(Jekyll::Cache)
+  site = Jekyll::Site.new(config)
+  Dir.chdir(source) { site.process }
+  duration = Process.clock_gettime(Process::CLOCK_MONOTONIC) - start
+  { "ok" => true, "duration" => duration.round(3), "destination" => site.dest }
+rescue Exception => e
+  raise if e.is_a?(Interrupt) || e.is_a?(SystemExit)
+
+  { "ok" => false, "error" => "#{e.class}: #{e.message}" }
+end
+
+respond(protocol, { "ready" => true, "jekyll" => Jekyll::VERSION, "ruby" => RUBY_VERSION })
+STDIN.each_line do |line|
+  next if line.strip.empty?
+
+  response =
+    begin
+      build(JSON.parse(line))
+    rescue JSON::ParserError => e
+      { "ok" => false, "error" => "Invalid request: #{e.message}" }
+    end
+  respond(protocol, response)
+end
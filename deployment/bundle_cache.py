@@ -0,0 +1,166 @@
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+from typing import Dict, Optional
+
+# Gemfile directives that refer to files next to the Gemfile.
+# Such Gemfiles cannot be moved to the cache directory.
+LOCAL_REFERENCES = re.compile(r"^\s*(gemspec|eval_gemfile)\b|\bpath\s*(:|=>)", re.M)
+
+
+def normalize_gemfile(content: str) -> str:
+    """Normalize a Gemfile so that cosmetic differences do not change its fingerprint."""
+    lines = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        line = line.replace("'", '"')
+        line = re.sub(r"\s+", " ", line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def normalize_lockfile(content: str) -> str:
+    """Normalize a Gemfile.lock, ignoring the version of Bundler that wrote it."""
+    content = re.sub(r"\nBUNDLED WITH\n\s+\S+\s*", "\n", content)
+    return "\n".join(line.rstrip() for line in content.splitlines() if line.strip())
+
+
+class BundleCache:
+    """A shared cache of installed gems, keyed by the fingerprint of the Gemfile and Gemfile.lock.
+
+    Each fingerprint gets its own directory holding a copy of the Gemfile, the resolved
+    Gemfile.lock and the installed gems. Repositories with a known fingerprint skip
+    `bundle install` entirely by pointing `BUNDLE_GEMFILE` and `BUNDLE_PATH` at it,
+    so a warm cache works offline. The directory can be shared by several processes.
+    """
+
+    def __init__(self, cache_dir: str, verbose: bool = False):
+        """
+        Args:
+            cache_dir: The directory to store the installed gems in.
+            verbose: Whether to print the progress.
+        """
+        self.cache_dir: str = os.path.abspath(cache_dir)
+        self.verbose: bool = verbose
+        self.num_hits: int = 0
+        self.num_misses: int = 0
+        self.num_uncacheable: int = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def fingerprint(self, repo_path: str) -> Optional[str]:
+        """Compute the fingerprint of the Gemfile of a repository.
+
+        Returns:
+            Optional[str]: The fingerprint, or None if the Gemfile cannot be cached
+        """
+        gemfile_path = os.path.join(repo_path, "Gemfile")
+        if not os.path.exists(gemfile_path):
+            return None
+        with open(gemfile_path, "r", errors="replace") as f:
+            gemfile = f.read()
+        if LOCAL_REFERENCES.search(gemfile):
+            return None
+
+        lockfile = ""
+        lockfile_path = os.path.join(repo_path, "Gemfile.lock")
+        if os.path.exists(lockfile_path):
+            with open(lockfile_path, "r", errors="replace") as f:
+                lockfile = f.read()
+
+        digest = hashlib.sha256()
+        digest.update(normalize_gemfile(gemfile).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_lockfile(lockfile).encode("utf-8"))
+        return digest.hexdigest()[:20]
+
+    def get_env(self, fingerprint: str) -> Dict[str, str]:
+        """Get the Bundler environment variables pointing at a cache entry."""
+        entry_path = os.path.join(self.cache_dir, fingerprint)
+        return {
+            "BUNDLE_GEMFILE": os.path.join(entry_path, "Gemfile"),
+            "BUNDLE_PATH": os.path.join(entry_path, "gems"),
+            "BUNDLE_FROZEN": "true",
+        }
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _install(self, repo_path: str, entry_path: str) -> bool:
+        """Install the gems of a repository into a cache entry."""
+        shutil.rmtree(os.path.join(entry_path, "gems"), ignore_errors=True)
+        shutil.copy(os.path.join(repo_path, "Gemfile"), entry_path)
+        lockfile_path = os.path.join(repo_path, "Gemfile.lock")
+        if os.path.exists(lockfile_path):
+            shutil.copy(lockfile_path, entry_path)
+
+        env = {
+            **os.environ,
+            "BUNDLE_GEMFILE": os.path.join(entry_path, "Gemfile"),
+            "BUNDLE_PATH": os.path.join(entry_path, "gems"),
+        }
+        result = subprocess.run(
+            ["bundle", "install"],
+            cwd=entry_path,
+            env=env,
+            stdout=None if self.verbose else subprocess.DEVNULL,
+        )
+        return result.returncode == 0
+
+    def prepare(self, repo_path: str) -> Optional[Dict[str, str]]:
+        """Make the gems of a repository available, installing them on a miss.
+
+        Args:
+            repo_path (str): The path to the repository, with its Gemfile already set up.
+
+        Returns:
+            Optional[Dict[str, str]]: The environment variables to run Bundler with,
+                or None if the repository should be installed the usual way
+        """
+        fingerprint = self.fingerprint(repo_path)
+        if fingerprint is None:
+            self._count("num_uncacheable")
+            return None
+
+        entry_path = os.path.join(self.cache_dir, fingerprint)
+        complete_path = os.path.join(entry_path, ".complete")
+        if os.path.exists(complete_path):
+            self._count("num_hits")
+            if self.verbose:
+                print(f"Bundle cache hit for {fingerprint}")
+            return self.get_env(fingerprint)
+
+        os.makedirs(entry_path, exist_ok=True)
+        with open(os.path.join(entry_path, ".lock"), "w") as lock_file:
+            # Only one thread or process installs a given entry, the others wait for it
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(complete_path):
+                    self._count("num_hits")
+                    return self.get_env(fingerprint)
+
+                self._count("num_misses")
+                if self.verbose:
+                    print(f"Bundle cache miss for {fingerprint}, installing...")
+                if not self._install(repo_path, entry_path):
+                    print(f"Failed to install the gems for {fingerprint}")
+                    return None
+                open(complete_path, "w").close()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return self.get_env(fingerprint)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.num_hits,
+                "misses": self.num_misses,
+                "uncacheable": self.num_uncacheable,
+            }
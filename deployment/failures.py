@@ -0,0 +1,61 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# The categories of Jekyll failures, with the stderr patterns that identify them.
+# The first category with a matching line wins, so the more specific ones come first.
+FAILURE_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    (
+        "port_conflict",
+        re.compile(r"Address already in use|EADDRINUSE|bind\(2\) for", re.I),
+    ),
+    (
+        "theme_not_found",
+        re.compile(
+            r"theme could not be found|Jekyll::Errors::MissingDependencyException"
+            r"|remote_theme.*(not found|could not)|Unable to find theme",
+            re.I,
+        ),
+    ),
+    (
+        "missing_gem",
+        re.compile(
+            r"Could not find (gem|[\w.-]+-[\d.]+ in)|Bundler::GemNotFound"
+            r"|Gem::MissingSpecError|cannot load such file|Dependency Error"
+            r"|is not (currently )?included in the bundle|Could not locate Gemfile",
+            re.I,
+        ),
+    ),
+    (
+        "liquid_error",
+        re.compile(r"Liquid (Exception|syntax error|error)|Liquid::\w*Error", re.I),
+    ),
+    (
+        "config_error",
+        re.compile(r"Error reading file .*_config\.yml|Psych::SyntaxError", re.I),
+    ),
+]
+
+# Stderr lines that never mean that the start failed, e.g. Ruby deprecation warnings
+HARMLESS_PATTERN = re.compile(
+    r"warning:|deprecat|^\s*(from )?\S+\.rb:\d+:in|^\s*$", re.I
+)
+
+
+def classify_failure(lines: Iterable[str]) -> Optional[str]:
+    """Find the category of a failure of Jekyll from the lines it wrote to stderr.
+
+    Args:
+        lines: The lines of stderr, e.g. the last ones kept by the server.
+
+    Returns:
+        Optional[str]: The first category of FAILURE_PATTERNS that matches a line,
+            "unknown" if only unrecognized errors were written, or None if there
+            were only harmless lines (or none at all)
+    """
+    lines = list(lines)
+    for category, pattern in FAILURE_PATTERNS:
+        if any(pattern.search(line) for line in lines):
+            return category
+    if any(not HARMLESS_PATTERN.search(line) for line in lines):
+        return "unknown"
+    return None
@@ -0,0 +1,93 @@
+import socket
+import threading
+import time
+from typing import Optional, Set
+
+
+def is_port_free(port: int, host: str = "127.0.0.1") -> bool:
+    """Check if a port can be bound on the host.
+
+    SO_REUSEADDR is set like servers do, so ports lingering in TIME_WAIT count as free.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+class PortPool:
+    """A thread-safe pool leasing free ports to concurrent servers.
+
+    Ports are handed out round-robin so that a port that was just released is not
+    immediately reused while the previous server may still be shutting down.
+    """
+
+    def __init__(
+        self, start_port: int = 4000, num_ports: int = 100, host: str = "127.0.0.1"
+    ):
+        """
+        Args:
+            start_port: The first port of the range.
+            num_ports: The number of ports in the range.
+            host: The host the servers bind to.
+        """
+        self.start_port: int = start_port
+        self.num_ports: int = num_ports
+        self.host: str = host
+        self._leased: Set[int] = set()
+        self._next_offset: int = 0
+        self._condition = threading.Condition()
+
+    def _find_free_port(self) -> Optional[int]:
+        for i in range(self.num_ports):
+            offset = (self._next_offset + i) % self.num_ports
+            port = self.start_port + offset
+            if port in self._leased or not is_port_free(port, self.host):
+                continue
+            self._next_offset = offset + 1
+            return port
+        return None
+
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """Lease a free port.
+
+        Args:
+            timeout: The maximum time to wait for a port in seconds. None waits forever.
+
+        Returns:
+            int: The leased port
+
+        Raises:
+            Exception: If no port became free within `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                port = self._find_free_port()
+                if port is not None:
+                    self._leased.add(port)
+                    return port
+
+                # Ports can also be freed by processes outside of the pool, so wake up regularly
+                wait = 0.1
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Exception(
+                            f"No free port in {self.start_port}-{self.start_port + self.num_ports - 1}"
+                        )
+                    wait = min(wait, remaining)
+                self._condition.wait(wait)
+
+    def release(self, port: int):
+        """Give a leased port back to the pool."""
+        with self._condition:
+            self._leased.discard(port)
+            self._condition.notify()
+
+    def num_leased(self) -> int:
+        with self._condition:
+            return len(self._leased)
@@ -1,32 +1,92 @@
 import subprocess
 import os
 import signal
-from typing import Any, Optional
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
 import time
 import socket
 import threading
+import http.client
+import urllib.error
+import urllib.request
+
+from .build_worker import BuildWorkerPool
+from .bundle_cache import BundleCache
+from .failures import classify_failure
+from .ports import PortPool
+from .static import PREFIX_MODE, StaticSiteServer
+
+# The number of lines of stderr kept to find out why a server failed
+STDERR_TAIL_LINES = 50
+
+# The first and the longest wait between two readiness probes, in seconds
+PROBE_INITIAL_INTERVAL = 0.05
+PROBE_MAX_INTERVAL = 1.0
+
+# The timeout of a readiness probe, in seconds
+PROBE_TIMEOUT = 2.0
+
+# The probes go straight to the local server, whatever the proxy settings
+_local_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
 
 
 class JekyllServer:
-    """A class to start and stop a Jekyll server in a separate process."""
+    """A class to start and stop a Jekyll server in a separate process.
 
-    def __init__(self, repo_path: str, port: int, verbose: bool = False):
+    If a `StaticSiteServer` is given, the site is instead built once with `jekyll build`
+    and its `_site` directory is served by the static server, so no Ruby process stays alive.
+    """
+
+    def __init__(
+        self,
+        repo_path: str,
+        port: Optional[int] = None,
+        verbose: bool = False,
+        port_pool: Optional[PortPool] = None,
+        static_server: Optional[StaticSiteServer] = None,
+        bundle_cache: Optional[BundleCache] = None,
+        build_workers: Optional[BuildWorkerPool] = None,
+    ):
+        """
+        Args:
+            repo_path: The path to the repository to serve.
+            port: The port to serve on. If None, a port is leased from `port_pool` when starting.
+            verbose: Whether to print the progress.
+            port_pool: The pool to lease the port from. The port is given back when the server stops.
+            static_server: The server to serve the built site from, instead of running `jekyll serve`.
+            bundle_cache: The cache of installed gems to use instead of running `bundle install` in the repository.
+            build_workers: The long-lived Ruby processes to build the site with (static server only).
+                Sites they cannot build are installed and built the usual way.
+        """
         self.repo_path: str = repo_path
         self.verbose: bool = verbose
-        self.port: int = port
+        self.port: Optional[int] = port
+        self.port_pool: Optional[PortPool] = port_pool
+        self.static_server: Optional[StaticSiteServer] = static_server
+        self.bundle_cache: Optional[BundleCache] = bundle_cache
+        self.build_workers: Optional[BuildWorkerPool] = build_workers
+        self.bundle_env: Dict[str, str] = {}  # Bundler settings for the Jekyll commands
+        self._leased_port: bool = False
+        self.site_id: Optional[str] = None
+        self.url: Optional[str] = None  # The URL of the site once started
         self.process: Optional[subprocess.Popen] = None
+        # The durations in seconds of "install" and "start" (the build or the server start)
+        self.timings: Dict[str, float] = {}
+        self.stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        # Why the start failed: "timeout", "port_conflict", "missing_gem", "theme_not_found",
+        # "liquid_error", "config_error", "unknown" or "exited" (see deployment.failures)
+        self.failure: Optional[str] = None
+        self._output_threads: List[threading.Thread] = []
         self.success: bool = (
             False  # Shared flag to indicate if the server started successfully
         )
+        if port is None and port_pool is None and static_server is None:
+            raise ValueError(
+                "Either a port, a port pool or a static server should be provided"
+            )
 
     def __del__(self):
         self.stop()
-        if JekyllServer.is_port_in_use(self.port):
-            if self.verbose:
-                print(f"Port {self.port} is in use. Attempting to free it.")
-            self.kill_process_using_port(self.port)
-        if self.verbose:
-            print("JekyllServer object deleted.")
 
     def setup_gemfile(self):
         # Check if Gemfile exists, if not, copy Gemfile.default to Gemfile
@@ -55,122 +115,316 @@ class JekyllServer:
                 print("Copied _config.default.yml to _config.yml")
             return
 
+    @staticmethod
     def is_port_in_use(port):
         """Check if a port is in use on localhost."""
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             return s.connect_ex(("localhost", port)) == 0
 
-    def kill_process_using_port(self, port):
-        """Find and kill the process using the specified port."""
-        command = f"lsof -ti:{port} | xargs kill -9"
-        os.system(command)
-        if self.verbose:
-            print(f"Killed process using port {port}.")
+    def read_output(self, stream, is_stderr: bool):
+        """Print the lines of an output stream until it is closed, keeping the last lines of stderr.
 
-    def stream_output(self, process):
-        """Read from stdout and stderr streams and print."""
-        while True:
-            output = process.stdout.readline()
-            if not output:
-                err = process.stderr.readline()
-                if err:
-                    decoded_line = err.decode("utf-8").strip()
+        The streams are read for as long as the server runs, so that it never blocks on a full pipe.
+        """
+        try:
+            for line in iter(stream.readline, b""):
+                decoded_line = line.decode("utf-8", errors="replace").strip()
+                if is_stderr:
+                    self.stderr_tail.append(decoded_line)
                     if self.verbose:
                         print(f"\t> \033[91mStderr: {decoded_line}\033[0m")
-                    self.success = False
-                    break
-                else:
-                    # No more output
-                    break
-            else:
-                decoded_line = output.decode("utf-8").strip()
-                if self.verbose:
+                elif self.verbose:
                     print(f"\t> Stdout: {decoded_line}")
-                if "Server running... press ctrl-c to stop." in decoded_line:
-                    self.success = True
-                    break
+        except (OSError, ValueError):
+            pass  # The stream was closed
 
-    def start(self, timeout: int = 30) -> bool:
-        """Start the Jekyll server in a separate process and monitor the output."""
-        if JekyllServer.is_port_in_use(self.port):
-            if self.verbose:
-                print(f"Port {self.port} is in use. Attempting to free it.")
-            self.kill_process_using_port(self.port)
+    def is_ready(self, timeout: float = PROBE_TIMEOUT) -> bool:
+        """Check if the server answers a GET on `/` (any response but a server error)."""
+        try:
+            with _local_opener.open(
+                f"http://127.0.0.1:{self.port}/", timeout=timeout
+            ) as response:
+                return response.status < 500
+        except urllib.error.HTTPError as e:
+            return e.code < 500
+        except (OSError, http.client.HTTPException):
+            return False
 
+    def wait_until_ready(self, timeout: float) -> bool:
+        """Probe the server with a growing interval until it is ready.
+
+        Returns:
+            bool: Whether the server is ready. False as soon as the process exits, or after `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        interval = PROBE_INITIAL_INTERVAL
+        while True:
+            if self.process.poll() is not None:
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Another process may answer on the port if the server could not bind it
+            if (
+                self.is_ready(timeout=min(PROBE_TIMEOUT, remaining))
+                and self.process.poll() is None
+            ):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                # Returns as soon as the process exits
+                self.process.wait(timeout=min(interval, remaining))
+                return False
+            except subprocess.TimeoutExpired:
+                pass
+            interval = min(interval * 2, PROBE_MAX_INTERVAL)
+
+    def install(self):
+        """Set up the Gemfile and the config and install the gems."""
+        start = time.perf_counter()
+        try:
+            self._install()
+        finally:
+            self.timings["install"] = time.perf_counter() - start
+
+    def _install(self):
         self.setup_gemfile()
         self.setup_config()
+        if self.bundle_cache is not None:
+            env = self.bundle_cache.prepare(self.repo_path)
+            if env is not None:
+                self.bundle_env = env
+                return
         command_install = f"cd {self.repo_path} && bundle install"
         os.system(command_install)
 
-        command_serve = (
-            f"cd {self.repo_path} && bundle exec jekyll serve --port {self.port}"
-        )
-        self.process = subprocess.Popen(
-            command_serve,
-            shell=True,
+    def build(self, timeout: int = 30, baseurl: str = "") -> bool:
+        """Build the site once into `_site`. Returns whether the build succeeded."""
+        process = subprocess.Popen(
+            ["bundle", "exec", "jekyll", "build", "--baseurl", baseurl],
+            cwd=self.repo_path,
+            env={**os.environ, **self.bundle_env},
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            preexec_fn=os.setsid,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print("Timeout reached while building the site.")
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            self.failure = "timeout"
+            return False
+
+        if self.verbose:
+            for line in stdout.decode("utf-8", errors="replace").splitlines():
+                print(f"\t> Stdout: {line.strip()}")
+        self.stderr_tail.extend(
+            line.strip()
+            for line in stderr.decode("utf-8", errors="replace").splitlines()
+        )
+        if process.returncode != 0:
+            if self.verbose:
+                for line in self.stderr_tail:
+                    print(f"\t> \033[91mStderr: {line}\033[0m")
+            self.failure = classify_failure(self.stderr_tail) or "exited"
+            return False
+        if not os.path.isdir(os.path.join(self.repo_path, "_site")):
+            self.failure = "unknown"
+            return False
+        return True
+
+    def build_in_worker(self, timeout: int = 30, baseurl: str = "") -> Optional[bool]:
+        """Build the site once into `_site` with a build worker, without installing its gems.
+
+        Returns:
+            Optional[bool]: Whether the build succeeded, or None if the workers cannot build the site
+        """
+        self.setup_gemfile()
+        self.setup_config()
+        result = self.build_workers.build(
+            self.repo_path, baseurl=baseurl, timeout=timeout
         )
+        if not result.compatible:
+            if self.verbose:
+                print(f"Building without a build worker: {result.reason}")
+            return None
+        if not result.success:
+            self.failure = result.failure
+            if self.verbose and result.error:
+                print(f"\t> \033[91mStderr: {result.error}\033[0m")
+            return False
+        if self.verbose:
+            print(f"Built by a build worker in {result.duration:.2f} seconds.")
+        return True
+
+    def start_static(self, timeout: int = 30) -> bool:
+        """Build the site and serve it from the static server."""
+        site_id = self.static_server.make_site_id(os.path.basename(self.repo_path))
+        baseurl = f"/{site_id}" if self.static_server.mode == PREFIX_MODE else ""
+
+        built: Optional[bool] = None
+        if self.build_workers is not None:
+            start = time.perf_counter()
+            built = self.build_in_worker(timeout=timeout, baseurl=baseurl)
+            self.timings["start"] = time.perf_counter() - start
+        if built is None:
+            self.install()
+            start = time.perf_counter()
+            built = self.build(timeout=timeout, baseurl=baseurl)
+            self.timings["start"] = time.perf_counter() - start
+        if not built:
+            self.static_server.remove_site(site_id)
+            if self.verbose:
+                print(f"Jekyll build failed ({self.failure}).")
+            return False
 
-        # Start thread to read output
-        output_thread = threading.Thread(
-            target=self.stream_output, args=(self.process,)
+        self.site_id = site_id
+        self.url = self.static_server.add_site(
+            site_id, os.path.join(self.repo_path, "_site")
         )
-        output_thread.start()
+        self.port = self.static_server.port
+        if self.verbose:
+            print(f"Jekyll site built and served at {self.url}.")
+        return True
 
-        # Wait for the thread to complete or timeout
-        output_thread.join(timeout=timeout)
+    def start(self, timeout: int = 30) -> bool:
+        """Start the Jekyll server in a separate process and wait until it answers HTTP requests.
 
-        if output_thread.is_alive():
-            # If the thread is still alive after the timeout, the server did not start successfully within the timeout period
-            print("Timeout reached without detecting server start.")
-            self.process.terminate()  # Terminate the process if it's still running
-            output_thread.join()  # Ensure the thread is cleaned up
+        If the start fails, `failure` tells why, from the last lines written to stderr.
+        """
+        if self.static_server is not None:
+            return self.start_static(timeout)
+
+        if self.port_pool is not None and self.port is None:
+            self.port = self.port_pool.acquire()
+            self._leased_port = True
+        elif JekyllServer.is_port_in_use(self.port):
+            print(f"Port {self.port} is already in use.")
+            self.failure = "port_conflict"
             return False
-        else:
+
+        self.install()
+        start = time.perf_counter()
+
+        # Run Jekyll directly (no shell) in its own process group so that stopping
+        # the group reaps everything it spawned
+        self.process = subprocess.Popen(
+            ["bundle", "exec", "jekyll", "serve", "--port", str(self.port)],
+            cwd=self.repo_path,
+            env={**os.environ, **self.bundle_env},
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+
+        # Read the output in the background, stderr is only used to explain failures
+        self._output_threads = [
+            threading.Thread(
+                target=self.read_output, args=(stream, is_stderr), daemon=True
+            )
+            for stream, is_stderr in [
+                (self.process.stdout, False),
+                (self.process.stderr, True),
+            ]
+        ]
+        for thread in self._output_threads:
+            thread.start()
+
+        self.success = self.wait_until_ready(timeout)
+        self.timings["start"] = time.perf_counter() - start
+
+        if not self.success:
+            if self.process.poll() is None:
+                print("Timeout reached without the server answering.")
+                self.failure = "timeout"
+            else:
+                # Let the readers catch the last lines written before the exit
+                for thread in self._output_threads:
+                    thread.join(timeout=1)
+                self.failure = classify_failure(self.stderr_tail) or "exited"
             if self.verbose:
-                if self.success:
-                    print("Jekyll server started successfully.")
-                else:
-                    print("Jekyll server failed to start.")
-            return self.success  # Return the success flag
+                print(f"Jekyll server failed to start ({self.failure}).")
+            self.stop()
+            return False
+
+        self.url = f"http://localhost:{self.port}"
+        if self.verbose:
+            print("Jekyll server started successfully.")
+        return True
 
-    def stop(self, timeout=5):
+    def _wait_for_process_group(self, pgid: int, timeout: float) -> bool:
+        """Wait for every process of the group to exit. Returns whether they all did."""
+        try:
+            # Reap our direct child, this returns as soon as it exits
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False
+
+        # Other members of the group are not our children, so they cannot be waited on
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                os.killpg(pgid, 0)
+            except ProcessLookupError:
+                return True
+            time.sleep(0.005)
+        return False
+
+    def stop(self, timeout: float = 5):
         """Stop the Jekyll server and terminate the process with a timeout.
 
         Args:
-            timeout (int, optional): Time to wait for the server to gracefully shut down. Defaults to 5 seconds.
+            timeout (float, optional): Time to wait for the server to gracefully shut down. Defaults to 5 seconds.
         """
-        if self.process:
-            # Try to terminate the process group gracefully
-            os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-            self.process.terminate()
+        if self.site_id is not None:
+            self.static_server.remove_site(self.site_id)
+            self.site_id = None
+            self.url = None
+            if self.verbose:
+                print("Jekyll site no longer served.")
+            return
 
-            # Wait for the process to end, checking periodically
+        if self.process:
+            pgid = self.process.pid  # The server is the leader of its own process group
             try:
-                # Wait up to `timeout` seconds for process to terminate
-                for _ in range(timeout):
-                    if self.process.poll() is not None:  # Process has terminated
-                        break
-                    time.sleep(1)  # Wait a bit before checking again
-                else:
-                    # If the process is still alive after the timeout, kill it
-                    os.killpg(os.getpgid(self.process.pid), signal.SIGKILL)
-                    self.process.kill()
-                    self.process.wait()  # Wait for process to be killed
+                # Try to terminate the process group gracefully
+                os.killpg(pgid, signal.SIGTERM)
+                if not self._wait_for_process_group(pgid, timeout):
+                    # If the processes are still alive after the timeout, kill them
+                    os.killpg(pgid, signal.SIGKILL)
+                    self._wait_for_process_group(pgid, timeout)
                     if self.verbose:
                         print("Jekyll server forcefully stopped.")
+            except ProcessLookupError:
+                # The whole group already exited, just reap the child
+                self.process.wait()
             except Exception as e:
                 if self.verbose:
                     print(f"Error stopping the Jekyll server: {e}")
 
+            # The readers stop at the end of the streams, once the whole group exited
+            for thread in self._output_threads:
+                thread.join(timeout=1)
+            if not any(thread.is_alive() for thread in self._output_threads):
+                for stream in (self.process.stdout, self.process.stderr):
+                    if stream is not None:
+                        stream.close()
+            self._output_threads = []
             self.process = None
             if self.verbose:
                 print("Jekyll server stopped.")
         elif self.verbose:
             print("Jekyll server is not running.")
 
+        if self._leased_port:
+            self.port_pool.release(self.port)
+            self.port = None
+            self._leased_port = False
+
 
 def main(path: str, repo_name: str):
     from fetcher.search import clone_repo
@@ -184,7 +438,7 @@ def main(path: str, repo_name: str):
     clone_repo(clone_url, path, repo_name)
 
     # Start the Jekyll server
-    server = JekyllServer(f"{path}/{repo_name}", verbose=True)
+    server = JekyllServer(f"{path}/{repo_name}", verbose=True, port_pool=PortPool())
     server.start()
 
     # Stop the Jekyll server after delay_alive seconds
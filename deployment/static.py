@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import unquote, urlsplit
+
+PREFIX_MODE = "prefix"
+VHOST_MODE = "vhost"
+
+
+class _SiteRequestHandler(SimpleHTTPRequestHandler):
+    """Serve the files of the site matching the request path prefix or Host header."""
+
+    def __init__(self, *args, static_server: "StaticSiteServer", **kwargs):
+        self.static_server = static_server
+        super().__init__(*args, **kwargs)
+
+    def translate_path(self, path: str) -> str:
+        path = unquote(urlsplit(path).path)
+        if self.static_server.mode == VHOST_MODE:
+            host = self.headers.get("Host", "").split(":")[0]
+            site_id = host.split(".")[0]
+        else:
+            parts = path.lstrip("/").split("/", 1)
+            site_id = parts[0]
+            path = "/" + (parts[1] if len(parts) > 1 else "")
+
+        root = self.static_server.get_site_root(site_id)
+        if root is None:
+            # Nothing is served from here, so the request ends up as a 404
+            return os.path.join(os.devnull, "missing")
+
+        # Drop the segments that could escape the root of the site
+        segments = [s for s in path.split("/") if s not in ("", ".", "..")]
+        translated = os.path.join(root, *segments)
+        if path.endswith("/"):
+            translated += "/"
+        return translated
+
+    def end_headers(self):
+        self.send_header("Cache-Control", "no-store")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        if self.static_server.verbose:
+            super().log_message(format, *args)
+
+
+class StaticSiteServer:
+    """A multithreaded in-process HTTP server for built Jekyll sites.
+
+    Several sites share the same listener. They are told apart either by a path prefix
+    (`http://localhost:{port}/{site_id}/`, the site must be built with that baseurl)
+    or by a virtual host (`http://{site_id}.localhost:{port}/`).
+    """
+
+    def __init__(
+        self,
+        port: int,
+        mode: str = VHOST_MODE,
+        host: str = "127.0.0.1",
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            port: The port to listen on.
+            mode: How the sites are told apart, either "prefix" or "vhost".
+            host: The host to bind to.
+            verbose: Whether to print the requests.
+        """
+        if mode not in (PREFIX_MODE, VHOST_MODE):
+            raise ValueError(f"Unknown mode {mode}, should be prefix or vhost")
+        self.port: int = port
+        self.mode: str = mode
+        self.host: str = host
+        self.verbose: bool = verbose
+        self._sites: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StaticSiteServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start listening in a background thread."""
+        if self._httpd is not None:
+            return
+        handler = partial(_SiteRequestHandler, static_server=self)
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        if self.verbose:
+            print(f"Static server listening on port {self.port}.")
+
+    def stop(self):
+        """Stop listening."""
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = None
+        self._thread = None
+
+    def make_site_id(self, name: str) -> str:
+        """Make a unique id usable both as a path segment and as a host name label."""
+        base = re.sub(r"[^a-z0-9-]", "-", name.lower()).strip("-")[:50] or "site"
+        with self._lock:
+            site_id = base
+            i = 1
+            while site_id in self._sites:
+                site_id = f"{base}-{i}"
+                i += 1
+            # Reserve the id until the site is added
+            self._sites[site_id] = ""
+        return site_id
+
+    def get_base_url(self, site_id: str) -> str:
+        """Get the URL under which a site is served."""
+        if self.mode == VHOST_MODE:
+            return f"http://{site_id}.localhost:{self.port}"
+        return f"http://localhost:{self.port}/{site_id}"
+
+    def add_site(self, site_id: str, root: str) -> str:
+        """Serve the directory `root` under `site_id`. Returns the URL of the site."""
+        with self._lock:
+            self._sites[site_id] = os.path.abspath(root)
+        return self.get_base_url(site_id)
+
+    def remove_site(self, site_id: str):
+        with self._lock:
+            self._sites.pop(site_id, None)
+
+    def get_site_root(self, site_id: str) -> Optional[str]:
+        with self._lock:
+            return self._sites.get(site_id) or None
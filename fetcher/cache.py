@@ -0,0 +1,167 @@
+import datetime
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+# The range of creation dates of a query built by fetcher.search.build_search_query
+CREATED_RANGE = re.compile(r"created:(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})")
+
+
+class CachedResponse:
+    """A response of the search API stored in the cache"""
+
+    def __init__(self, key: str, etag: Optional[str], body: bytes, fetched_at: float):
+        self.key: str = key
+        self.etag: Optional[str] = etag
+        self.body: bytes = body  # Uncompressed JSON
+        self.fetched_at: float = fetched_at
+
+    def json(self) -> Dict[str, Any]:
+        return json.loads(self.body)
+
+
+class SearchCache:
+    """A persistent cache of the responses of the search API, stored in SQLite.
+
+    Responses are keyed by their normalized parameters and stored compressed.
+    They are revalidated with their ETag, except for queries whose creation dates
+    are entirely in the past: their results are not expected to change, so they
+    are served without any request. The least recently used entries are evicted
+    once the compressed bodies take more than `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_bytes: int = 200 * 1024 * 1024,
+        freeze_after_days: int = 2,
+    ):
+        """
+        Args:
+            db_path: The path to the SQLite database, created if it does not exist.
+            max_bytes: The maximum size of the compressed bodies.
+            freeze_after_days: Queries created before this many days ago are never revalidated.
+        """
+        self.db_path: str = db_path
+        self.max_bytes: int = max_bytes
+        self.freeze_after_days: int = freeze_after_days
+        self.num_hits: int = 0  # Served without any request
+        self.num_revalidated: int = 0  # Served after a 304
+        self.num_misses: int = 0
+        self.num_evictions: int = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """Normalize the parameters of a search request into a key.
+
+        The terms of the query are sorted, as their order does not change the results.
+        """
+        normalized = {
+            "q": " ".join(sorted(str(params["q"]).split())),
+            "per_page": int(params.get("per_page", 30)),
+            "page": int(params.get("page", 1)),
+            "sort": params.get("sort"),
+            "order": params.get("order"),
+        }
+        return json.dumps(normalized, sort_keys=True)
+
+    def is_frozen(self, query: str) -> bool:
+        """Check if all the repositories of a query were created long enough ago."""
+        match = CREATED_RANGE.search(query)
+        if match is None:
+            return False
+        created_before = datetime.datetime.strptime(match.group(2), "%Y-%m-%d").date()
+        freeze_date = datetime.date.today() - datetime.timedelta(
+            days=self.freeze_after_days
+        )
+        return created_before < freeze_date
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Get a response, marking it as recently used."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT etag, body, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+        etag, body, fetched_at = row
+        return CachedResponse(key, etag, zlib.decompress(body), fetched_at)
+
+    def put(self, key: str, etag: Optional[str], body: bytes):
+        """Store a response, evicting the least recently used ones if the cache is full."""
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, etag, body, size, fetched_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, compressed, len(compressed), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.num_evictions += 1
+
+    def record(self, outcome: str):
+        """Count how a request was served: "hit", "revalidated" or "miss"."""
+        with self._lock:
+            if outcome == "hit":
+                self.num_hits += 1
+            elif outcome == "revalidated":
+                self.num_revalidated += 1
+            else:
+                self.num_misses += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            num_entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {
+                "hits": self.num_hits,
+                "revalidated": self.num_revalidated,
+                "misses": self.num_misses,
+                "evictions": self.num_evictions,
+                "entries": num_entries,
+                "bytes": size,
+            }
@@ -0,0 +1,276 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import SearchCache
+from .utils import GITHUB_API_URL, get_headers
+
+
+class RateLimit:
+    """Track the rate-limit budget of the GitHub API from the response headers."""
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None  # Epoch time when the budget is refilled
+        self.retry_at: float = 0.0  # Epoch time before which no request should be sent
+        self._lock = threading.Lock()
+
+    def update(self, response: requests.Response):
+        """Update the budget from a response."""
+        headers = response.headers
+        with self._lock:
+            if "X-RateLimit-Limit" in headers:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                self.reset_at = float(headers["X-RateLimit-Reset"])
+            if "Retry-After" in headers:
+                retry_after = headers["Retry-After"]
+                if retry_after.isdigit():
+                    self.retry_at = max(self.retry_at, time.time() + int(retry_after))
+
+    def is_rate_limited(self, response: requests.Response) -> bool:
+        """Check if a response was rejected because of the rate limit."""
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and (
+            "Retry-After" in response.headers
+            or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    def wait_time(self) -> float:
+        """Get the time to wait before sending the next request, in seconds."""
+        now = time.time()
+        with self._lock:
+            wait = self.retry_at - now
+            if self.remaining == 0 and self.reset_at is not None:
+                # Add a second as the reset time is rounded down
+                wait = max(wait, self.reset_at - now + 1)
+        return max(0.0, wait)
+
+    def consume(self):
+        """Count a request that is about to be sent."""
+        with self._lock:
+            if self.remaining is not None and self.remaining > 0:
+                self.remaining -= 1
+
+
+class GitHubSearchClient:
+    """A client for the GitHub search API, aware of the rate limit.
+
+    Requests go through a single keep-alive session and the client only sleeps when
+    the budget advertised by the API is exhausted, for as long as it takes to refill.
+    Other endpoints (e.g. the git trees API of fetcher.tree) can share the session with
+    `get`; GitHub counts their budget ("core") apart from the one of the search.
+    With a cache, pages already seen are revalidated with their ETag (a 304 costs no
+    download) and pages of windows entirely in the past are not requested at all.
+    """
+
+    def __init__(
+        self,
+        api_url: str = GITHUB_API_URL,
+        timeout: float = 30,
+        max_retries: int = 3,
+        pool_size: int = 4,
+        cache: Optional[SearchCache] = None,
+        verbose: bool = False,
+        on_search: Optional[Callable[[str, float], None]] = None,
+    ):
+        """
+        Args:
+            api_url: The base URL of the API, to use a local stand-in.
+            timeout: The timeout of each request in seconds.
+            max_retries: The number of times a rate-limited request is retried.
+            pool_size: The number of keep-alive connections.
+            cache: The cache of the responses. None sends every request.
+            verbose: Whether to print the queries and the waits.
+            on_search: Called after every search with its outcome ("hit", "revalidated",
+                "fetched" or "error") and its duration in seconds, waits included.
+        """
+        self.api_url: str = api_url
+        self.timeout: float = timeout
+        self.max_retries: int = max_retries
+        self.verbose: bool = verbose
+        self.rate_limits: Dict[str, RateLimit] = {
+            "search": RateLimit(),
+            "core": RateLimit(),
+        }
+        self.rate_limit: RateLimit = self.rate_limits["search"]
+        self.cache: Optional[SearchCache] = cache
+        self.num_requests: int = 0
+        self.on_search = on_search
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _wait_for_budget(self, rate_limit: RateLimit):
+        wait = rate_limit.wait_time()
+        if wait > 0:
+            if self.verbose:
+                print(f"Rate limit reached, waiting {wait:.1f} seconds")
+            time.sleep(wait)
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        resource: str = "search",
+    ) -> requests.Response:
+        """Send a GET request to the API, retrying it while it is rejected by the rate limit
+
+        Args:
+            url (str): The URL to request
+            params (Dict[str, Any], optional): The query parameters. Defaults to None.
+            headers (Dict[str, str], optional): The headers. Defaults to the ones of get_headers.
+            resource (str, optional): The rate-limit budget the endpoint counts against,
+                "search" or "core". Defaults to "search".
+
+        Returns:
+            requests.Response: The last response, which may still be rate-limited after max_retries
+
+        Raises:
+            Exception: If the request cannot be sent
+        """
+        rate_limit = self.rate_limits[resource]
+        for _ in range(self.max_retries + 1):
+            self._wait_for_budget(rate_limit)
+            rate_limit.consume()
+            try:
+                response = self.session.get(
+                    url,
+                    params=params,
+                    headers=headers if headers is not None else get_headers(),
+                    timeout=self.timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                raise Exception(f"Failed to retrieve data: {e}")
+            with self._lock:
+                self.num_requests += 1
+            rate_limit.update(response)
+
+            if not rate_limit.is_rate_limited(response):
+                break
+            if rate_limit.wait_time() == 0:
+                # The API did not say how long to wait
+                rate_limit.retry_at = time.time() + 60
+        return response
+
+    def search(self, query: str, per_page: int = 100, page: int = 1) -> Dict[str, Any]:
+        """Search for repositories
+
+        Args:
+            query (str): The search query (see fetcher.search.build_search_query)
+            per_page (int, optional): The number of results per page. Defaults to 100.
+            page (int, optional): The page number. Defaults to 1.
+
+        Returns:
+            Dict[str, Any]: The response of the API, with the total_count and the items
+
+        Raises:
+            Exception: If the request fails. The status code is part of the message.
+        """
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            outcome, result = self._search(query, per_page, page)
+            return result
+        finally:
+            if self.on_search is not None:
+                self.on_search(outcome, time.perf_counter() - start)
+
+    def _search(
+        self, query: str, per_page: int, page: int
+    ) -> Tuple[str, Dict[str, Any]]:
+        params = {
+            "q": query,
+            "per_page": per_page,
+            "page": page,
+            "sort": "updated",
+            "order": "desc",
+        }
+        url = f"{self.api_url}/search/repositories"
+        headers = get_headers()
+        cached = None
+        if self.cache is not None:
+            key = self.cache.make_key(params)
+            cached = self.cache.get(key)
+            if cached is not None and self.cache.is_frozen(query):
+                self.cache.record("hit")
+                return "hit", cached.json()
+            if cached is not None and cached.etag is not None:
+                headers["If-None-Match"] = cached.etag
+        if self.verbose:
+            print(
+                f"Searching for repositories with the following query: {query} (page {page})"
+            )
+
+        response = self.get(url, params=params, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self.cache.record("revalidated")
+            return "revalidated", cached.json()
+        if response.status_code == 200:
+            if self.cache is not None:
+                self.cache.record("miss")
+                self.cache.put(key, response.headers.get("ETag"), response.content)
+            return "fetched", response.json()
+        raise Exception(f"Failed to retrieve data: {response.status_code}")
+
+
+class Prefetcher:
+    """Run an iterator in a background thread, keeping up to `buffer_size` items ahead.
+
+    This way the search for the next pages happens while the current results are processed.
+    Exceptions raised by the iterator are raised again by the consumer.
+    """
+
+    _END = object()
+
+    def __init__(self, iterator: Iterator[Any], buffer_size: int = 100):
+        self.iterator: Iterator[Any] = iterator
+        self.buffer: queue.Queue = queue.Queue(maxsize=max(1, buffer_size))
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        while not self._stop_event.is_set():
+            try:
+                self.buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for item in self.iterator:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(self._END)
+
+    def close(self):
+        """Stop fetching ahead."""
+        self._stop_event.set()
+
+    def __iter__(self) -> "Prefetcher":
+        return self
+
+    def __next__(self) -> Any:
+        item = self.buffer.get()
+        if item is self._END:
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
@@ -0,0 +1,216 @@
+import os
+import signal
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+
+class CloneOptions:
+    """A class to store the parameters for cloning repositories"""
+
+    """The number of commits to fetch. None fetches the whole history"""
+    depth: Optional[int] = 1
+
+    """Blobs larger than this are not fetched (git --filter=blob:limit=...), e.g. "512k". None fetches all blobs"""
+    blob_size_limit: Optional[str] = None
+
+    """Only check out the files matching these patterns (sparse checkout). None checks out everything"""
+    sparse_paths: Optional[List[str]] = None
+
+    """Whether to check out the files. Otherwise only the git objects are fetched, until checkout_repo is called"""
+    checkout: bool = True
+
+    """The maximum number of bytes the clone can take on disk. None means no limit"""
+    max_bytes: Optional[int] = 50 * 1024 * 1024
+
+    """The maximum time allowed for the whole clone in seconds"""
+    timeout: float = 30
+
+    """How often the size of the packs being received is checked, in seconds"""
+    poll_interval: float = 0.25
+
+
+class CloneStats:
+    """A class to store what a clone cost"""
+
+    def __init__(self):
+        self.bytes_transferred: int = 0  # Bytes of git objects received
+        self.bytes_on_disk: int = 0  # Bytes on disk, including the working tree
+        self.duration: float = 0.0  # Time the clone took in seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bytes_transferred": self.bytes_transferred,
+            "bytes_on_disk": self.bytes_on_disk,
+            "duration": round(self.duration, 3),
+        }
+
+
+def get_dir_size(path: str) -> int:
+    """Get the number of bytes taken by the files in a directory (recursively)"""
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                # The file was removed while walking (e.g. a temporary pack)
+                pass
+    return size
+
+
+def get_pack_size(repo_path: str) -> int:
+    """Get the number of bytes of the packs of a repository, including the ones being received
+
+    Only one directory is listed, so this is cheap enough to poll while git runs.
+    """
+    size = 0
+    try:
+        with os.scandir(os.path.join(repo_path, ".git", "objects", "pack")) as entries:
+            for entry in entries:
+                try:
+                    size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    # The file was renamed or removed (e.g. a temporary pack)
+                    pass
+    except OSError:
+        # The repository is not created yet
+        pass
+    return size
+
+
+def _check_budget(stats: CloneStats, options: CloneOptions):
+    """Raise if the repository takes more bytes on disk than the budget, once git is done with it"""
+    if options.max_bytes is not None and stats.bytes_on_disk > options.max_bytes:
+        raise Exception(
+            f"Budget exceeded: the clone is larger than {options.max_bytes} bytes"
+        )
+
+
+def _run_with_budget(
+    command: List[str], repo_path: str, options: CloneOptions, deadline: float
+):
+    """Run a git command, killing it if the clone goes over its byte budget or deadline
+
+    While git runs, only the packs it receives are measured. The whole repository, with its
+    working tree, is measured once all the commands are done (see _check_budget).
+
+    Raises:
+        Exception: If the command fails, times out or goes over budget
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+            start_new_session=True,
+        )
+        error: Optional[str] = None
+        while process.poll() is None:
+            if time.monotonic() > deadline:
+                error = f"Timeout expired: cloning took longer than {options.timeout} seconds"
+            elif (
+                options.max_bytes is not None
+                and get_pack_size(repo_path) > options.max_bytes
+            ):
+                error = f"Budget exceeded: the clone is larger than {options.max_bytes} bytes"
+            if error is not None:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+                raise Exception(error)
+            try:
+                # Returns as soon as the command is done
+                process.wait(timeout=options.poll_interval)
+            except subprocess.TimeoutExpired:
+                pass
+
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", errors="replace").strip()
+            raise Exception(
+                f"Error during cloning: {' '.join(command[:2])} exited with {process.returncode}: {message}"
+            )
+
+
+def clone_with_options(
+    repo_url: str, repo_path: str, options: CloneOptions = CloneOptions()
+) -> CloneStats:
+    """Clone a repository, fetching as little as possible
+
+    Args:
+        repo_url (str): The URL of the repository. Local bare repositories should use a file:// URL
+        repo_path (str): The path to clone the repository to
+        options (CloneOptions, optional): The options to use for cloning. Defaults to CloneOptions().
+
+    Returns:
+        CloneStats: What the clone cost
+
+    Raises:
+        Exception: If the clone fails, times out or goes over its byte budget
+    """
+    stats = CloneStats()
+    start = time.monotonic()
+    deadline = start + options.timeout
+
+    command = ["git", "clone", "--quiet", "--no-tags", "--single-branch"]
+    if options.depth is not None:
+        command += ["--depth", str(options.depth)]
+    if options.blob_size_limit is not None:
+        command += [f"--filter=blob:limit={options.blob_size_limit}"]
+    if options.sparse_paths is not None or not options.checkout:
+        # The files are checked out later (sparse-checkout or checkout_repo), so unwanted blobs are never fetched
+        command += ["--no-checkout"]
+    command += [repo_url, repo_path]
+    _run_with_budget(command, repo_path, options, deadline)
+
+    if options.sparse_paths is not None:
+        _run_with_budget(
+            ["git", "-C", repo_path, "sparse-checkout", "set", "--no-cone"]
+            + options.sparse_paths,
+            repo_path,
+            options,
+            deadline,
+        )
+    if options.sparse_paths is not None and options.checkout:
+        _run_with_budget(
+            ["git", "-C", repo_path, "checkout", "--quiet"],
+            repo_path,
+            options,
+            deadline,
+        )
+
+    stats.duration = time.monotonic() - start
+    stats.bytes_transferred = get_dir_size(os.path.join(repo_path, ".git", "objects"))
+    stats.bytes_on_disk = get_dir_size(repo_path)
+    _check_budget(stats, options)
+    return stats
+
+
+def checkout_repo(repo_path: str, options: CloneOptions = CloneOptions()) -> CloneStats:
+    """Check out the files of a repository cloned with `options.checkout` set to False
+
+    Args:
+        repo_path (str): The path to the repository
+        options (CloneOptions, optional): The options the repository was cloned with, for the budget. Defaults to CloneOptions().
+
+    Returns:
+        CloneStats: The bytes on disk after the checkout (including the git objects fetched
+            for it in a partial clone) and the duration of the checkout
+
+    Raises:
+        Exception: If the checkout fails, times out or goes over the byte budget
+    """
+    stats = CloneStats()
+    start = time.monotonic()
+    _run_with_budget(
+        ["git", "-C", repo_path, "checkout", "--quiet"],
+        repo_path,
+        options,
+        start + options.timeout,
+    )
+    stats.duration = time.monotonic() - start
+    stats.bytes_transferred = get_dir_size(os.path.join(repo_path, ".git", "objects"))
+    stats.bytes_on_disk = get_dir_size(repo_path)
+    _check_budget(stats, options)
+    return stats
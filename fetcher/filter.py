@@ -1,10 +1,14 @@
+from .git_objects import BlobReader, TreeEntry, list_tree, resolve_symlinks
 from .utils import (
+    LARGE_NUM_LINES,
+    count_num_lines_in_chunks,
+    count_num_lines_in_file,
     count_num_lines_in_files,
     filter_files_by_extension,
     list_files_in_dir,
 )
-from typing import Dict, Tuple
-
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 CODE_EXTENSIONS = ["js", "html", "md", "py", "rb", "php", "java", "c", "cpp"]
 STYLE_EXTENSIONS = ["css"]
@@ -31,18 +35,17 @@ EXCLUDE_SPECIAL_FILES = [
 ]
 
 
-def analyze_repo(repo_path: str) -> Dict[str, Dict[str, int]]:
-    """Analyze a repository
-    Return the number of lines and files in the repository and the number of lines in each file type.
+def analyze_file_list(files: List[str]) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """Analyze the list of files of a repository, without reading them
+    Return the number of files of each type and whether the repository only contains a README.
 
     Args:
-        repo_path (str): The path to the repository
+        files (List[str]): The paths of the files, relative to the root of the repository
 
     Returns:
-        Dict[str, Any]: The analysis of the repository
+        Dict[str, Any]: The analysis of the file list
+        Dict[str, List[str]]: The files grouped by extension
     """
-    # Get the list of files in the repository
-    files = list_files_in_dir(repo_path)
     files = [
         file for file in files if file.lower() not in EXCLUDE_SPECIAL_FILES
     ]  # Exclude special files
@@ -72,6 +75,25 @@ def analyze_repo(repo_path: str) -> Dict[str, Dict[str, int]]:
             "style": len(filtered_files["css"]),
             "asset": sum(len(filtered_files[ext]) for ext in ASSET_EXTENSIONS),
         },
+    }, filtered_files
+
+
+def analyze_repo(repo_path: str) -> Dict[str, Dict[str, int]]:
+    """Analyze a repository
+    Return the number of lines and files in the repository and the number of lines in each file type.
+
+    Args:
+        repo_path (str): The path to the repository
+
+    Returns:
+        Dict[str, Any]: The analysis of the repository
+    """
+    # Get the list of files in the repository
+    files = list_files_in_dir(repo_path)
+    analysis, filtered_files = analyze_file_list(files)
+
+    return {
+        **analysis,
         "num_lines": {
             "code": sum(
                 count_num_lines_in_files(repo_path, filtered_files[ext])
@@ -123,11 +145,260 @@ def filter_repo(
     # Check if the repository passes the filter
     passes_filter = (
         analysis["num_lines"]["code"] > params.min_lines
-        and (not analysis["only_contains_readme"] or not params.has_more_than_readme)
-        and analysis["num_files"]["code"] <= params.max_num_files_code
-        and analysis["num_files"]["asset"] <= params.max_num_assets
+        and passes_file_list_filter(analysis, params)
         and analysis["num_lines"]["code"] <= params.max_num_lines_code
         and analysis["num_lines"]["style"] <= params.max_num_lines_style
     )
 
     return passes_filter, analysis
+
+
+def _filter_file_list_streaming(
+    files: Iterable[str],
+    count_lines: Callable[[str, int], int],
+    params: RepoFilterParams,
+) -> Tuple[bool, Dict[str, Any]]:
+    """Apply the rules of filter_repo to a list of files, stopping as soon as a rule fails
+
+    Args:
+        files (Iterable[str]): The paths of the files, relative to the root of the repository
+        count_lines (Callable[[str, int], int]): Counts the lines of a file, stopping once it has more than the given number
+        params (RepoFilterParams): The parameters to use for filtering
+
+    Returns:
+        bool: Whether the repository passes the filter
+        Dict[str, Any]: The analysis of the repository (see filter_repo_streaming)
+    """
+    num_files = {"total": 0, "code": 0, "style": 0, "asset": 0}
+    num_lines = {"code": 0, "style": 0}
+    analysis: Dict[str, Any] = {
+        "only_contains_readme": False,
+        "num_files": num_files,
+        "num_lines": num_lines,
+    }
+
+    def reject(rule: str) -> Tuple[bool, Dict[str, Any]]:
+        analysis["rejected"] = rule
+        return False, analysis
+
+    # Count the files by type
+    code_extensions = set(CODE_EXTENSIONS)
+    style_extensions = set(STYLE_EXTENSIONS)
+    asset_extensions = set(ASSET_EXTENSIONS)
+    code_files: List[str] = []
+    style_files: List[str] = []
+    for file in files:
+        if file.startswith(".") or file.lower() in EXCLUDE_SPECIAL_FILES:
+            continue
+        num_files["total"] += 1
+        ext = os.path.splitext(file)[-1][1:].lower()
+        if ext in code_extensions:
+            code_files.append(file)
+            num_files["code"] += 1
+            if num_files["code"] > params.max_num_files_code:
+                return reject("max_num_files_code")
+        elif ext in style_extensions:
+            style_files.append(file)
+            num_files["style"] += 1
+        elif ext in asset_extensions:
+            num_files["asset"] += 1
+            if num_files["asset"] > params.max_num_assets:
+                return reject("max_num_assets")
+
+    analysis["only_contains_readme"] = (
+        len(code_files) == 1 and code_files[0].lower() == "readme.md"
+    )
+    if analysis["only_contains_readme"] and params.has_more_than_readme:
+        return reject("has_more_than_readme")
+
+    # Count the lines, stopping as soon as there are too many
+    for key, files, max_lines in [
+        ("code", code_files, params.max_num_lines_code),
+        ("style", style_files, params.max_num_lines_style),
+    ]:
+        for file in files:
+            try:
+                num_lines[key] += count_lines(file, max_lines - num_lines[key])
+            except Exception:
+                # Like count_num_lines_in_files, a file that cannot be read rejects the repository
+                num_lines[key] += LARGE_NUM_LINES
+            if num_lines[key] > max_lines:
+                return reject(f"max_num_lines_{key}")
+        if key == "code" and num_lines["code"] <= params.min_lines:
+            return reject("min_lines")
+
+    return True, analysis
+
+
+def list_repo_files(repo_path: str) -> Iterator[str]:
+    """Yield the files of a repository like list_files_in_dir, without the hidden directories at its root"""
+    for root, dirs, files in os.walk(repo_path):
+        relative_root = os.path.relpath(root, start=repo_path)
+        if relative_root == ".":
+            # The files in these directories are ignored by the filter
+            dirs[:] = [dir for dir in dirs if not dir.startswith(".")]
+            relative_root = ""
+        for file in files:
+            yield os.path.join(relative_root, file)
+
+
+def filter_repo_streaming(
+    repo_path: str, params: RepoFilterParams = RepoFilterParams()
+) -> Tuple[bool, Dict[str, Any]]:
+    """Filter a repository like filter_repo, but stop as soon as a rule fails
+    The hidden directories at the root of the repository (such as .git) are not walked, since their files are ignored.
+    The rules on the number of files are checked during the walk, before any file is read.
+    The lines are then counted without reading the files as lists of lines, until a maximum is exceeded.
+
+    Args:
+        repo_path (str): The path to the repository
+        params (RepoFilterParams, optional): The parameters to use for filtering. Defaults to RepoFilterParams().
+
+    Returns:
+        bool: Whether the repository passes the filter (always the same as filter_repo)
+        Dict[str, Any]: The analysis of the repository, the same as filter_repo if it passes.
+            If it fails, the counts stop where the failure was found and "rejected" is the rule that failed.
+    """
+    return _filter_file_list_streaming(
+        list_repo_files(repo_path),
+        lambda file, max_lines: count_num_lines_in_file(
+            os.path.join(repo_path, file), max_lines=max_lines
+        ),
+        params,
+    )
+
+
+def filter_repo_objects(
+    repo_path: str,
+    params: RepoFilterParams = RepoFilterParams(),
+    revision: str = "HEAD",
+) -> Tuple[bool, Dict[str, Any]]:
+    """Filter a repository from its git objects, before it is checked out
+    The files and their sizes are listed with git ls-tree, and the lines are counted in the blobs read with git cat-file.
+    Symbolic links are resolved within the repository, as they would be once checked out.
+
+    Args:
+        repo_path (str): The path to the repository, cloned with --no-checkout
+        params (RepoFilterParams, optional): The parameters to use for filtering. Defaults to RepoFilterParams().
+        revision (str, optional): The revision that would be checked out. Defaults to "HEAD".
+
+    Returns:
+        bool: Whether the repository passes the filter (the same as filter_repo after checking out the revision)
+        Dict[str, Any]: The analysis of the repository (see filter_repo_streaming)
+
+    Raises:
+        Exception: If the files cannot be listed
+    """
+    entries = list_tree(repo_path, revision)
+    blobs: Dict[str, Optional[TreeEntry]] = {
+        entry.path: entry
+        for entry in entries
+        if entry.type == "blob" and not entry.is_symlink
+    }
+    with BlobReader(repo_path) as reader:
+        symlinks = [entry for entry in entries if entry.is_symlink]
+        if symlinks:
+            targets = {
+                entry.path: b"".join(reader.read(entry.oid)).decode(
+                    "utf-8", errors="surrogateescape"
+                )
+                for entry in symlinks
+            }
+            blobs.update(resolve_symlinks(entries, targets))
+
+        def count_lines(file: str, max_lines: int) -> int:
+            blob = blobs[file]
+            if blob is None:
+                raise Exception(f"{file} is a broken symbolic link")
+            if blob.size == 0:
+                return 0
+            chunks = reader.read(blob.oid)
+            try:
+                return count_num_lines_in_chunks(chunks, max_lines=max_lines)
+            finally:
+                chunks.close()
+
+        return _filter_file_list_streaming(list(blobs), count_lines, params)
+
+
+def analyze_repo_streaming(repo_path: str) -> Dict[str, Dict[str, int]]:
+    """Analyze a repository like analyze_repo, without walking the hidden directories at its root or reading the files as lists of lines
+
+    Args:
+        repo_path (str): The path to the repository
+
+    Returns:
+        Dict[str, Any]: The analysis of the repository, the same as analyze_repo
+    """
+    analysis, filtered_files = analyze_file_list(list(list_repo_files(repo_path)))
+
+    def count_lines(files: List[str]) -> int:
+        num_lines = 0
+        for file in files:
+            try:
+                num_lines += count_num_lines_in_file(os.path.join(repo_path, file))
+            except Exception:
+                num_lines += LARGE_NUM_LINES
+        return num_lines
+
+    return {
+        **analysis,
+        "num_lines": {
+            "code": sum(count_lines(filtered_files[ext]) for ext in CODE_EXTENSIONS),
+            "style": count_lines(filtered_files["css"]),
+        },
+    }
+
+
+def get_failed_rules(
+    analysis: Dict[str, Any], params: RepoFilterParams = RepoFilterParams()
+) -> List[str]:
+    """List the rules of filter_repo that a repository fails
+
+    Args:
+        analysis (Dict[str, Any]): The analysis returned by analyze_repo
+        params (RepoFilterParams, optional): The parameters to use for filtering. Defaults to RepoFilterParams().
+
+    Returns:
+        List[str]: The names of the rules that fail (the parameters they depend on). Empty if the repository passes the filter
+    """
+    failed_rules = []
+    if analysis["num_lines"]["code"] <= params.min_lines:
+        failed_rules.append("min_lines")
+    if analysis["only_contains_readme"] and params.has_more_than_readme:
+        failed_rules.append("has_more_than_readme")
+    if analysis["num_files"]["code"] > params.max_num_files_code:
+        failed_rules.append("max_num_files_code")
+    if analysis["num_files"]["asset"] > params.max_num_assets:
+        failed_rules.append("max_num_assets")
+    if analysis["num_lines"]["code"] > params.max_num_lines_code:
+        failed_rules.append("max_num_lines_code")
+    if analysis["num_lines"]["style"] > params.max_num_lines_style:
+        failed_rules.append("max_num_lines_style")
+    return failed_rules
+
+
+def passes_file_list_filter(
+    analysis: Dict[str, Any],
+    params: RepoFilterParams = RepoFilterParams(),
+    check_readme: bool = True,
+) -> bool:
+    """Check the rules of the filter that only depend on the list of files
+
+    Args:
+        analysis (Dict[str, Any]): The analysis returned by analyze_file_list or analyze_repo
+        params (RepoFilterParams, optional): The parameters to use for filtering. Defaults to RepoFilterParams().
+        check_readme (bool, optional): Whether to check the README-only rule, which needs the complete file list. Defaults to True.
+
+    Returns:
+        bool: Whether the repository passes these rules
+    """
+    return (
+        (
+            not check_readme
+            or not analysis["only_contains_readme"]
+            or not params.has_more_than_readme
+        )
+        and analysis["num_files"]["code"] <= params.max_num_files_code
+        and analysis["num_files"]["asset"] <= params.max_num_assets
+    )
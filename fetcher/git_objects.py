@@ -0,0 +1,195 @@
+import posixpath
+import subprocess
+from typing import Dict, Iterator, List, Optional
+
+# The chunks blobs are read in
+BLOB_CHUNK_SIZE = 64 * 1024
+
+# The number of symbolic links followed before a path is considered broken
+MAX_SYMLINK_HOPS = 8
+
+
+class TreeEntry:
+    """A file of a git tree, as listed by `git ls-tree -r -l`"""
+
+    def __init__(self, mode: str, type: str, oid: str, size: Optional[int], path: str):
+        self.mode: str = mode
+        self.type: str = type  # "blob", or "commit" for submodules
+        self.oid: str = oid
+        self.size: Optional[int] = size  # None for submodules
+        self.path: str = path
+
+    @property
+    def is_symlink(self) -> bool:
+        return self.mode == "120000"
+
+
+def list_tree(
+    repo_path: str, revision: str = "HEAD", timeout: float = 30
+) -> List[TreeEntry]:
+    """List the files of a revision of a repository, with their sizes, without checking it out
+
+    Args:
+        repo_path (str): The path to the repository (bare or cloned with --no-checkout)
+        revision (str, optional): The revision to list. Defaults to "HEAD".
+        timeout (float, optional): The maximum time allowed in seconds. Defaults to 30.
+
+    Returns:
+        List[TreeEntry]: The files of the revision
+
+    Raises:
+        Exception: If the listing fails
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_path, "ls-tree", "-r", "-l", "-z", revision],
+            timeout=timeout,
+            check=True,
+            capture_output=True,
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception(
+            f"Timeout expired: listing {repo_path} took longer than {timeout} seconds"
+        )
+    except subprocess.CalledProcessError as e:
+        raise Exception(
+            f"Error while listing {repo_path}: {e.stderr.decode('utf-8', errors='replace').strip()}"
+        )
+
+    entries: List[TreeEntry] = []
+    for line in result.stdout.split(b"\0"):
+        if not line:
+            continue
+        # "<mode> SP <type> SP <oid> SP+ <size> TAB <path>"
+        info, path = line.split(b"\t", 1)
+        mode, type, oid, size = info.decode("ascii").split()
+        entries.append(
+            TreeEntry(
+                mode,
+                type,
+                oid,
+                None if size == "-" else int(size),
+                path.decode("utf-8", errors="surrogateescape"),
+            )
+        )
+    return entries
+
+
+def resolve_symlinks(
+    entries: List[TreeEntry], targets: Dict[str, str]
+) -> Dict[str, Optional[TreeEntry]]:
+    """Find what the symbolic links of a tree point to, as a checkout would
+
+    Args:
+        entries (List[TreeEntry]): The files of the tree
+        targets (Dict[str, str]): The target of each symbolic link, keyed by its path
+
+    Returns:
+        Dict[str, Optional[TreeEntry]]: For each symbolic link, the regular file it points to,
+            or None if it is broken or points outside of the repository.
+            The links that point to a directory are left out, since they are not files.
+    """
+    files: Dict[str, TreeEntry] = {entry.path: entry for entry in entries}
+    directories = {
+        posixpath.dirname(entry.path)
+        for entry in entries
+        if posixpath.dirname(entry.path)
+    }
+    for directory in list(directories):
+        while directory:
+            directories.add(directory)
+            directory = posixpath.dirname(directory)
+
+    resolved: Dict[str, Optional[TreeEntry]] = {}
+    for path in targets:
+        current: Optional[str] = path
+        target: Optional[TreeEntry] = None
+        is_directory = False
+        for _ in range(MAX_SYMLINK_HOPS):
+            link = targets.get(current)
+            if link is None:
+                break
+            current = posixpath.normpath(
+                posixpath.join(posixpath.dirname(current), link)
+            )
+            if posixpath.isabs(link) or current.startswith(".."):
+                current = None
+                break
+            # A directory is not a file, and neither is a submodule (an empty directory)
+            if (
+                current in directories
+                or current == "."
+                or (current in files and files[current].type != "blob")
+            ):
+                is_directory = True
+                break
+            if current not in files:
+                current = None
+                break
+        if is_directory:
+            continue
+        if current is not None and current not in targets:
+            target = files[current]
+        resolved[path] = target
+    return resolved
+
+
+class BlobReader:
+    """Read blobs of a repository through a single `git cat-file --batch` process"""
+
+    def __init__(self, repo_path: str):
+        self.repo_path: str = repo_path
+        self._process = subprocess.Popen(
+            ["git", "-C", repo_path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def read(self, oid: str) -> Iterator[bytes]:
+        """Yield the content of a blob in chunks
+
+        The whole blob is always read from git, even if the iteration stops early,
+        so that the next blob can be read.
+
+        Raises:
+            Exception: If the object does not exist
+        """
+        self._process.stdin.write(oid.encode("ascii") + b"\n")
+        self._process.stdin.flush()
+        header = self._process.stdout.readline().split()
+        if len(header) != 3:
+            raise Exception(
+                f"Could not read {oid} in {self.repo_path}: {b' '.join(header).decode()}"
+            )
+        remaining = int(header[2])
+        try:
+            while remaining > 0:
+                chunk = self._process.stdout.read(min(remaining, BLOB_CHUNK_SIZE))
+                if not chunk:
+                    raise Exception(f"git cat-file stopped while reading {oid}")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            while remaining > 0:
+                chunk = self._process.stdout.read(min(remaining, BLOB_CHUNK_SIZE))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+            self._process.stdout.read(1)  # The line break after the content
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.stdin.close()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        self._process.stdout.close()
+
+    def __enter__(self) -> "BlobReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
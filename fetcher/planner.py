@@ -0,0 +1,293 @@
+import datetime
+import math
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .client import GitHubSearchClient
+from .search import build_search_query
+
+# Github won't return more than 1000 results for a query
+GITHUB_MAX_RESULTS = 1000
+
+# The most common languages of GitHub pages repositories, used to split partitions
+# that are still too large when they cover a single day and a single KB of size
+DEFAULT_SPLIT_LANGUAGES = [
+    "HTML",
+    "CSS",
+    "JavaScript",
+    "SCSS",
+    "Ruby",
+    "TypeScript",
+    "Python",
+    "Shell",
+]
+
+
+class SearchPartition:
+    """A part of the search space: a range of creation days, a range of sizes and a language.
+
+    Both ranges are inclusive, so partitions built by `split` do not overlap.
+    """
+
+    def __init__(
+        self,
+        created_after: datetime.datetime,
+        created_before: datetime.datetime,
+        min_size_kb: int = 0,
+        max_size_kb: int = 1000,
+        language: Optional[str] = None,
+        exclude_languages: Optional[List[str]] = None,
+    ):
+        self.created_after: datetime.datetime = created_after
+        self.created_before: datetime.datetime = created_before
+        self.min_size_kb: int = min_size_kb
+        self.max_size_kb: int = max_size_kb
+        self.language: Optional[str] = language
+        self.exclude_languages: Optional[List[str]] = exclude_languages
+
+    def __repr__(self) -> str:
+        return f"SearchPartition({self.query()})"
+
+    @property
+    def num_days(self) -> int:
+        return (self.created_before.date() - self.created_after.date()).days + 1
+
+    def query(self) -> str:
+        return build_search_query(
+            self.created_after,
+            self.created_before,
+            language=self.language,
+            max_size_kb=self.max_size_kb,
+            min_size_kb=self.min_size_kb,
+            exclude_languages=self.exclude_languages,
+        )
+
+    def _copy(self, **kwargs) -> "SearchPartition":
+        attributes = {
+            "created_after": self.created_after,
+            "created_before": self.created_before,
+            "min_size_kb": self.min_size_kb,
+            "max_size_kb": self.max_size_kb,
+            "language": self.language,
+            "exclude_languages": self.exclude_languages,
+        }
+        attributes.update(kwargs)
+        return SearchPartition(**attributes)
+
+    def split(self, num_parts: int, languages: List[str]) -> List["SearchPartition"]:
+        """Split the partition into (at most) `num_parts` disjoint partitions covering it.
+
+        Days are split first, then sizes, then languages (each listed language plus one
+        partition for all the others). The parts are ordered from oldest to newest.
+        Returns an empty list if the partition cannot be split any further.
+        """
+        if self.num_days > 1:
+            num_parts = min(num_parts, self.num_days)
+            bounds = [self.num_days * i // num_parts for i in range(num_parts + 1)]
+            start = self.created_after
+            return [
+                self._copy(
+                    created_after=start + datetime.timedelta(days=bounds[i]),
+                    created_before=start + datetime.timedelta(days=bounds[i + 1] - 1),
+                )
+                for i in range(num_parts)
+            ]
+
+        num_sizes = self.max_size_kb - self.min_size_kb + 1
+        if num_sizes > 1:
+            num_parts = min(num_parts, num_sizes)
+            bounds = [num_sizes * i // num_parts for i in range(num_parts + 1)]
+            return [
+                self._copy(
+                    min_size_kb=self.min_size_kb + bounds[i],
+                    max_size_kb=self.min_size_kb + bounds[i + 1] - 1,
+                )
+                for i in range(num_parts)
+            ]
+
+        if self.language is None and self.exclude_languages is None and languages:
+            return [self._copy(language=language) for language in languages] + [
+                self._copy(exclude_languages=languages)
+            ]
+        return []
+
+    def merge(self, other: "SearchPartition") -> Optional["SearchPartition"]:
+        """Merge with the partition right after this one, if they are adjacent."""
+        same_language = (
+            self.language == other.language
+            and self.exclude_languages == other.exclude_languages
+        )
+        if not same_language:
+            return None
+        same_sizes = (
+            self.min_size_kb == other.min_size_kb
+            and self.max_size_kb == other.max_size_kb
+        )
+        next_day = self.created_before + datetime.timedelta(days=1)
+        if same_sizes and next_day.date() == other.created_after.date():
+            return self._copy(created_before=other.created_before)
+        same_days = (
+            self.created_after.date() == other.created_after.date()
+            and self.created_before.date() == other.created_before.date()
+        )
+        if same_days and self.max_size_kb + 1 == other.min_size_kb:
+            return self._copy(max_size_kb=other.max_size_kb)
+        return None
+
+
+class PartitionPlanner:
+    """Partition the search space so that every query stays under the 1000-result cap.
+
+    Partitions are counted with the `total_count` of the search API and split where
+    needed, in as many parts as the count suggests. Adjacent parts that fit together
+    under the cap are merged back. The first page of each count request is kept, so
+    partitions that do not need splitting cost no extra request for it.
+
+    When the search times out, the API sets `incomplete_results` and its `total_count`
+    may be too low. Such counts are requested again, up to `max_count_retries` times.
+    """
+
+    def __init__(
+        self,
+        client: GitHubSearchClient,
+        per_page: int = 100,
+        max_results: int = GITHUB_MAX_RESULTS,
+        languages: List[str] = DEFAULT_SPLIT_LANGUAGES,
+        fill_ratio: float = 0.8,
+        max_count_retries: int = 1,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            client: The client to search with.
+            per_page: The number of results per page.
+            max_results: The maximum number of results the API returns for a query.
+            languages: The languages to split by when days and sizes cannot be split anymore.
+            fill_ratio: The target number of results of a split part, relative to max_results.
+            max_count_retries: The number of times a count with incomplete results is requested again.
+            verbose: Whether to print the plan.
+        """
+        self.client: GitHubSearchClient = client
+        self.per_page: int = per_page
+        self.max_results: int = max_results
+        self.languages: List[str] = languages
+        self.fill_ratio: float = fill_ratio
+        self.max_count_retries: int = max_count_retries
+        self.verbose: bool = verbose
+        self.num_api_calls: int = 0
+        self.total_count: Optional[int] = None
+        self.num_reachable: int = 0
+        self.num_truncated: int = 0
+        self.num_incomplete: int = 0
+        self._first_pages: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, partition: SearchPartition) -> int:
+        """Get the number of results of a partition, keeping its first page."""
+        return self._count(partition)[0]
+
+    def _count(self, partition: SearchPartition) -> Tuple[int, bool]:
+        """Get the number of results of a partition and whether the API counted them all"""
+        for _ in range(self.max_count_retries + 1):
+            response = self.client.search(partition.query(), per_page=self.per_page)
+            with self._lock:
+                self.num_api_calls += 1
+                self._first_pages[partition.query()] = response["items"]
+            if not response.get("incomplete_results", False):
+                return response["total_count"], True
+        with self._lock:
+            self.num_incomplete += 1
+        if self.verbose:
+            print(f"The count of {partition} is incomplete")
+        return response["total_count"], False
+
+    def _merge_adjacent(
+        self, counted: List[Tuple[SearchPartition, int]]
+    ) -> List[Tuple[SearchPartition, int]]:
+        merged: List[Tuple[SearchPartition, int]] = []
+        for partition, count in counted:
+            if merged:
+                previous, previous_count = merged[-1]
+                union = previous.merge(partition)
+                if union is not None and previous_count + count <= self.max_results:
+                    # The first pages of the parts are not the first page of their union
+                    self._first_pages.pop(previous.query(), None)
+                    self._first_pages.pop(partition.query(), None)
+                    merged[-1] = (union, previous_count + count)
+                    continue
+            merged.append((partition, count))
+        return merged
+
+    def iter_partitions(
+        self, root: SearchPartition
+    ) -> Iterator[Tuple[SearchPartition, int]]:
+        """Yield partitions covering `root`, each with its number of results, newest first."""
+        root_count = self.count(root)
+        self.total_count = root_count
+        stack: List[Tuple[SearchPartition, int]] = [(root, root_count)]
+        while stack:
+            partition, count = stack.pop()
+            if count <= self.max_results:
+                self.num_reachable += count
+                yield partition, count
+                continue
+
+            self._first_pages.pop(partition.query(), None)
+            num_parts = math.ceil(count / (self.max_results * self.fill_ratio))
+            parts = partition.split(max(2, num_parts), self.languages)
+            if not parts:
+                # Only the first results of this partition can be reached
+                self.num_reachable += self.max_results
+                self.num_truncated += 1
+                if self.verbose:
+                    print(f"Cannot split {partition} ({count} results) any further")
+                yield partition, count
+                continue
+
+            counted: List[Tuple[SearchPartition, int]] = []
+            for i, part in enumerate(parts):
+                part_count, complete = self._count(part)
+                if not complete and i == len(parts) - 1:
+                    # The parts cover the partition without overlapping, so the count
+                    # of the last one is at least what the others leave of the total
+                    part_count = max(part_count, count - sum(c for _, c in counted))
+                counted.append((part, part_count))
+            stack.extend(self._merge_adjacent(counted))
+
+    def iter_repos(self, root: SearchPartition) -> Iterator[Dict[str, Any]]:
+        """Yield all the repositories reachable in `root`, newest partitions first."""
+        for partition, count in self.iter_partitions(root):
+            if self.verbose:
+                print(f"Searching {partition} ({count} results)")
+            num_pages = math.ceil(min(count, self.max_results) / self.per_page)
+            for page in range(1, num_pages + 1):
+                items = (
+                    self._first_pages.pop(partition.query(), None)
+                    if page == 1
+                    else None
+                )
+                if items is None:
+                    items = self.client.search(
+                        partition.query(), per_page=self.per_page, page=page
+                    )["items"]
+                    with self._lock:
+                        self.num_api_calls += 1
+                yield from items
+                if len(items) < self.per_page:
+                    break
+
+    def coverage(self) -> float:
+        """Estimate the percentage of the results of the root that can be reached."""
+        if not self.total_count:
+            return 100.0
+        return 100.0 * min(self.num_reachable, self.total_count) / self.total_count
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "api_calls": self.num_api_calls,
+            "total_count": self.total_count,
+            "reachable": self.num_reachable,
+            "truncated_partitions": self.num_truncated,
+            "incomplete_counts": self.num_incomplete,
+            "coverage": round(self.coverage(), 2),
+        }
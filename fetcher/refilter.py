@@ -0,0 +1,299 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .filter import (
+    RepoFilterParams,
+    analyze_repo_streaming,
+    get_failed_rules,
+    list_repo_files,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    repo TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+ANALYSIS_COLUMNS = [
+    "only_contains_readme",
+    "num_files_total",
+    "num_files_code",
+    "num_files_style",
+    "num_files_asset",
+    "num_lines_code",
+    "num_lines_style",
+]
+
+
+def fingerprint_repo(repo_path: str) -> str:
+    """Fingerprint the files of a repository that the filter looks at, from their sizes and modification times"""
+    fingerprint = hashlib.sha1()
+    for file in sorted(list_repo_files(repo_path)):
+        try:
+            stat = os.stat(os.path.join(repo_path, file))
+            fingerprint.update(
+                f"{file}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode(
+                    "utf-8", errors="surrogateescape"
+                )
+            )
+        except OSError:
+            fingerprint.update(
+                f"{file}\0missing\n".encode("utf-8", errors="surrogateescape")
+            )
+    return fingerprint.hexdigest()
+
+
+class AnalysisCache:
+    """Cache the analyses of repositories in SQLite, along with the fingerprint of their files"""
+
+    def __init__(self, db_path: str):
+        self.db_path: str = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def load(self) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """Load the fingerprint and the analysis of every repository, keyed by repository"""
+        return {
+            repo: (fingerprint, json.loads(analysis))
+            for repo, fingerprint, analysis in self._conn.execute(
+                "SELECT repo, fingerprint, analysis FROM analyses"
+            )
+        }
+
+    def put_many(self, rows: List[Tuple[str, str, Dict[str, Any]]]):
+        """Save (repository, fingerprint, analysis) rows"""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO analyses (repo, fingerprint, analysis, updated_at) VALUES (?, ?, ?, ?)",
+                [
+                    (repo, fingerprint, json.dumps(analysis), now)
+                    for repo, fingerprint, analysis in rows
+                ],
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+def find_repos(data_dir: str) -> List[str]:
+    """List the repositories saved by crawls, in data_dir/repos and data_dir/<language>/repos
+
+    Returns:
+        List[str]: The paths of the repositories, relative to data_dir
+    """
+    patterns = [
+        os.path.join(data_dir, "repos", "*"),
+        os.path.join(data_dir, "*", "repos", "*"),
+    ]
+    return sorted(
+        os.path.relpath(path, data_dir)
+        for pattern in patterns
+        for path in glob.glob(pattern)
+        if os.path.isdir(path)
+    )
+
+
+def load_params(path: str) -> Dict[str, RepoFilterParams]:
+    """Load sets of filter parameters from a JSON file
+
+    The file holds a list of objects, each with a "name" and the parameters that differ from RepoFilterParams, e.g.
+    [{"name": "default"}, {"name": "longer", "max_num_lines_code": 2000}]
+
+    Raises:
+        ValueError: If a set has no name or an unknown parameter
+    """
+    with open(path, "r") as f:
+        sets = json.load(f)
+    params_sets: Dict[str, RepoFilterParams] = {}
+    for values in sets:
+        values = dict(values)
+        name = values.pop("name", None)
+        if not name:
+            raise ValueError(f"Every set of parameters needs a name: {values}")
+        params = RepoFilterParams()
+        for key, value in values.items():
+            if not hasattr(RepoFilterParams, key):
+                raise ValueError(f"Unknown filter parameter {key} in {name}")
+            setattr(params, key, value)
+        params_sets[name] = params
+    return params_sets
+
+
+def _analyze(
+    task: Tuple[str, str, Optional[str]],
+) -> Tuple[str, Optional[str], Optional[Dict[str, Any]], Optional[str]]:
+    """Analyze a repository unless its fingerprint is the cached one (run in the worker processes)
+
+    Returns:
+        The repository, its fingerprint, its analysis (None if the cached one is still valid) and the error if any
+    """
+    data_dir, repo, cached_fingerprint = task
+    repo_path = os.path.join(data_dir, repo)
+    try:
+        fingerprint = fingerprint_repo(repo_path)
+        if fingerprint == cached_fingerprint:
+            return repo, fingerprint, None, None
+        return repo, fingerprint, analyze_repo_streaming(repo_path), None
+    except Exception as e:
+        return repo, None, None, str(e)
+
+
+def refilter(
+    data_dir: str,
+    params_sets: Dict[str, RepoFilterParams],
+    output_path: str,
+    cache_path: Optional[str] = None,
+    num_workers: Optional[int] = None,
+    verbose: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """Run the filter over the repositories already saved, with several sets of parameters at once
+
+    Each repository is analyzed once (or not at all if its cached analysis is still valid), then checked
+    against every set of parameters. One row per repository is streamed to a CSV file, with its analysis
+    and whether it passes each set.
+
+    Args:
+        data_dir (str): The directory the crawls saved the repositories to (--save_path)
+        params_sets (Dict[str, RepoFilterParams]): The sets of parameters to evaluate, by name
+        output_path (str): The path of the CSV file
+        cache_path (str, optional): The path of the cache of the analyses. Defaults to None (no cache).
+        num_workers (int, optional): The number of processes analyzing the repositories. Defaults to the number of CPUs.
+        verbose (bool, optional): Whether to print the progress. Defaults to False.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: For each set of parameters, the number of repositories that pass and that fail each rule
+    """
+    repos = find_repos(data_dir)
+    cache = AnalysisCache(cache_path) if cache_path else None
+    cached = cache.load() if cache is not None else {}
+
+    summary: Dict[str, Dict[str, Any]] = {
+        name: {"passed": 0, "failed_rules": {}} for name in params_sets
+    }
+    num_analyzed, num_cached, num_errors = 0, 0, 0
+    to_cache: List[Tuple[str, str, Dict[str, Any]]] = []
+    tasks = [(data_dir, repo, cached.get(repo, (None, None))[0]) for repo in repos]
+    pool = multiprocessing.Pool(num_workers)
+    with pool, open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["repo"] + ANALYSIS_COLUMNS + [f"passes_{name}" for name in params_sets]
+        )
+        for repo, fingerprint, analysis, error in pool.imap_unordered(
+            _analyze, tasks, chunksize=8
+        ):
+            if error is not None:
+                num_errors += 1
+                if verbose:
+                    print(f"Failed to analyze {repo}: {error}")
+                continue
+            if analysis is None:
+                num_cached += 1
+                analysis = cached[repo][1]
+            else:
+                num_analyzed += 1
+                to_cache.append((repo, fingerprint, analysis))
+
+            passes: List[int] = []
+            for name, params in params_sets.items():
+                failed_rules = get_failed_rules(analysis, params)
+                passes.append(int(not failed_rules))
+                summary[name]["passed"] += int(not failed_rules)
+                for rule in failed_rules:
+                    summary[name]["failed_rules"][rule] = (
+                        summary[name]["failed_rules"].get(rule, 0) + 1
+                    )
+            writer.writerow(
+                [
+                    repo,
+                    int(analysis["only_contains_readme"]),
+                    analysis["num_files"]["total"],
+                    analysis["num_files"]["code"],
+                    analysis["num_files"]["style"],
+                    analysis["num_files"]["asset"],
+                    analysis["num_lines"]["code"],
+                    analysis["num_lines"]["style"],
+                ]
+                + passes
+            )
+
+            if cache is not None and len(to_cache) >= 256:
+                cache.put_many(to_cache)
+                to_cache = []
+            if verbose and (num_analyzed + num_cached) % 1000 == 0:
+                print(f"{num_analyzed + num_cached}/{len(repos)} repositories")
+
+    if cache is not None:
+        cache.put_many(to_cache)
+        cache.close()
+    if verbose:
+        print(
+            f"{len(repos)} repositories: {num_analyzed} analyzed, {num_cached} from the cache, {num_errors} errors"
+        )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate sets of filter parameters on the repositories already saved"
+    )
+    parser.add_argument(
+        "data_dir",
+        type=str,
+        nargs="?",
+        default="data",
+        help="The directory the repositories were saved to",
+    )
+    parser.add_argument(
+        "--params",
+        type=str,
+        default=None,
+        help='A JSON file with the sets of parameters, e.g. [{"name": "longer", "max_num_lines_code": 2000}]. Defaults to the default parameters',
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="refilter.csv",
+        help="The CSV file to write the results to",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="refilter_cache.sqlite",
+        help="The cache of the analyses, in data_dir. Pass an empty string to disable it",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="The number of processes. Defaults to the number of CPUs",
+    )
+    args = parser.parse_args()
+
+    params_sets = {"default": RepoFilterParams()}
+    if args.params is not None:
+        params_sets = load_params(args.params)
+    summary = refilter(
+        args.data_dir,
+        params_sets,
+        args.output,
+        cache_path=os.path.join(args.data_dir, args.cache) if args.cache else None,
+        num_workers=args.num_workers,
+        verbose=True,
+    )
+    print(json.dumps(summary, indent=4))
@@ -1,10 +1,52 @@
-import requests
 from typing import Optional, Any, Dict, List
 from datetime import datetime
 import os
-import subprocess
+import copy
 
-from .utils import get_headers
+from .client import GitHubSearchClient
+from .clone import CloneOptions, CloneStats, clone_with_options
+
+
+def build_search_query(
+    created_after: datetime,
+    created_before: Optional[datetime] = None,
+    language: Optional[str] = None,
+    max_size_kb: int = 1000,
+    min_size_kb: int = 0,
+    exclude_languages: Optional[List[str]] = None,
+) -> str:
+    """Build the search query for GitHub pages repositories
+
+    Args:
+        created_after (datetime): The date to search from
+        created_before (Optional[datetime], optional): The date to search to. Defaults to None.
+        language (Optional[str], optional): The language to search for. Defaults to None.
+        max_size_kb (int, optional): The maximum size of the repository in KB. Defaults to 1000.
+        min_size_kb (int, optional): The minimum size of the repository in KB. Defaults to 0.
+        exclude_languages (Optional[List[str]], optional): Languages to exclude. Defaults to None.
+
+    Returns:
+        str: The search query (the q parameter of the search API)
+    """
+    query_parameters = {
+        "size": (
+            f"<={max_size_kb}" if min_size_kb <= 0 else f"{min_size_kb}..{max_size_kb}"
+        ),
+        "created": (
+            f">={created_after.strftime('%Y-%m-%d')}"
+            if created_before is None
+            else f"{created_after.strftime('%Y-%m-%d')}..{created_before.strftime('%Y-%m-%d')}"
+        ),
+    }
+    if language:
+        query_parameters["language"] = language
+    search_query = "github.io in:name "
+    search_query += " ".join(
+        [f"{key}:{value}" for key, value in query_parameters.items()]
+    )
+    for excluded_language in exclude_languages or []:
+        search_query += f" -language:{excluded_language}"
+    return search_query
 
 
 def search_github_repos(
@@ -15,6 +57,7 @@ def search_github_repos(
     limits: int = 100,
     page: int = 1,
     verbose: bool = False,
+    client: Optional[GitHubSearchClient] = None,
 ) -> List[Dict[str, Any]]:
     """Search for GitHub pages repositories
 
@@ -25,6 +68,7 @@ def search_github_repos(
         limits (int, optional): The maximum number of repositories to retrieve. Defaults to 100.
         page (int, optional): The page number. Defaults to 1.
         verbose (bool, optional): Whether to print the search query. Defaults to False.
+        client (GitHubSearchClient, optional): The client to search with, e.g. one with a cache. Defaults to a new client.
 
     Returns:
         List[Dict[str, Any]]: A list of repositories that match the search criteria
@@ -32,59 +76,48 @@ def search_github_repos(
     Raises:
         Exception: If the request fails
     """
-    query_parameters = {
-        "size": f"<={max_size_kb}",
-        "created": (
-            f">={created_after.strftime('%Y-%m-%d')}"
-            if created_before is None
-            else f"{created_after.strftime('%Y-%m-%d')}..{created_before.strftime('%Y-%m-%d')}"
-        ),
-    }
-    if language:
-        query_parameters["language"] = language
-    search_query = "github.io in:name "
-    search_query += " ".join(
-        [f"{key}:{value}" for key, value in query_parameters.items()]
+    search_query = build_search_query(
+        created_after, created_before, language=language, max_size_kb=max_size_kb
     )
-    url = f"https://api.github.com/search/repositories?q={search_query}&per_page={limits}&page={page}&sort=updated&order=desc"
-    if verbose:
-        print("Searching for repositories with the following query:", url)
-    try:
-        response = requests.get(url, headers=get_headers(), timeout=30)
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Failed to retrieve data: {e}")
-    if response.status_code == 200:
-        return response.json()["items"]
-    else:
-        raise Exception(f"Failed to retrieve data: {response.status_code}")
+    if client is None:
+        client = GitHubSearchClient(verbose=verbose)
+    return client.search(search_query, per_page=limits, page=page)["items"]
 
 
-def clone_repo(repo_url: str, download_path: str, repo_name: str, timeout: int = 5):
-    """Clone a repository from GitHub with a timeout
+def clone_repo(
+    repo_url: str,
+    download_path: str,
+    repo_name: str,
+    timeout: Optional[float] = None,
+    options: CloneOptions = CloneOptions(),
+) -> CloneStats:
+    """Clone a repository from GitHub with a timeout and a byte budget
 
     Args:
         repo_url (str): The URL of the repository
         download_path (str): The path to download the repository to
         repo_name (str): The name of the repository
-        timeout (int): The maximum time allowed for the cloning process in seconds
+        timeout (float, optional): The maximum time allowed for the cloning process in seconds. Defaults to options.timeout.
+        options (CloneOptions, optional): The options to use for cloning (depth, filters, budget). Defaults to CloneOptions().
+
+    Returns:
+        CloneStats: The bytes transferred and the duration of the clone
+
     Raises:
-        TimeoutExpired: If the cloning process takes longer than `timeout` seconds
+        Exception: If the cloning process fails, takes longer than `timeout` seconds or goes over budget
     """
+    if timeout is not None:
+        options = copy.copy(options)
+        options.timeout = timeout
+
+    # Ensure the download path exists
+    os.makedirs(download_path, exist_ok=True)
     try:
-        # Ensure the download path exists
-        os.makedirs(download_path, exist_ok=True)
-        # Execute the git clone command with a timeout
-        subprocess.run(
-            ["git", "clone", repo_url, os.path.join(download_path, repo_name)],
-            timeout=timeout,
-            check=True,
-        )
-    except subprocess.TimeoutExpired:
-        raise Exception(
-            f"Timeout expired: Cloning of {repo_name} took longer than {timeout} seconds"
+        return clone_with_options(
+            repo_url, os.path.join(download_path, repo_name), options
         )
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"Error during cloning: {e}")
+    except Exception as e:
+        raise Exception(f"Failed to clone {repo_name}: {e}")
 
 
 if __name__ == "__main__":
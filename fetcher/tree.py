@@ -0,0 +1,180 @@
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .client import GitHubSearchClient
+from .filter import RepoFilterParams, analyze_file_list, passes_file_list_filter
+from .utils import GITHUB_API_URL
+
+
+def fetch_tree_from_api(
+    full_name: str, branch: str, client: GitHubSearchClient
+) -> Tuple[List[str], bool]:
+    """List the files of a repository with the git trees API, without cloning it
+
+    Args:
+        full_name (str): The full name of the repository ("owner/name")
+        branch (str): The branch to list
+        client (GitHubSearchClient): The client to send the request with, which waits
+            for the "core" rate-limit budget
+
+    Returns:
+        List[str]: The paths of the files in the repository
+        bool: Whether the list is complete (the API truncates very large trees)
+
+    Raises:
+        Exception: If the request fails
+    """
+    url = f"{client.api_url}/repos/{full_name}/git/trees/{branch}"
+    response = client.get(url, params={"recursive": 1}, resource="core")
+    if response.status_code != 200:
+        raise Exception(f"Failed to retrieve the tree: {response.status_code}")
+
+    data = response.json()
+    files = [entry["path"] for entry in data["tree"] if entry["type"] == "blob"]
+    return files, not data.get("truncated", False)
+
+
+def fetch_tree_from_git(repo_url: str, timeout: float = 30) -> Tuple[List[str], bool]:
+    """List the files of a repository with a blobless clone, without fetching any file
+
+    Args:
+        repo_url (str): The URL of the repository
+        timeout (float, optional): The maximum time allowed in seconds. Defaults to 30.
+
+    Returns:
+        List[str]: The paths of the files in the repository
+        bool: Whether the list is complete (always True)
+
+    Raises:
+        Exception: If the clone or the listing fails
+    """
+    tmp_path = tempfile.mkdtemp(prefix="tree_")
+    try:
+        subprocess.run(
+            [
+                "git",
+                "clone",
+                "--quiet",
+                "--bare",
+                "--depth",
+                "1",
+                "--filter=blob:none",
+                repo_url,
+                tmp_path,
+            ],
+            timeout=timeout,
+            check=True,
+            capture_output=True,
+        )
+        result = subprocess.run(
+            ["git", "-C", tmp_path, "ls-tree", "-r", "--name-only", "-z", "HEAD"],
+            timeout=timeout,
+            check=True,
+            capture_output=True,
+        )
+    except subprocess.TimeoutExpired:
+        raise Exception(
+            f"Timeout expired: listing {repo_url} took longer than {timeout} seconds"
+        )
+    except subprocess.CalledProcessError as e:
+        raise Exception(
+            f"Error while listing {repo_url}: {e.stderr.decode('utf-8', errors='replace').strip()}"
+        )
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    files = [
+        path
+        for path in result.stdout.decode("utf-8", errors="replace").split("\0")
+        if path
+    ]
+    return files, True
+
+
+class TreePrefilter:
+    """Reject repositories before cloning them, based on the list of their files.
+
+    Only the rules of `filter_repo` that depend on the file list are checked (README-only,
+    number of code files and number of assets). A repository is rejected only if it
+    certainly fails them, so that the result of `filter_repo` after cloning is unchanged.
+    If the listing fails, the repository is let through.
+    """
+
+    def __init__(
+        self,
+        source: str = "api",
+        params: RepoFilterParams = RepoFilterParams(),
+        client: Optional[GitHubSearchClient] = None,
+        api_url: str = GITHUB_API_URL,
+        timeout: float = 30,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            source: Where to get the file list from: "api" (git trees API) or "git" (blobless clone).
+            params: The parameters of the filter.
+            client: The client of the API, to share its session and rate-limit budget with
+                the search. None creates one.
+            api_url: The base URL of the API, to use a local stand-in when no client is given.
+            timeout: The maximum time allowed to list a repository in seconds.
+            verbose: Whether to print the progress.
+        """
+        if source not in ("api", "git"):
+            raise ValueError(f"Unknown source {source}, should be api or git")
+        self.source: str = source
+        self.params: RepoFilterParams = params
+        self.timeout: float = timeout
+        self.verbose: bool = verbose
+        self.client: GitHubSearchClient = client or GitHubSearchClient(
+            api_url=api_url, timeout=timeout, verbose=verbose
+        )
+        self.num_checked: int = 0
+        self.num_rejected: int = 0
+        self.num_errors: int = 0
+        self._lock = threading.Lock()
+
+    def list_files(self, repo: Dict[str, Any]) -> Tuple[List[str], bool]:
+        """List the files of a repository returned by the search API"""
+        if self.source == "api":
+            return fetch_tree_from_api(
+                repo["full_name"], repo.get("default_branch") or "HEAD", self.client
+            )
+        return fetch_tree_from_git(repo["clone_url"], timeout=self.timeout)
+
+    def check(self, repo: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+        """Check if a repository may pass `filter_repo`
+
+        Returns:
+            bool: False if the repository certainly fails the filter
+            Dict[str, Any]: The analysis of the file list (empty if the listing failed)
+        """
+        try:
+            files, complete = self.list_files(repo)
+        except Exception as e:
+            if self.verbose:
+                print(f"Could not list the files of {repo['full_name']}: {e}")
+            with self._lock:
+                self.num_checked += 1
+                self.num_errors += 1
+            return True, {}
+
+        # With an incomplete list, the counts are lower bounds: exceeding a maximum is
+        # still certain, but the README-only rule cannot be checked
+        analysis, _ = analyze_file_list(files)
+        may_pass = passes_file_list_filter(analysis, self.params, check_readme=complete)
+        with self._lock:
+            self.num_checked += 1
+            if not may_pass:
+                self.num_rejected += 1
+        return may_pass, analysis
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "checked": self.num_checked,
+                "clones_saved": self.num_rejected,
+                "errors": self.num_errors,
+            }
@@ -1,13 +1,18 @@
+import codecs
+import locale
 import os
 from dotenv import load_dotenv
-from typing import Dict, List
-
+from typing import Dict, Iterable, List, Optional
 
 # Load the .env file
 load_dotenv()
 
 LARGE_NUM_LINES = 1000000
 
+LINE_COUNT_CHUNK_SIZE = 64 * 1024
+
+GITHUB_API_URL = "https://api.github.com"
+
 
 def get_headers() -> Dict[str, str]:
     """Get the headers for the GitHub API
@@ -108,3 +113,63 @@ def count_num_lines_in_files(repo_path: str, files: List[str]) -> int:
             num_lines += LARGE_NUM_LINES
 
     return num_lines
+
+
+def count_num_lines_in_chunks(
+    chunks: Iterable[bytes], max_lines: Optional[int] = None
+) -> int:
+    """Count the number of lines in a file given as chunks of bytes, like len(f.readlines()) in text mode
+    Lines end with \\n, \\r\\n or \\r (universal newlines), and the lines are never built.
+    The chunks are still decoded with the default encoding, so that the same files fail as when they are read as text.
+
+    Args:
+        chunks (Iterable[bytes]): The content of the file
+        max_lines (Optional[int], optional): Stop as soon as the file has more lines than this. The number returned is then only known to be larger than max_lines. Defaults to None.
+
+    Returns:
+        int: The number of lines in the file
+
+    Raises:
+        UnicodeDecodeError: If the file cannot be decoded with the default encoding
+    """
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+    num_lines = 0
+    last_byte = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        decoder.decode(chunk)
+        num_lines += chunk.count(b"\n") + chunk.count(b"\r") - chunk.count(b"\r\n")
+        # A \r\n split between two chunks was counted as two line breaks
+        if last_byte == b"\r" and chunk[:1] == b"\n":
+            num_lines -= 1
+        last_byte = chunk[-1:]
+        if max_lines is not None and num_lines > max_lines:
+            return num_lines
+    decoder.decode(b"", final=True)
+
+    # The last line does not end with a line break
+    if last_byte not in (b"", b"\n", b"\r"):
+        num_lines += 1
+    return num_lines
+
+
+def count_num_lines_in_file(path: str, max_lines: Optional[int] = None) -> int:
+    """Count the number of lines in a file, like len(f.readlines()) in text mode, without reading the lines
+    The file is scanned as bytes, in chunks (see count_num_lines_in_chunks).
+
+    Args:
+        path (str): The path to the file
+        max_lines (Optional[int], optional): Stop as soon as the file has more lines than this. Defaults to None.
+
+    Returns:
+        int: The number of lines in the file
+
+    Raises:
+        OSError: If the file cannot be read
+        UnicodeDecodeError: If the file cannot be decoded with the default encoding
+    """
+    with open(path, "rb") as f:
+        return count_num_lines_in_chunks(
+            iter(lambda: f.read(LINE_COUNT_CHUNK_SIZE), b""), max_lines=max_lines
+        )
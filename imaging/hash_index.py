@@ -0,0 +1,111 @@
+import itertools
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import imagehash
+import numpy as np
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+
+    def popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+# Above this number of neighbors to probe, multi-index hashing is used instead
+MAX_NEIGHBORS_TO_PROBE = 1024
+
+
+def pack_hash(hash: imagehash.ImageHash) -> int:
+    """Pack the bits of an image hash into an integer (row-major, first bit highest)."""
+    value = 0
+    for byte in np.packbits(hash.hash.flatten()).tobytes():
+        value = (value << 8) | byte
+    # packbits pads the last byte with zeros
+    return value >> (-hash.hash.size % 8)
+
+
+def count_neighbors(num_bits: int, max_distance: int) -> int:
+    """The number of values within `max_distance` bits of a value."""
+    return sum(math.comb(num_bits, k) for k in range(max_distance + 1))
+
+
+class HammingIndex:
+    """An index of hashes of `num_bits` bits that finds a hash within `max_distance` bits.
+
+    Two strategies are used depending on how many values lie within `max_distance`:
+    - Few neighbors (small hashes or distances): every neighbor is looked up in a set.
+    - Otherwise, multi-index hashing: the bits are split into `max_distance + 1` chunks,
+      and a hash within `max_distance` bits necessarily matches one of the chunks exactly
+      (pigeonhole principle). Only the hashes sharing a chunk are compared.
+    Both find a match if and only if one exists, like a comparison with every hash would.
+    """
+
+    def __init__(self, num_bits: int, max_distance: int = 0):
+        """
+        Args:
+            num_bits: The number of bits of the hashes.
+            max_distance: The maximum Hamming distance for two hashes to match.
+        """
+        if max_distance < 0 or max_distance >= num_bits:
+            raise ValueError(
+                f"max_distance should be between 0 and {num_bits - 1}, got {max_distance}"
+            )
+        self.num_bits: int = num_bits
+        self.max_distance: int = max_distance
+        self.values: set = set()
+
+        self._masks: Optional[List[int]] = None
+        self._chunks: List[Tuple[int, int]] = []  # (shift, mask) of each chunk
+        self._tables: List[Dict[int, List[int]]] = []
+        if count_neighbors(num_bits, max_distance) <= MAX_NEIGHBORS_TO_PROBE:
+            self._masks = [
+                sum(1 << bit for bit in bits)
+                for k in range(1, max_distance + 1)
+                for bits in itertools.combinations(range(num_bits), k)
+            ]
+        else:
+            num_chunks = max_distance + 1
+            bounds = [num_bits * i // num_chunks for i in range(num_chunks + 1)]
+            self._chunks = [
+                (bounds[i], (1 << (bounds[i + 1] - bounds[i])) - 1)
+                for i in range(num_chunks)
+            ]
+            self._tables = [{} for _ in range(num_chunks)]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: int):
+        if value in self.values:
+            return
+        self.values.add(value)
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            table.setdefault((value >> shift) & mask, []).append(value)
+
+    def update(self, values: Iterable[int]):
+        for value in values:
+            self.add(value)
+
+    def find(self, value: int) -> Optional[Tuple[int, int]]:
+        """Find a hash within `max_distance` bits of `value`.
+
+        Returns:
+            The hash found and its distance to `value`, or None if there is none.
+            An exact match is always returned if there is one.
+        """
+        if value in self.values:
+            return value, 0
+        if self._masks is not None:
+            for mask in self._masks:
+                if value ^ mask in self.values:
+                    return value ^ mask, popcount(mask)
+            return None
+
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            for candidate in table.get((value >> shift) & mask, ()):
+                distance = popcount(value ^ candidate)
+                if distance <= self.max_distance:
+                    return candidate, distance
+        return None
@@ -0,0 +1,127 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Number of bits kept per channel in the color histogram (4 bits: 4096 bins for RGB)
+HISTOGRAM_BITS = 4
+
+
+class ImageStats:
+    """Statistics of the colors of an image, as percentages of its pixels"""
+
+    def __init__(self):
+        self.white_pixels_ratio: float = 0.0
+        self.most_frequent_color: Tuple[int, ...] = ()
+        self.most_frequent_color_ratio: float = 0.0
+        # Pixel counts of the quantized colors
+        self.histogram: Optional[np.ndarray] = None
+        # Number of pixels the stats were computed on
+        self.num_pixels: int = 0
+        # Bound on the error of the ratios, in percentage points (0 if exact)
+        self.max_error: float = 0.0
+
+
+def pack_pixels(image_np: np.ndarray) -> np.ndarray:
+    """Pack the channels of each pixel of a uint8 image into one uint32.
+
+    Returns:
+        np.ndarray: A 1D array with one value per pixel, the first channel in the highest bits
+    """
+    if image_np.dtype != np.uint8:
+        raise ValueError(f"Expected a uint8 image, got {image_np.dtype}")
+    if image_np.ndim == 2:
+        return image_np.reshape(-1).astype(np.uint32)
+    num_channels = image_np.shape[2]
+    if num_channels > 4:
+        raise ValueError(f"Expected at most 4 channels, got {num_channels}")
+    pixels = image_np.reshape(-1, num_channels)
+    packed = pixels[:, 0].astype(np.uint32)
+    for channel in range(1, num_channels):
+        packed <<= 8
+        packed |= pixels[:, channel]
+    return packed
+
+
+def unpack_pixel(value: int, num_channels: int) -> Tuple[int, ...]:
+    return tuple(
+        (int(value) >> (8 * (num_channels - 1 - channel))) & 0xFF
+        for channel in range(num_channels)
+    )
+
+
+def get_sample_size(max_error: float, failure_probability: float) -> int:
+    """The number of pixels to sample so that all the ratios are within `max_error`
+    percentage points of their exact value, except with probability `failure_probability`.
+
+    By the Dvoretzky-Kiefer-Wolfowitz inequality, the empirical distribution of the packed
+    colors is within eps of the exact one everywhere, so the frequency of any color (and
+    thus of the white and of the most frequent colors) is within 2 * eps.
+    """
+    eps = max_error / 100 / 2
+    return math.ceil(math.log(2 / failure_probability) / (2 * eps**2))
+
+
+def compute_image_stats(
+    image_np: np.ndarray,
+    approximate: bool = False,
+    max_error: float = 1.0,
+    failure_probability: float = 1e-6,
+    seed: int = 0,
+) -> ImageStats:
+    """Compute the white pixels ratio, the most frequent color and a color histogram.
+
+    The pixels are packed into uint32 values once, then counted by sorting them.
+    In exact mode, the ratios are the same as with ImageFilter.compute_percentage_of_white_pixels
+    and ImageFilter.compute_percentage_of_most_frequent_color.
+
+    Args:
+        image_np: The image, as a uint8 array of shape (height, width) or (height, width, channels).
+        approximate: Whether to compute the stats on a random sample of the pixels.
+        max_error: In approximate mode, the bound on the error of the ratios in percentage points.
+        failure_probability: In approximate mode, the probability that the bound does not hold.
+        seed: The seed of the sampling, so that the stats of an image are reproducible.
+
+    Returns:
+        ImageStats: The statistics of the image
+    """
+    packed = pack_pixels(image_np)
+    num_channels = 1 if image_np.ndim == 2 else image_np.shape[2]
+    stats = ImageStats()
+
+    if approximate:
+        sample_size = get_sample_size(max_error, failure_probability)
+        if sample_size < packed.size:
+            rng = np.random.default_rng(seed)
+            packed = packed[rng.integers(0, packed.size, sample_size)]
+            stats.max_error = max_error
+    stats.num_pixels = int(packed.size)
+
+    # A pixel is white if all its channels are 255
+    white_value = (1 << (8 * num_channels)) - 1
+    white_pixels = np.count_nonzero(packed == white_value)
+    stats.white_pixels_ratio = (white_pixels / packed.size) * 100
+
+    # Count the colors by sorting: each run of equal values is one color
+    sorted_pixels = np.sort(packed)
+    run_starts = np.flatnonzero(
+        np.concatenate(([True], sorted_pixels[1:] != sorted_pixels[:-1]))
+    )
+    run_lengths = np.diff(np.append(run_starts, sorted_pixels.size))
+    most_frequent = np.argmax(run_lengths)
+    stats.most_frequent_color = unpack_pixel(
+        sorted_pixels[run_starts[most_frequent]], num_channels
+    )
+    stats.most_frequent_color_ratio = (run_lengths[most_frequent] / packed.size) * 100
+
+    # Keep the highest bits of the first 3 channels (alpha is ignored)
+    num_color_channels = min(num_channels, 3)
+    quantized = np.zeros(packed.size, dtype=np.uint32)
+    for channel in range(num_color_channels):
+        shift = 8 * (num_channels - 1 - channel) + 8 - HISTOGRAM_BITS
+        quantized <<= HISTOGRAM_BITS
+        quantized |= (packed >> shift) & ((1 << HISTOGRAM_BITS) - 1)
+    stats.histogram = np.bincount(
+        quantized, minlength=1 << (HISTOGRAM_BITS * num_color_channels)
+    )
+    return stats
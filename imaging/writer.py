@@ -0,0 +1,102 @@
+import io
+import os
+import queue
+import threading
+from typing import Callable, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+ImageData = Union[bytes, np.ndarray, Image.Image]
+
+
+def encode_png(image: ImageData) -> bytes:
+    """Encode an image as PNG. Bytes are assumed to be encoded already."""
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def write_file_atomically(path: str, data: bytes):
+    """Write a file so that it is either complete or absent, even after a crash."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ImageWriter:
+    """Encode and write images in a background thread.
+
+    Only images that are kept need to go through it: the others never touch the disk.
+    """
+
+    _STOP = object()
+
+    def __init__(self, queue_size: int = 16, verbose: bool = False):
+        """
+        Args:
+            queue_size: The maximum number of images waiting to be written.
+            verbose: Whether to print the errors.
+        """
+        self.verbose: bool = verbose
+        self.num_written: int = 0
+        self.num_errors: int = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item: Optional[Tuple[str, ImageData, Optional[Callable[[], None]]]] = (
+                self._queue.get()
+            )
+            if item is self._STOP:
+                return
+            path, image, on_written = item
+            try:
+                write_file_atomically(path, encode_png(image))
+                self.num_written += 1
+            except Exception as e:
+                self.num_errors += 1
+                if self.verbose:
+                    print(f"Failed to write {path}: {e}")
+                continue
+            if on_written is not None:
+                try:
+                    on_written()
+                except Exception as e:
+                    if self.verbose:
+                        print(f"Failed to record the write of {path}: {e}")
+
+    def write(
+        self,
+        path: str,
+        image: ImageData,
+        on_written: Optional[Callable[[], None]] = None,
+    ):
+        """Queue an image to be written as PNG, waiting if the queue is full.
+
+        Args:
+            path: The path of the PNG file.
+            image: The image, encoded or not.
+            on_written: Called from the writer thread once the file is complete on disk.
+                It is not called if the write fails.
+        """
+        self._queue.put((path, image, on_written))
+
+    def close(self):
+        """Wait for the queued images to be written."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -4,22 +4,46 @@ import numpy as np
 import argparse
 import imagehash
 from PIL import Image
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, Iterable, Iterator, List, Callable, Union
+import io
 import json
 import time
+import threading
+import functools
 
+from deployment.build_worker import BuildWorkerPool
 from deployment.server import JekyllServer
-from fetcher.search import clone_repo, search_github_repos
-from fetcher.filter import filter_repo
-from renderer.driver import save_random_screenshot, ScreenshotOptions
-
-# Github won't allow more than 1000 results
-# So we have to break down the search into multiple queries
-GITHUB_MAX_RESULTS = 1000
+from deployment.bundle_cache import BundleCache
+from deployment.ports import PortPool
+from deployment.static import StaticSiteServer
+from fetcher.cache import SearchCache
+from fetcher.clone import CloneOptions, checkout_repo
+from fetcher.client import GitHubSearchClient, Prefetcher
+from fetcher.planner import GITHUB_MAX_RESULTS, PartitionPlanner, SearchPartition
+from fetcher.search import build_search_query, clone_repo
+from fetcher.tree import TreePrefilter
+from fetcher.filter import filter_repo_objects, filter_repo_streaming
+from imaging.hash_index import HammingIndex, pack_hash
+from imaging.stats import ImageStats, compute_image_stats
+from imaging.writer import ImageWriter, write_file_atomically
+from metrics import MetricsRegistry, MetricsServer, SnapshotWriter
+from renderer.driver import take_random_screenshot, ScreenshotOptions
+from renderer.pool import DriverPool
+from renderer.probe import ProbeOptions, ProbeResult, ProbeStats
+from pipeline import Pipeline, Stage
+from storage.checkpoint import CrawlCheckpoint
+from storage.hash_store import HashStore
+from storage.metadata import MetadataSink, flatten_metadata
+from storage.shards import IMAGE_FORMATS, ShardWriter
 
 
 class ImageFilter:
-    """A class to filter images based on their content."""
+    """A class to filter images based on their content.
+
+    An image is a duplicate if its hash is within a maximum Hamming distance of the hash
+    of an image seen before. Hashes of each size are kept in their own HammingIndex.
+    With a HashStore, images seen by other runs and processes sharing it are duplicates too.
+    """
 
     def __init__(
         self,
@@ -28,7 +52,13 @@ class ImageFilter:
         hash_size_other_imgs: int = 5,
         max_background_percentage: float = 95.0,
         max_white_percentage: float = 25.0,
+        max_hash_distance_white_imgs: int = 0,
+        max_hash_distance_other_imgs: int = 0,
+        approximate_stats: bool = False,
+        max_stats_error: float = 1.0,
         verbose: bool = False,
+        on_hash_added: Optional[Callable[[imagehash.ImageHash], None]] = None,
+        hash_store: Optional[HashStore] = None,
     ):
         """
         Args:
@@ -37,32 +67,62 @@ class ImageFilter:
             hash_size_other_imgs: The hash size to use for other images.
             max_background_percentage: The maximum percentage of white pixels for a page to be considered a landing page.
             max_white_percentage: The maximum percentage of white pixels for a page to be considered a landing page.
+            max_hash_distance_white_imgs: The maximum number of different bits for two hashes of white images to be duplicates.
+            max_hash_distance_other_imgs: The maximum number of different bits for two hashes of other images to be duplicates.
+            approximate_stats: Whether to compute the pixel ratios on a random sample of the pixels.
+            max_stats_error: The maximum error of the approximate pixel ratios, in percentage points.
             verbose: Whether to print the progress.
+            on_hash_added: Called with every new hash, e.g. to persist it without a hash store.
+            hash_store: A store of hashes shared across runs, checked and appended to. Its
+                hashes are loaded into the indexes right away.
         """
         self.hashfunc: imagehash.ImageHash = hashfunc
         self.hash_size_white_imgs: int = hash_size_white_imgs
         self.hash_size_other_imgs: int = hash_size_other_imgs
         self.max_background_percentage: float = max_background_percentage
         self.max_white_percentage: float = max_white_percentage
+        self.approximate_stats: bool = approximate_stats
+        self.max_stats_error: float = max_stats_error
         self.verbose: bool = verbose
-        self.hashes: set = set()
+        self.hash_indexes: Dict[int, HammingIndex] = {
+            hash_size_white_imgs: HammingIndex(
+                hash_size_white_imgs**2, max_hash_distance_white_imgs
+            ),
+            hash_size_other_imgs: HammingIndex(
+                hash_size_other_imgs**2, max_hash_distance_other_imgs
+            ),
+        }
+        self.on_hash_added = on_hash_added
+        self.hash_store: Optional[HashStore] = hash_store
+        self.num_synced_hashes: int = 0  # Records of the hash store in hash_indexes
+        self.lock = threading.Lock()
+        if self.hash_store is not None:
+            with self.lock:
+                self.sync_hash_store()
+            if self.verbose:
+                print(
+                    f"Loaded {self.num_synced_hashes} hashes from {self.hash_store.path}"
+                )
 
     def add_hash(
         self,
         image: Image,
         image_np: Optional[np.ndarray] = None,
         percentage: Optional[float] = None,
+        metadata: Optional[Dict[str, Any]] = None,
     ) -> Tuple[bool, str]:
         """Compute the hash of the image and add it to the set of hashes.
 
         Images with white background are hashed with a larger hash size to reduce the number of false positives.
+        The hash is not added if it is a near-duplicate of a hash of the same size.
 
         Args:
             image: The image to hash.
             image_np: The NumPy array of the image.
             percentage: The percentage of white pixels in the image.
+            metadata: Saved along with the hash in the hash store.
         Returns:
-            Whether the image was added to the set of hashes or already existed.
+            Whether the image was added to the set of hashes or a near-duplicate already existed.
             Hash of the image.
         """
         # Compute the hash
@@ -75,14 +135,85 @@ class ImageFilter:
         else:
             hash = self.hashfunc(image, hash_size=self.hash_size_other_imgs)
 
-        # Add the hash to the set
-        if hash in self.hashes:
-            return False, hash
-        self.hashes.add(hash)
+        # Add the hash to the index, unless it is a near-duplicate
+        index = self.hash_indexes[hash.hash.shape[0]]
+        value = pack_hash(hash)
+        with self.lock:
+            if self.hash_store is not None:
+                self.sync_hash_store()
+            match = index.find(value)
+            if match is not None:
+                if self.verbose and match[1] > 0:
+                    print(f"Hash {hash} is {match[1]} bits away from an existing hash.")
+                return False, hash
+            # Only the hashes appended by other processes since the sync are left to check
+            if self.hash_store is not None and not self.hash_store.add(
+                value,
+                hash.hash.size,
+                metadata,
+                max_distance=index.max_distance,
+                start=self.num_synced_hashes,
+            ):
+                if self.verbose:
+                    print(f"Hash {hash} is already in {self.hash_store.path}.")
+                return False, hash
+            index.add(value)
+        if self.on_hash_added is not None:
+            self.on_hash_added(hash)
         return True, hash
 
+    def sync_hash_store(self):
+        """Add the hashes appended to the hash store since the last sync to the indexes.
+
+        Should be called with the lock held.
+        """
+        records = self.hash_store.records_since(self.num_synced_hashes)
+        indexes = {index.num_bits: index for index in self.hash_indexes.values()}
+        for value, num_bits in zip(
+            records["value"].tolist(), records["num_bits"].tolist()
+        ):
+            if num_bits in indexes:
+                indexes[num_bits].add(value)
+        self.num_synced_hashes += len(records)
+
+    def restore_hashes(self, hashes: Iterable[imagehash.ImageHash]):
+        """Add hashes saved by a previous run, without checking them."""
+        with self.lock:
+            for hash in hashes:
+                self.hash_indexes[hash.hash.shape[0]].add(pack_hash(hash))
+
+    def is_background(self, results: Dict[str, Any]) -> bool:
+        """Check if the results of check_image show a page that is mostly background."""
+        return (
+            results["white_pixels_ratio"] > self.max_background_percentage
+            or results["most_frequent_color_ratio"] > self.max_background_percentage
+        )
+
+    def compute_stats(self, image_np: np.ndarray) -> ImageStats:
+        """Compute the white pixels ratio and the most frequent color ratio in one pass."""
+        if image_np.dtype != np.uint8 or (image_np.ndim == 3 and image_np.shape[2] > 4):
+            # Cannot be packed, compute the ratios one by one
+            stats = ImageStats()
+            stats.white_pixels_ratio = self.compute_percentage_of_white_pixels(image_np)
+            stats.most_frequent_color_ratio = (
+                self.compute_percentage_of_most_frequent_color(image_np)
+            )
+            return stats
+        return compute_image_stats(
+            image_np,
+            approximate=self.approximate_stats,
+            max_error=self.max_stats_error,
+        )
+
     def compute_percentage_of_white_pixels(self, image_np: np.ndarray) -> float:
         """Compute the percentage of white pixels in the image."""
+        if image_np.dtype == np.uint8:
+            # Avoid averaging the channels: the mean is 255 only if they all are
+            white = image_np == 255
+            if white.ndim == 3:
+                white = np.all(white, axis=2)
+            return (np.count_nonzero(white) / white.size) * 100
+
         # Convert the image to grayscale and convert to NumPy array
         image_array = image_np
         if len(image_array.shape) == 3:
@@ -100,15 +231,14 @@ class ImageFilter:
 
     def compute_percentage_of_most_frequent_color(self, image_np: np.ndarray) -> float:
         """Compute the percentage of the most frequent color in the image."""
+        if image_np.dtype == np.uint8 and image_np.shape[2] <= 4:
+            return compute_image_stats(image_np).most_frequent_color_ratio
+
         # Reshape the image to a 2D array where each row is a pixel
         pixels = image_np.reshape(-1, image_np.shape[2])
 
         # Find the most frequent color
-        # Here we convert each pixel to a tuple to make them hashable, then use np.unique to find the most frequent one
-        unique_colors, counts = np.unique(
-            [tuple(row) for row in pixels], axis=0, return_counts=True
-        )
-        most_frequent_color = unique_colors[np.argmax(counts)]
+        _, counts = np.unique(pixels, axis=0, return_counts=True)
         frequency_of_most_frequent = np.max(counts)
 
         # Calculate the total number of pixels
@@ -119,44 +249,69 @@ class ImageFilter:
 
         return percentage
 
-    def check_image(self, image_path: str) -> Tuple[bool, Dict[str, Any]]:
-        """Check if the image meets the requirements."""
+    def check_image(
+        self,
+        image: Union[str, bytes, np.ndarray, Image.Image],
+        image_path: Optional[str] = None,
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """Check if the image meets the requirements.
+
+        Args:
+            image: The path to the image, its encoded bytes (e.g. a PNG screenshot), its array or the image itself.
+            image_path: The name of the image in the messages and the hash store. Defaults to its path.
+
+        Returns:
+            Whether the image meets the requirements.
+            The results of the checks. If the image is rejected, they hold the pixel ratios
+            and the reason ("rejected"): "white_pixels", "duplicate" or "most_frequent_color".
+        """
         # Open the image
-        image = Image.open(image_path)
+        if isinstance(image, str):
+            image_path = image_path or image
+            image = Image.open(image)
+        elif isinstance(image, bytes):
+            image = Image.open(io.BytesIO(image))
+        elif isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        image_path = image_path or "The image"
         image_np = np.array(image)
+        stats = self.compute_stats(image_np)
+        ratios = {
+            "white_pixels_ratio": stats.white_pixels_ratio,
+            "most_frequent_color_ratio": stats.most_frequent_color_ratio,
+        }
 
         # Compute the percentage of white pixels
-        white_pixels_ratio = self.compute_percentage_of_white_pixels(image_np)
+        white_pixels_ratio = stats.white_pixels_ratio
         if white_pixels_ratio > self.max_background_percentage:
             if self.verbose:
                 print(
                     f"{image_path} has too many white pixels ({white_pixels_ratio:.2f}%)."
                 )
-            return False, {}
+            return False, {"rejected": "white_pixels", **ratios}
 
         # Add the hash to the set
-        added, hash = self.add_hash(image, image_np, white_pixels_ratio)
+        added, hash = self.add_hash(
+            image, image_np, white_pixels_ratio, metadata={"image_path": image_path}
+        )
         if not added:
             if self.verbose:
                 print(f"{image_path} already exists in the set of hashes.")
-            return False, {}
+            return False, {"rejected": "duplicate", **ratios}
 
         # Compute the percentage of the most frequent color
-        most_frequent_color_ratio = self.compute_percentage_of_most_frequent_color(
-            image_np
-        )
+        most_frequent_color_ratio = stats.most_frequent_color_ratio
         if most_frequent_color_ratio > self.max_background_percentage:
             if self.verbose:
                 print(
                     f"{image_path} has too many pixels of the most frequent color ({most_frequent_color_ratio:.2f}%)."
                 )
-            return False, {}
+            return False, {"rejected": "most_frequent_color", **ratios}
 
-        return True, {
-            "white_pixels_ratio": white_pixels_ratio,
-            "most_frequent_color_ratio": most_frequent_color_ratio,
-            "hash": str(hash),
-        }
+        results = {**ratios, "hash": str(hash)}
+        if stats.max_error > 0:
+            results["stats_max_error"] = stats.max_error
+        return True, results
 
 
 def next_dates(
@@ -181,7 +336,277 @@ def previous_dates(
     return date_start, date_next
 
 
-def main(args):
+def get_repo_name(repo: Dict[str, Any]) -> str:
+    """Get the name used to store a repository on disk"""
+    return (
+        repo["full_name"].replace("/", "_").replace(".github.io", "").replace(".", "_")
+    )
+
+
+class CrawlState:
+    """The state shared by everything that processes repositories during a crawl.
+
+    All the methods are thread-safe so that the state can be shared between workers.
+    If a checkpoint is given, every change is saved to it and the state of the
+    previous runs is restored from it.
+    """
+
+    def __init__(
+        self,
+        num_websites_desired: int,
+        checkpoint: Optional[CrawlCheckpoint] = None,
+    ):
+        self.num_websites_desired: int = num_websites_desired
+        self.num_websites_collected: int = 0
+        self.next_website_index: int = 0
+        self.users_set: set = set()
+        self.repos_set: set = set()
+        self.checkpoint: Optional[CrawlCheckpoint] = checkpoint
+        self.lock = threading.Lock()
+
+    def restore(self, saved: Dict[str, Any]):
+        """Restore the state loaded from the checkpoint (see CrawlCheckpoint.load)."""
+        with self.lock:
+            self.num_websites_collected = saved["num_websites_collected"]
+            self.next_website_index = saved["next_website_index"]
+            self.users_set.update(saved["users"])
+            self.repos_set.update(saved["repos"])
+
+    def is_done(self) -> bool:
+        with self.lock:
+            return self.num_websites_collected >= self.num_websites_desired
+
+    def claim_repo(
+        self,
+        repo: Dict[str, Any],
+        repo_name: Optional[str] = None,
+        cursor: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Mark a repository as tried. Returns False if it should be skipped.
+
+        Args:
+            repo: The repository returned by the search API.
+            repo_name: The name it is stored under while it is processed. Defaults to its name.
+            cursor: The position of the search it was found at, to resume from.
+        """
+        name = get_repo_name(repo)
+        user = repo["owner"]["login"]
+        with self.lock:
+            # Check if we did not already collect from this user
+            if user in self.users_set:
+                print(f"Already collected from {user}. Skipping...")
+                return False
+
+            # Check if we have already tested this repo
+            if name in self.repos_set:
+                print(f"Already tried the repo {name}")
+                return False
+            self.repos_set.add(name)
+            if self.checkpoint is not None:
+                self.checkpoint.claim_repo(name, user, repo_name or name)
+                if cursor is not None:
+                    self.checkpoint.save_cursor(cursor)
+            return True
+
+    def reject_repo(self, repo: Dict[str, Any]):
+        """Record that a repository was rejected, so that it is not tried again."""
+        if self.checkpoint is not None:
+            self.checkpoint.reject_repo(get_repo_name(repo))
+
+    def reserve_website(self, repo: Dict[str, Any]) -> Optional[int]:
+        """Count a repository as collected.
+
+        The website is only recorded in the checkpoint by collect_website, once it is saved.
+
+        Returns:
+            The index of the website, or None if enough websites were collected already
+            or if another website of the same user was collected in the meantime.
+        """
+        user = repo["owner"]["login"]
+        with self.lock:
+            if self.num_websites_collected >= self.num_websites_desired:
+                return None
+            if user in self.users_set:
+                print(f"Already collected from {user}. Skipping...")
+                return None
+            self.users_set.add(user)
+            index = self.next_website_index
+            self.next_website_index += 1
+            self.num_websites_collected += 1
+            return index
+
+    def collect_website(self, repo: Dict[str, Any], repo_name: str, index: int):
+        """Record in the checkpoint that a website reserved at `index` is saved under `repo_name`."""
+        if self.checkpoint is not None:
+            self.checkpoint.collect_repo(get_repo_name(repo), repo_name, index)
+
+
+class Candidate:
+    """A repository being processed, along with the resources it holds."""
+
+    def __init__(
+        self,
+        repo: Dict[str, Any],
+        path: str,
+        repo_name: str,
+        state: Optional[CrawlState] = None,
+    ):
+        self.repo: Dict[str, Any] = repo
+        self.state: Optional[CrawlState] = state
+        self.path: str = path
+        self.name: str = get_repo_name(repo)
+        self.repo_name: str = repo_name
+        self.repo_path: str = os.path.join(path, "repos", repo_name)
+        self.image_path: Optional[str] = None
+        self.screenshot: Optional[bytes] = None  # Kept in memory until it is saved
+        self.probe_result: Optional[ProbeResult] = None
+        self.metadata: Dict[str, Any] = {
+            **repo,
+            "repo_name": repo_name,
+            "repo_path": self.repo_path,
+        }
+        self.server: Optional[JekyllServer] = None
+        self.actions: List[Any] = []
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def discard(self):
+        """Stop the server and delete everything that was written for this repository."""
+        self.stop_server()
+        self.screenshot = None
+        if self.image_path is not None and os.path.exists(self.image_path):
+            os.remove(self.image_path)  # Delete the screenshot
+        os.system(f"rm -rf {self.repo_path}")  # Delete the repository
+        if self.state is not None:
+            self.state.reject_repo(self.repo)
+
+    def rename(self, repo_name: str):
+        """Move the repository and its screenshot to a new name."""
+        repo_path = os.path.join(self.path, "repos", repo_name)
+        os.rename(self.repo_path, repo_path)
+        self.repo_name = repo_name
+        self.repo_path = repo_path
+        self.metadata["repo_name"] = repo_name
+        self.metadata["repo_path"] = repo_path
+        if self.image_path is not None:
+            image_path = os.path.join(self.path, "images", f"{repo_name}.png")
+            os.rename(self.image_path, image_path)
+            self.image_path = image_path
+
+
+# Retries of a search page that failed (other than with a 422), with exponential backoff
+SEARCH_MAX_RETRIES = 5
+SEARCH_RETRY_INITIAL_DELAY = 2.0  # In seconds
+SEARCH_RETRY_MAX_DELAY = 60.0
+
+
+def iterate_github_repos(
+    args: argparse.Namespace,
+    client: GitHubSearchClient,
+    cursor: Optional[Dict[str, Any]] = None,
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Yield the repositories found by searching GitHub backwards in time.
+
+    Each repository comes with the cursor of the page it was found on.
+    Passing that cursor back starts the search again from that page.
+    A page that fails is retried with exponential backoff. After SEARCH_MAX_RETRIES
+    retries the search stops, so that no page is skipped.
+    """
+    page: int = 0
+    date_next = datetime.datetime.now()
+    date_start = max(
+        datetime.datetime.strptime(args.query_created_after, "%Y-%m-%d"),
+        date_next - datetime.timedelta(days=args.day_interval),
+    )
+    if cursor is not None:
+        date_start = datetime.datetime.fromisoformat(cursor["date_start"])
+        date_next = datetime.datetime.fromisoformat(cursor["date_next"])
+        page = cursor["page"] - 1
+    num_repos_previous_page: int = args.query_limits
+
+    while True:
+        try:
+            if (
+                page * args.query_limits >= GITHUB_MAX_RESULTS
+                or num_repos_previous_page < args.query_limits
+            ):
+                # Github won't allow more than 1000 results
+                # So we have to break down the search into multiple queries
+                # Also therer could be less than 1000 results
+                date_start, date_next = previous_dates(date_start, date_next, args)
+                page = 1
+            else:
+                page += 1
+        except ValueError as e:
+            print(f"No more repositories to search: {e}")
+            return
+        print(f"Page {page} of the search results for {date_start} to {date_next}")
+
+        # Search for GitHub pages repositories
+        query = build_search_query(
+            date_start,
+            date_next,
+            language=args.query_language,
+            max_size_kb=args.query_max_size_kb,
+        )
+        repos: Optional[List[Dict[str, Any]]] = None
+        delay = SEARCH_RETRY_INITIAL_DELAY
+        for attempt in range(SEARCH_MAX_RETRIES + 1):
+            try:
+                repos = client.search(query, per_page=args.query_limits, page=page)[
+                    "items"
+                ]
+                break
+            except Exception as e:
+                if "422" in str(e):
+                    # We probably reached the end of the results for these dates
+                    # (the client already waits when the rate limit is reached)
+                    print(f"Found error 422: {e}")
+                    repos = []
+                    break
+                if attempt == SEARCH_MAX_RETRIES:
+                    # Stop rather than skip pages, so that the saved cursor stays right
+                    print(f"Search failed {attempt + 1} times, stopping: {e}")
+                    return
+                print(f"Search failed: {e}. Retrying in {delay:.0f} seconds")
+                time.sleep(delay)
+                delay = min(delay * 2, SEARCH_RETRY_MAX_DELAY)
+        num_repos_previous_page = len(repos)
+
+        cursor = {
+            "date_start": date_start.isoformat(),
+            "date_next": date_next.isoformat(),
+            "page": page,
+        }
+        for repo in repos:
+            yield cursor, repo
+
+
+def measured(stage: str) -> Callable:
+    """Time a step of the crawl and count its results by stage: passed, rejected or error."""
+
+    def decorator(func: Callable[["Crawl", Candidate], bool]) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self: "Crawl", candidate: Candidate) -> bool:
+            result = "error"
+            try:
+                with self.metrics.time("stage_duration_seconds", stage=stage):
+                    passed = func(self, candidate)
+                result = "passed" if passed else "rejected"
+                return passed
+            finally:
+                self.metrics.inc("stage_results", stage=stage, result=result)
+
+        return wrapper
+
+    return decorator
+
+
+def setup_save_path(args: argparse.Namespace) -> Tuple[str, str]:
+    """Create the output directories. Returns the dataset path and the metadata path."""
     file_path: str = os.path.dirname(os.path.realpath(__file__))
     path = os.path.join(file_path, args.save_path)
     if args.query_language is not None:
@@ -191,159 +616,565 @@ def main(args):
     os.makedirs(os.path.join(path, "images"), exist_ok=True)
     metadata_path = os.path.join(path, "metadata")
     os.makedirs(metadata_path, exist_ok=True)
+    return path, metadata_path
 
-    # Variables to store the results
-    num_websites_collected: int = 0
-    page: int = 1
-    image_filter = ImageFilter(
-        max_background_percentage=args.max_background_percentage,
-        verbose=True,
-    )
 
-    users_set = set()
-    repos_set = set()
+class Crawl:
+    """Everything shared by the steps that process the repositories of a crawl.
 
-    date_next = datetime.datetime.now()
-    date_start = max(
-        datetime.datetime.strptime(args.query_created_after, "%Y-%m-%d"),
-        date_next - datetime.timedelta(days=args.day_interval),
-    )
-    num_repos_previous_page: int = args.query_limits
+    Each step returns whether the candidate should go on to the next step.
+    If it should not, the candidate has already been cleaned up.
+    """
 
-    while num_websites_collected < args.num_websites_desired:
-        if (
-            page * args.query_limits >= GITHUB_MAX_RESULTS
-            or num_repos_previous_page < args.query_limits
-        ):
-            # Github won't allow more than 1000 results
-            # So we have to break down the search into multiple queries
-            # Also therer could be less than 1000 results
-            date_start, date_next = previous_dates(date_start, date_next, args)
-            page = 1
-        else:
-            page += 1
-        print(f"Page {page} of the search results for {date_start} to {date_next}")
+    def __init__(self, args: argparse.Namespace, num_drivers: int = 1):
+        self.args: argparse.Namespace = args
+        self.path, self.metadata_path = setup_save_path(args)
+        self.metrics = MetricsRegistry()
+        self.metrics.describe("searches", "Search requests, by outcome")
+        self.metrics.describe(
+            "search_duration_seconds", "Duration of the search requests"
+        )
+        self.metrics.describe("stage_results", "Repositories leaving a stage")
+        self.metrics.describe(
+            "stage_duration_seconds", "Time a repository spends in a stage"
+        )
+        self.metrics.describe(
+            "rejections", "Repositories rejected, by stage and reason"
+        )
+        self.metrics.describe("websites_collected", "Websites saved to the dataset")
+        self.metrics_server: Optional[MetricsServer] = None
+        if args.metrics_port:
+            self.metrics_server = MetricsServer(
+                self.metrics, port=args.metrics_port, verbose=True
+            )
+        self.snapshot_writer: Optional[SnapshotWriter] = None
+        if args.metrics_snapshot:
+            self.snapshot_writer = SnapshotWriter(
+                self.metrics,
+                os.path.join(self.path, args.metrics_snapshot),
+                interval=args.metrics_interval,
+            )
+        # The search cache and the hash store are shared by the datasets of all the
+        # languages saved under --save_path
+        file_path: str = os.path.dirname(os.path.realpath(__file__))
+        self.save_root: str = os.path.join(file_path, args.save_path)
+        self.hash_store: Optional[HashStore] = None
+        if args.hash_store:
+            self.hash_store = HashStore(os.path.join(self.save_root, args.hash_store))
+        self.checkpoint: Optional[CrawlCheckpoint] = None
+        if args.checkpoint:
+            self.checkpoint = CrawlCheckpoint(os.path.join(self.path, args.checkpoint))
+        self.state = CrawlState(args.num_websites_desired, checkpoint=self.checkpoint)
+        self.image_filter = ImageFilter(
+            max_background_percentage=args.max_background_percentage,
+            max_hash_distance_white_imgs=args.max_hash_distance_white,
+            max_hash_distance_other_imgs=args.max_hash_distance_other,
+            approximate_stats=args.approximate_stats,
+            max_stats_error=args.max_stats_error,
+            verbose=True,
+            # Without a hash store, the hashes are kept in the checkpoint for the next runs
+            on_hash_added=(
+                self.save_hash
+                if self.checkpoint is not None and self.hash_store is None
+                else None
+            ),
+            hash_store=self.hash_store,
+        )
+        self.probe_options: Optional[ProbeOptions] = None
+        if args.probe != "off":
+            self.probe_options = ProbeOptions()
+            self.probe_options.min_coverage = args.probe_min_coverage
+            self.probe_options.enforce = args.probe == "enforce"
+            self.probe_options.audit_rate = args.probe_audit_rate
+        self.probe_stats = ProbeStats()
 
-        # Search for GitHub pages repositories
-        try:
-            repos = search_github_repos(
-                created_after=date_start,
-                created_before=date_next,
-                language=args.query_language,
-                max_size_kb=args.query_max_size_kb,
-                limits=args.query_limits,
-                page=page,
+        # Only the accepted screenshots are written, in the background
+        self.image_writer = ImageWriter(verbose=True)
+        self.shard_writer: Optional[ShardWriter] = None
+        if args.output_format == "shards":
+            self.shard_writer = ShardWriter(
+                os.path.join(self.path, "shards"),
+                max_shard_bytes=int(args.max_shard_mb * 1024 * 1024),
+                image_format=args.shard_image_format,
                 verbose=True,
             )
-            num_repos_previous_page = len(repos)
-        except Exception as e:
-            if "422" in str(e):
-                # We probably reached the end of the results for these dates
-                print(f"Found error 422: {e}")
-                date_start, date_next = previous_dates(date_start, date_next, args)
-                page = 1
-                time.sleep(30)  # Just in case we have a rate limit
-                continue
+        self.metadata_sink: Optional[MetadataSink] = None
+        if args.metadata_format == "jsonl":
+            self.metadata_sink = MetadataSink(self.metadata_path)
+        self.cursor: Optional[Dict[str, Any]] = None
+        if self.checkpoint is not None:
+            self.resume()
 
-        # Clone the repositories and start the Jekyll server
-        for repo in enumerate(repos):
-            print("\n" + "=" * 50)
-            repo = repo[1]
-            name = (
-                repo["full_name"]
-                .replace("/", "_")
-                .replace(".github.io", "")
-                .replace(".", "_")
+        self.search_cache: Optional[SearchCache] = None
+        if args.search_cache:
+            self.search_cache = SearchCache(
+                os.path.join(self.save_root, args.search_cache),
+                max_bytes=int(args.search_cache_mb * 1024 * 1024),
             )
-            repo_name = f"{num_websites_collected}_{name}"
-            repo_path = os.path.join(path, "repos", repo_name)
-            clone_url = repo["clone_url"]
-            port = args.port
-            metadata = {**repo, "repo_name": repo_name, "repo_path": repo_path}
+        self.search_client = GitHubSearchClient(
+            cache=self.search_cache, verbose=True, on_search=self.record_search
+        )
+        self.planner: Optional[PartitionPlanner] = None
+        if args.search_planner:
+            self.planner = PartitionPlanner(
+                self.search_client, per_page=args.query_limits, verbose=True
+            )
+        self.clone_options = CloneOptions()
+        self.clone_options.depth = args.clone_depth or None
+        self.clone_options.blob_size_limit = args.clone_blob_limit
+        self.clone_options.max_bytes = int(args.clone_max_mb * 1024 * 1024) or None
+        self.clone_options.timeout = args.clone_timeout
+        # With the objects filter, only the repositories that pass are checked out
+        self.clone_options.checkout = args.filter_backend != "objects"
 
-            # Check if we did not already collect from this user
-            user = repo["owner"]["login"]
-            if user in users_set:
-                print(f"Already collected from {user}. Skipping...")
-                continue
+        self.tree_prefilter: Optional[TreePrefilter] = None
+        if args.prefilter != "none":
+            # The trees API shares the session and rate limit of the search
+            self.tree_prefilter = TreePrefilter(
+                source=args.prefilter, client=self.search_client, verbose=True
+            )
 
-            # Check if we have already tested this repo
-            if name in repos_set:
-                print(f"Alrwady tried the repo {name}")
-                continue
-            repos_set.add(name)
+        # Every server alive at the same time leases its own port from the pool
+        self.port_pool = PortPool(start_port=args.port)
+        self.driver_pool = DriverPool(size=num_drivers, max_uses=args.driver_max_uses)
+        self.bundle_cache: Optional[BundleCache] = None
+        if args.bundle_cache_dir:
+            self.bundle_cache = BundleCache(args.bundle_cache_dir, verbose=True)
+        self.static_server: Optional[StaticSiteServer] = None
+        self.build_workers: Optional[BuildWorkerPool] = None
+        if args.serve_mode == "static":
+            self.static_server = StaticSiteServer(port=args.port, mode=args.static_mode)
+            if args.build_workers:
+                self.build_workers = BuildWorkerPool(
+                    size=args.build_workers,
+                    max_builds=args.build_worker_max_builds,
+                    max_memory_growth_mb=args.build_worker_max_memory_mb,
+                    verbose=True,
+                )
 
-            print(f"Cloning {clone_url} to {repo_path}")
-            try:
-                clone_repo(clone_url, os.path.join(path, "repos"), repo_name)
-            except Exception as e:
-                print(f"Failed to clone the repository: {e}")
-                os.system(f"rm -rf {repo_path}")  # Delete the repository
-                continue
+    def resume(self):
+        """Restore the state of the previous runs from the checkpoint.
 
-            # Filter the repository
-            filter_success, filter_results = filter_repo(repo_path)
-            if not filter_success:
-                print(f"{repo_name} does not meet the requirements. Skipping...")
-                os.system(f"rm -rf {repo_path}")  # Delete the repository
-                continue
-            metadata["file_filter_results"] = filter_results
+        The repositories that were being processed when the previous run stopped
+        are deleted and not tried again.
+        """
+        saved = self.checkpoint.load()
+        self.state.restore(saved)
+        self.cursor = saved["cursor"]
+        if self.hash_store is None:
+            self.image_filter.restore_hashes(
+                imagehash.hex_to_hash(hash) for hash in saved["hashes"]
+            )
+        for repo_name in saved["interrupted"]:
+            os.system(f"rm -rf {os.path.join(self.path, 'repos', repo_name)}")
+            for path in [
+                os.path.join(self.path, "images", f"{repo_name}.png"),
+                os.path.join(self.metadata_path, f"{repo_name}.json"),
+            ]:
+                if os.path.exists(path):
+                    os.remove(path)
+        if not saved["repos"]:
+            print(f"Saving the state of the crawl to {self.checkpoint.db_path}")
+            return
+        print(
+            f"Resuming the crawl from {self.checkpoint.db_path} (pass --checkpoint '' to start from scratch):"
+        )
+        print(
+            f"  {self.state.num_websites_collected} websites collected, new ones are numbered from {self.state.next_website_index}"
+        )
+        print(
+            f"  {len(saved['repos'])} repositories tried, {len(saved['interrupted'])} of them interrupted and deleted"
+        )
+        if self.hash_store is None:
+            print(
+                f"  {len(saved['users'])} users skipped, {len(saved['hashes'])} image hashes restored"
+            )
+        else:
+            print(
+                f"  {len(saved['users'])} users skipped, image hashes loaded from {self.hash_store.path}"
+            )
+        if self.cursor is not None:
+            print(
+                f"  Search restarting at page {self.cursor['page']} of {self.cursor['date_start']} to {self.cursor['date_next']}"
+            )
 
-            # Start the Jekyll server
-            server = JekyllServer(repo_path, verbose=True, port=port)
-            success: bool = server.start()
+    def save_hash(self, hash: imagehash.ImageHash):
+        self.checkpoint.add_hashes([str(hash)])
 
-            if not success:
-                print(f"Failed to start the server for {repo_name}. Skipping...")
-                server.stop()
-                os.system(f"rm -rf {repo_path}")
-                continue
+    def iterate_repos(self) -> Prefetcher:
+        """Iterate over the search results and their cursors, searching ahead in the background.
+
+        The search restarts from the cursor saved in the checkpoint. The planner has no
+        cursor: it plans the search again but the repositories already tried are skipped.
+        """
+        if self.planner is not None:
+            root = SearchPartition(
+                datetime.datetime.strptime(self.args.query_created_after, "%Y-%m-%d"),
+                datetime.datetime.now(),
+                max_size_kb=self.args.query_max_size_kb,
+                language=self.args.query_language,
+            )
+            repos = ((None, repo) for repo in self.planner.iter_repos(root))
+        else:
+            repos = iterate_github_repos(self.args, self.search_client, self.cursor)
+        return Prefetcher(repos, buffer_size=self.args.search_prefetch)
+
+    def record_search(self, outcome: str, duration: float):
+        self.metrics.inc("searches", outcome=outcome)
+        self.metrics.observe("search_duration_seconds", duration)
+
+    def reject(self, candidate: Candidate, stage: str, reason: str):
+        """Count the rejection of a repository and clean it up."""
+        self.metrics.inc("rejections", stage=stage, reason=reason)
+        candidate.discard()
+
+    def __enter__(self) -> "Crawl":
+        if self.static_server is not None:
+            self.static_server.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.start()
+        return self
 
-            # Take a screenshot of a random page
-            image_path = os.path.join(path, "images", f"{repo_name}.png")
+    def __exit__(self, *args):
+        self.driver_pool.close()
+        self.image_writer.close()
+        if self.shard_writer is not None:
+            self.shard_writer.close()
+        if self.metadata_sink is not None:
+            self.metadata_sink.close()
+        if self.static_server is not None:
+            self.static_server.stop()
+        if self.build_workers is not None:
+            self.build_workers.close()
+            print(f"Build workers: {self.build_workers.stats()}")
+        if self.bundle_cache is not None:
+            print(f"Bundle cache: {self.bundle_cache.stats()}")
+        if self.tree_prefilter is not None:
+            print(f"Pre-clone filter: {self.tree_prefilter.stats()}")
+        if self.planner is not None:
+            print(f"Search plan: {self.planner.stats()}")
+        if self.search_cache is not None:
+            print(f"Search cache: {self.search_cache.stats()}")
+        if self.probe_options is not None:
+            print(f"Blank page probe: {self.probe_stats.stats()}")
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+        if self.hash_store is not None:
+            self.hash_store.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.stop()
+
+    @measured("prefilter")
+    def prefilter(self, candidate: Candidate) -> bool:
+        """Reject the repository before cloning it if its file list certainly fails the filter."""
+        if self.tree_prefilter is None:
+            return True
+        may_pass, _ = self.tree_prefilter.check(candidate.repo)
+        if not may_pass:
+            print(
+                f"{candidate.repo_name} does not meet the requirements (from its file list). Skipping..."
+            )
+            self.reject(candidate, "prefilter", "file_list")
+            return False
+        return True
+
+    @measured("clone")
+    def clone(self, candidate: Candidate) -> bool:
+        """Clone the repository."""
+        clone_url = candidate.repo["clone_url"]
+        print(f"Cloning {clone_url} to {candidate.repo_path}")
+        try:
+            clone_stats = clone_repo(
+                clone_url,
+                os.path.join(candidate.path, "repos"),
+                candidate.repo_name,
+                options=self.clone_options,
+            )
+        except Exception as e:
+            print(f"Failed to clone the repository: {e}")
+            self.reject(candidate, "clone", "error")
+            return False
+        candidate.metadata["clone_stats"] = clone_stats.to_dict()
+        return True
+
+    @measured("filter")
+    def filter(self, candidate: Candidate) -> bool:
+        """Filter the repository based on its files."""
+        if self.args.filter_backend == "objects":
             try:
-                scheenshot_options = ScreenshotOptions()
-                scheenshot_options.num_actions_range = (0, args.max_num_actions)
-                actions = save_random_screenshot(
-                    image_path, port=port, options=scheenshot_options
+                filter_success, filter_results = filter_repo_objects(
+                    candidate.repo_path
                 )
             except Exception as e:
-                print(f"Failed to take a screenshot: {e}")
-                server.stop()
-                os.system(f"rm -rf {repo_path}")
-                continue
+                print(f"Failed to read the files of {candidate.repo_name}: {e}")
+                self.reject(candidate, "filter", "error")
+                return False
+        else:
+            filter_success, filter_results = filter_repo_streaming(candidate.repo_path)
+        if not filter_success:
+            print(f"{candidate.repo_name} does not meet the requirements. Skipping...")
+            self.reject(candidate, "filter", filter_results.get("rejected", "unknown"))
+            return False
+        candidate.metadata["file_filter_results"] = filter_results
+
+        if not self.clone_options.checkout:
+            try:
+                checkout_stats = checkout_repo(candidate.repo_path, self.clone_options)
+            except Exception as e:
+                print(f"Failed to check out {candidate.repo_name}: {e}")
+                self.reject(candidate, "filter", "checkout_error")
+                return False
+            clone_stats = candidate.metadata["clone_stats"]
+            clone_stats["bytes_transferred"] = checkout_stats.bytes_transferred
+            clone_stats["bytes_on_disk"] = checkout_stats.bytes_on_disk
+            clone_stats["duration"] = round(
+                clone_stats["duration"] + checkout_stats.duration, 3
+            )
+        return True
+
+    @measured("serve")
+    def serve(self, candidate: Candidate) -> bool:
+        """Start the Jekyll server, or build the site for the static server."""
+        candidate.server = JekyllServer(
+            candidate.repo_path,
+            verbose=True,
+            port_pool=self.port_pool,
+            static_server=self.static_server,
+            bundle_cache=self.bundle_cache,
+            build_workers=self.build_workers,
+        )
+        success: bool = candidate.server.start()
+        for stage, name in [("bundle_install", "install"), ("server_start", "start")]:
+            if name in candidate.server.timings:
+                self.metrics.observe(
+                    "stage_duration_seconds",
+                    candidate.server.timings[name],
+                    stage=stage,
+                )
+
+        if not success:
+            print(f"Failed to start the server for {candidate.repo_name}. Skipping...")
+            self.reject(candidate, "serve", candidate.server.failure or "error")
+            return False
+        return True
 
-            # Open the image and check for duplicates or images with too many white / background pixels
-            image_filter_success, image_filter_results = image_filter.check_image(
-                image_path
+    @measured("render")
+    def render(self, candidate: Candidate) -> bool:
+        """Take a screenshot of a random page, kept in memory until it is saved."""
+        try:
+            scheenshot_options = ScreenshotOptions()
+            scheenshot_options.num_actions_range = (0, self.args.max_num_actions)
+            candidate.screenshot, candidate.actions, candidate.probe_result = (
+                take_random_screenshot(
+                    port=candidate.server.port,
+                    options=scheenshot_options,
+                    driver_pool=self.driver_pool,
+                    url=candidate.server.url,
+                    probe_options=self.probe_options,
+                )
             )
-            if not image_filter_success:
-                os.remove(image_path)  # Delete the screenshot
-                server.stop()
-                os.system(f"rm -rf {repo_path}")
-                continue
-            metadata["image_filter_results"] = image_filter_results
-
-            # Print the actions performed
-            if actions:
-                print(f"Actions performed to take the screenshot of {repo_name}:")
-                for j, action in enumerate(actions):
-                    print(f"{j + 1}. {action}")
-
-            # Stop the Jekyll server
-            server.stop()
-            num_websites_collected += 1
-
-            # Delete build files
-            os.system(f"rm -rf {repo_path}/_site")
-            os.system(f"rm -rf {repo_path}/.jekyll-cache")
-
-            # Save the metadata
-            users_set.add(user)
-            metadata_file = os.path.join(metadata_path, f"{repo_name}.json")
-            with open(metadata_file, "w") as f:
+        except Exception as e:
+            print(f"Failed to take a screenshot: {e}")
+            self.reject(candidate, "render", "error")
+            return False
+
+        if candidate.probe_result is not None:
+            candidate.metadata["probe_results"] = candidate.probe_result.to_dict()
+            if candidate.screenshot is None:
+                self.probe_stats.record_skipped(candidate.probe_result)
+                print(f"{candidate.repo_name} looks blank. Skipping...")
+                self.reject(candidate, "render", "blank")
+                return False
+        return True
+
+    @measured("check")
+    def check(self, candidate: Candidate) -> bool:
+        """Check the screenshot for duplicates or too many white / background pixels."""
+        image_filter_success, image_filter_results = self.image_filter.check_image(
+            candidate.screenshot, image_path=f"{candidate.repo_name}.png"
+        )
+        if candidate.probe_result is not None:
+            self.probe_stats.record(
+                candidate.probe_result,
+                self.image_filter.is_background(image_filter_results),
+            )
+        if not image_filter_success:
+            self.reject(candidate, "check", image_filter_results["rejected"])
+            return False
+        candidate.metadata["image_filter_results"] = image_filter_results
+        return True
+
+    def save(self, candidate: Candidate, index: int):
+        """Stop the server, delete the build files and save the screenshot and the metadata.
+
+        The website is recorded as collected in the checkpoint once both are on disk.
+
+        Args:
+            candidate: The accepted repository.
+            index: The index reserved for it (see CrawlState.reserve_website).
+        """
+        # Print the actions performed
+        if candidate.actions:
+            print(f"Actions performed to take the screenshot of {candidate.repo_name}:")
+            for j, action in enumerate(candidate.actions):
+                print(f"{j + 1}. {action}")
+
+        # Stop the Jekyll server
+        candidate.stop_server()
+
+        # Delete build files
+        os.system(f"rm -rf {candidate.repo_path}/_site")
+        os.system(f"rm -rf {candidate.repo_path}/.jekyll-cache")
+
+        collect = functools.partial(
+            self.state.collect_website, candidate.repo, candidate.repo_name, index
+        )
+        if self.shard_writer is None:
+            candidate.image_path = os.path.join(
+                candidate.path, "images", f"{candidate.repo_name}.png"
+            )
+            candidate.metadata["image_path"] = candidate.image_path
+
+        # Only keep the columns of the schema, unless the full metadata is asked for
+        metadata: Dict[str, Any] = candidate.metadata
+        if self.metadata_sink is not None:
+            metadata = flatten_metadata(candidate.metadata)
+
+        if self.shard_writer is not None:
+            # Pack the screenshot and the metadata into the current shard
+            self.shard_writer.add(candidate.repo_name, candidate.screenshot, metadata)
+            collect()
+        elif self.metadata_sink is not None:
+            # Save the screenshot in the background, then its row, so that every row
+            # of the metadata file has its screenshot
+            sink_add = functools.partial(
+                self.metadata_sink.add, metadata, on_written=collect
+            )
+            self.image_writer.write(
+                candidate.image_path, candidate.screenshot, on_written=sink_add
+            )
+        else:
+            metadata_file = os.path.join(
+                self.metadata_path, f"{candidate.repo_name}.json"
+            )
+
+            def save_metadata():
                 # Format as a nice JSON file
-                f.write(json.dumps(metadata, indent=4))
+                write_file_atomically(
+                    metadata_file,
+                    json.dumps(candidate.metadata, indent=4).encode("utf-8"),
+                )
+                collect()
+
+            # Save the screenshot in the background, then the metadata, so that every
+            # metadata file has its screenshot
+            self.image_writer.write(
+                candidate.image_path, candidate.screenshot, on_written=save_metadata
+            )
+        candidate.screenshot = None
+        self.metrics.inc("websites_collected")
+
+
+def main(args):
+    if args.pipeline:
+        return main_pipeline(args)
+
+    with Crawl(args) as crawl:
+        state = crawl.state
+
+        # Clone the repositories and start the Jekyll server
+        repos = crawl.iterate_repos()
+        for cursor, repo in repos:
+            if state.is_done():
+                repos.close()
+                break
+            print("\n" + "=" * 50)
+            repo_name = f"{state.next_website_index}_{get_repo_name(repo)}"
+            if not state.claim_repo(repo, repo_name, cursor):
+                continue
+
+            candidate = Candidate(repo, crawl.path, repo_name, state)
+            if not (
+                crawl.prefilter(candidate)
+                and crawl.clone(candidate)
+                and crawl.filter(candidate)
+                and crawl.serve(candidate)
+                and crawl.render(candidate)
+                and crawl.check(candidate)
+            ):
+                continue
+
+            index = state.reserve_website(repo)
+            if index is None:
+                crawl.reject(candidate, "check", "not_reserved")
+                continue
+            crawl.save(candidate, index)
+
+
+def main_pipeline(args):
+    """Run the crawl as a pipeline of stages, each with its own pool of workers.
+
+    Repositories are processed under their plain name and only get their
+    `{index}_{name}` name once they are accepted.
+    """
+    crawl = Crawl(args, num_drivers=args.num_workers_render)
+    state = crawl.state
+
+    def source() -> Iterator[Candidate]:
+        repos = crawl.iterate_repos()
+        for cursor, repo in repos:
+            if state.is_done() or pipeline.stopped():
+                repos.close()
+                return
+            if state.claim_repo(repo, cursor=cursor):
+                yield Candidate(repo, crawl.path, get_repo_name(repo), state)
+
+    def step(func: Callable[[Candidate], bool]) -> Callable:
+        return lambda candidate: candidate if func(candidate) else None
+
+    def check(candidate: Candidate) -> None:
+        candidate.stop_server()
+        if not crawl.check(candidate):
+            return None
+        index = state.reserve_website(candidate.repo)
+        if index is None:
+            crawl.reject(candidate, "check", "not_reserved")
+            return None
+        candidate.rename(f"{index}_{candidate.name}")
+        crawl.save(candidate, index)
+        print(f"Collected {candidate.repo_name}")
+        if state.is_done():
+            pipeline.stop()
+        return None
+
+    pipeline = Pipeline(
+        source(),
+        [
+            Stage(
+                "prefilter",
+                step(crawl.prefilter),
+                args.num_workers_prefilter,
+                args.queue_size,
+            ),
+            Stage("clone", step(crawl.clone), args.num_workers_clone, args.queue_size),
+            Stage(
+                "filter", step(crawl.filter), args.num_workers_filter, args.queue_size
+            ),
+            Stage("serve", step(crawl.serve), args.num_workers_serve, args.queue_size),
+            Stage(
+                "render", step(crawl.render), args.num_workers_render, args.queue_size
+            ),
+            Stage("check", check, args.num_workers_check, args.queue_size),
+        ],
+        on_discard=Candidate.discard,
+        verbose=True,
+    )
+    with crawl:
+        pipeline.run()
 
 
 def parse_args():
@@ -354,12 +1185,87 @@ def parse_args():
         default="data",
         help="The path to save the repositories",
     )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        default="files",
+        choices=["files", "shards"],
+        help="Save each screenshot as a PNG in images/ (files), or pack the screenshots and their metadata into tar shards with an index in shards/",
+    )
+    parser.add_argument(
+        "--metadata_format",
+        type=str,
+        default="json",
+        choices=["json", "jsonl"],
+        help="Append the metadata as rows of a flat schema to metadata/metadata.jsonl (jsonl), or save the full metadata as one JSON file per website (json)",
+    )
+    parser.add_argument(
+        "--max_shard_mb",
+        type=float,
+        default=1024,
+        help="The maximum size of a shard in MB (shards output)",
+    )
+    parser.add_argument(
+        "--shard_image_format",
+        type=str,
+        default="png",
+        choices=IMAGE_FORMATS,
+        help="The format of the screenshots in the shards: png (as captured) or webp (lossless)",
+    )
     parser.add_argument(
         "--max_background_percentage",
         type=float,
         default=95.0,
         help="The maximum percentage of background pixels for a page to be considered a landing page",
     )
+    parser.add_argument(
+        "--max_hash_distance_white",
+        type=int,
+        default=0,
+        help="Screenshots with a white background whose 8x8 hashes differ by at most this many bits are duplicates (0 only rejects identical hashes, e.g. 4 also rejects near-duplicates)",
+    )
+    parser.add_argument(
+        "--max_hash_distance_other",
+        type=int,
+        default=0,
+        help="Other screenshots whose 5x5 hashes differ by at most this many bits are duplicates (0 only rejects identical hashes, e.g. 1 also rejects near-duplicates)",
+    )
+    parser.add_argument(
+        "--approximate_stats",
+        action="store_true",
+        help="Compute the pixel ratios of the screenshots on a random sample of their pixels",
+    )
+    parser.add_argument(
+        "--max_stats_error",
+        type=float,
+        default=1.0,
+        help="The maximum error of the approximate pixel ratios, in percentage points",
+    )
+    parser.add_argument(
+        "--hash_store",
+        type=str,
+        default="hashes.bin",
+        help="The file, in --save_path, where the hashes of the screenshots are stored to detect duplicates across runs and languages (empty to disable)",
+    )
+    parser.add_argument(
+        "--probe",
+        type=str,
+        default="shadow",
+        choices=["off", "shadow", "enforce"],
+        help="Probe the DOM for blank pages before taking the screenshot: only to measure the agreement with the image filter (shadow) or to skip blank pages (enforce)",
+    )
+    parser.add_argument(
+        "--probe_min_coverage",
+        type=float,
+        default=5.0,
+        help="The minimum percentage of the viewport covered by content for the probe not to find a page blank",
+    )
+    parser.add_argument(
+        "--probe_audit_rate",
+        type=float,
+        default=0.1,
+        help="The fraction of the pages found blank whose screenshot is still taken to audit the probe (enforce mode)",
+    )
     parser.add_argument(
         "--max_num_actions",
         type=int,
@@ -390,6 +1296,29 @@ def parse_args():
         default=50,
         help="The maximum number of repositories to search for",
     )
+    parser.add_argument(
+        "--search_planner",
+        action="store_true",
+        help="Partition the search by date, size and language from the result counts instead of stepping back by --day_interval",
+    )
+    parser.add_argument(
+        "--search_prefetch",
+        type=int,
+        default=100,
+        help="The number of search results fetched ahead of the processing",
+    )
+    parser.add_argument(
+        "--search_cache",
+        type=str,
+        default="search_cache.sqlite",
+        help="The SQLite file, in --save_path, where search responses are cached across runs (empty to disable)",
+    )
+    parser.add_argument(
+        "--search_cache_mb",
+        type=float,
+        default=200,
+        help="The maximum size of the compressed responses in the search cache, in MB",
+    )
     parser.add_argument(
         "--num_websites_desired",
         type=int,
@@ -408,6 +1337,159 @@ def parse_args():
         default=4000,
         help="The port to use for the Jekyll server",
     )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default="checkpoint.sqlite",
+        help="The SQLite file, in the dataset directory, where the state of the crawl is saved to resume it after a restart (empty to disable)",
+    )
+    parser.add_argument(
+        "--prefilter",
+        type=str,
+        default="api",
+        choices=["none", "api", "git"],
+        help="Skip repositories whose file list certainly fails the filter, listing them with the git trees API or a blobless clone",
+    )
+    parser.add_argument(
+        "--clone_depth",
+        type=int,
+        default=1,
+        help="The number of commits to clone (0 clones the whole history)",
+    )
+    parser.add_argument(
+        "--clone_blob_limit",
+        type=str,
+        default=None,
+        help="Do not fetch blobs larger than this when cloning (e.g. 512k)",
+    )
+    parser.add_argument(
+        "--clone_max_mb",
+        type=float,
+        default=50,
+        help="Abort clones larger than this many MB on disk (0 for no limit)",
+    )
+    parser.add_argument(
+        "--clone_timeout",
+        type=float,
+        default=30,
+        help="The maximum time allowed to clone a repository in seconds",
+    )
+    parser.add_argument(
+        "--filter_backend",
+        type=str,
+        default="worktree",
+        choices=["worktree", "objects"],
+        help="Filter the repositories on their checked out files (worktree), or on their git objects before checking out only the ones that pass (objects)",
+    )
+    parser.add_argument(
+        "--serve_mode",
+        type=str,
+        default="serve",
+        choices=["serve", "static"],
+        help="Run `jekyll serve` per site, or build each site once and serve it from an in-process static server",
+    )
+    parser.add_argument(
+        "--static_mode",
+        type=str,
+        default="vhost",
+        choices=["vhost", "prefix"],
+        help="How the static server tells sites apart: by virtual host or by path prefix",
+    )
+    parser.add_argument(
+        "--build_workers",
+        type=int,
+        default=0,
+        help="The number of long-lived Ruby processes building the sites one after the other (static serve mode, 0 to start Jekyll for every site)",
+    )
+    parser.add_argument(
+        "--build_worker_max_builds",
+        type=int,
+        default=100,
+        help="The number of sites a build worker builds before it is restarted",
+    )
+    parser.add_argument(
+        "--build_worker_max_memory_mb",
+        type=float,
+        default=512,
+        help="The memory in MB a build worker may gain before it is restarted",
+    )
+    parser.add_argument(
+        "--bundle_cache_dir",
+        type=str,
+        default=None,
+        help="A directory to share installed gems between repositories with the same Gemfile",
+    )
+    parser.add_argument(
+        "--driver_max_uses",
+        type=int,
+        default=50,
+        help="The number of screenshots taken by a Chrome instance before it is restarted",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=0,
+        help="Serve the metrics of the crawl on this port, at /metrics (Prometheus) and /metrics.json (0 to disable)",
+    )
+    parser.add_argument(
+        "--metrics_snapshot",
+        type=str,
+        default="metrics.json",
+        help="The JSON file, in the dataset directory, where a snapshot of the metrics is written periodically (empty to disable)",
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=30,
+        help="The time between two snapshots of the metrics in seconds",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Process several repositories concurrently, with a pool of workers per stage",
+    )
+    parser.add_argument(
+        "--num_workers_prefilter",
+        type=int,
+        default=2,
+        help="The number of workers listing repositories before cloning them (pipeline mode)",
+    )
+    parser.add_argument(
+        "--num_workers_clone",
+        type=int,
+        default=4,
+        help="The number of workers cloning repositories (pipeline mode)",
+    )
+    parser.add_argument(
+        "--num_workers_filter",
+        type=int,
+        default=2,
+        help="The number of workers filtering repositories (pipeline mode)",
+    )
+    parser.add_argument(
+        "--num_workers_serve",
+        type=int,
+        default=4,
+        help="The number of workers installing and starting Jekyll servers (pipeline mode)",
+    )
+    parser.add_argument(
+        "--num_workers_render",
+        type=int,
+        default=2,
+        help="The number of workers taking screenshots (pipeline mode)",
+    )
+    parser.add_argument(
+        "--num_workers_check",
+        type=int,
+        default=1,
+        help="The number of workers checking screenshots (pipeline mode)",
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=4,
+        help="The maximum number of repositories waiting in front of each stage (pipeline mode)",
+    )
 
     return parser.parse_args()
 
@@ -0,0 +1,332 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# The upper bounds of the latency buckets in seconds, from a cached search page to a slow bundle install
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Count observations in cumulative buckets, as Prometheus does."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets: List[float] = sorted(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating linearly within its bucket.
+
+        Returns:
+            Optional[float]: The estimate, None without observations. Quantiles falling in
+                the +Inf bucket are reported as the largest bound.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra is not None else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Counters and latency histograms of a crawl, keyed by name and labels.
+
+    All the methods are thread-safe, so the workers of every stage can share a registry.
+    Counter names are given without the `_total` suffix, which is added on export.
+    """
+
+    def __init__(
+        self, prefix: str = "scraper", buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        """
+        Args:
+            prefix: The prefix of the exported metric names.
+            buckets: The upper bounds of the histogram buckets in seconds.
+        """
+        self.prefix: str = prefix
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.descriptions: Dict[str, str] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.start_time: float = time.time()
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, description: str):
+        """Set the help text of a metric."""
+        self.descriptions[name] = description
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        """Increment a counter."""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        """Add an observation, in seconds, to a histogram."""
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            histograms = self.histograms.setdefault(name, {})
+            if key not in histograms:
+                histograms[key] = Histogram(self.buckets)
+            histograms[key].observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the duration of a block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy the values of the metrics into a JSON-serializable dict."""
+        with self._lock:
+            counters = {
+                name: [
+                    {"labels": dict(key), "value": value}
+                    for key, value in values.items()
+                ]
+                for name, values in self.counters.items()
+            }
+            histograms = {
+                name: [
+                    {"labels": dict(key), **histogram.to_dict()}
+                    for key, histogram in values.items()
+                ]
+                for name, values in self.histograms.items()
+            }
+        return {
+            "time": round(time.time(), 3),
+            "uptime": round(time.time() - self.start_time, 3),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        """Format the metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, values in sorted(self.counters.items()):
+                full_name = f"{self.prefix}_{name}_total"
+                if name in self.descriptions:
+                    lines.append(f"# HELP {full_name} {self.descriptions[name]}")
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(values.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+            for name, values in sorted(self.histograms.items()):
+                full_name = f"{self.prefix}_{name}"
+                if name in self.descriptions:
+                    lines.append(f"# HELP {full_name} {self.descriptions[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, histogram in sorted(values.items()):
+                    cumulative = 0
+                    for bound, count in zip(
+                        histogram.buckets + [float("inf")], histogram.counts
+                    ):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(
+                            f"{full_name}_bucket{_format_labels(key, ('le', le))} {cumulative}"
+                        )
+                    lines.append(
+                        f"{full_name}_sum{_format_labels(key)} {histogram.sum:g}"
+                    )
+                    lines.append(
+                        f"{full_name}_count{_format_labels(key)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serve the metrics of a registry as Prometheus text or as JSON."""
+
+    def __init__(self, *args, registry: MetricsRegistry, **kwargs):
+        self.registry = registry
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.registry.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serve the metrics on /metrics (Prometheus) and /metrics.json from a background thread."""
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        port: int,
+        host: str = "127.0.0.1",
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            registry: The metrics to serve.
+            port: The port to listen on.
+            host: The host to bind to.
+            verbose: Whether to print the address.
+        """
+        self.registry: MetricsRegistry = registry
+        self.port: int = port
+        self.host: str = host
+        self.verbose: bool = verbose
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "MetricsServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start listening in a background thread."""
+        if self._httpd is not None:
+            return
+        handler = partial(_MetricsRequestHandler, registry=self.registry)
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        if self.verbose:
+            print(f"Metrics served at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """Stop listening."""
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = None
+        self._thread = None
+
+
+class SnapshotWriter:
+    """Write a JSON snapshot of the metrics to a file periodically, and once more when stopped.
+
+    The file is replaced atomically, so a reader never sees a partial snapshot.
+    """
+
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 30):
+        """
+        Args:
+            registry: The metrics to write.
+            path: The JSON file to write to.
+            interval: The time between two snapshots in seconds.
+        """
+        self.registry: MetricsRegistry = registry
+        self.path: str = path
+        self.interval: float = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "SnapshotWriter":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.registry.snapshot(), f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop writing, after a last snapshot."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.write()
@@ -0,0 +1,169 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, List, Optional
+
+
+class _Done:
+    """Sentinel put in a queue once no more items will follow."""
+
+
+DONE = _Done()
+
+
+class Stage:
+    """A step of the pipeline, run by its own pool of worker threads.
+
+    Each worker takes an item from the stage's input queue and calls `func` on it.
+    If `func` returns None (or raises), the item is dropped, otherwise the returned item
+    is passed to the next stage.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Optional[Any]],
+        num_workers: int = 1,
+        queue_size: int = 1,
+    ):
+        """
+        Args:
+            name: The name of the stage, used in logs.
+            func: The function to apply to each item.
+            num_workers: The number of threads running `func` concurrently.
+            queue_size: The maximum number of items waiting in front of the stage.
+        """
+        self.name: str = name
+        self.func: Callable[[Any], Optional[Any]] = func
+        self.num_workers: int = max(1, num_workers)
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.num_processed: int = 0
+        self.num_dropped: int = 0
+        self._num_workers_alive: int = self.num_workers
+        self._lock = threading.Lock()
+
+
+class Pipeline:
+    """A pipeline of stages connected by bounded queues.
+
+    The bounded queues provide backpressure: a slow stage blocks the stages before it
+    instead of letting work pile up in memory.
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Any],
+        stages: List[Stage],
+        on_discard: Optional[Callable[[Any], None]] = None,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            source: The iterable producing the items to feed to the first stage.
+            stages: The stages, in order.
+            on_discard: Called on items that are dropped because the pipeline was stopped.
+            verbose: Whether to print the progress.
+        """
+        self.source: Iterable[Any] = source
+        self.stages: List[Stage] = stages
+        self.on_discard: Optional[Callable[[Any], None]] = on_discard
+        self.verbose: bool = verbose
+        self.stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def stop(self):
+        """Ask the pipeline to stop. Items still in flight are discarded."""
+        self.stop_event.set()
+
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    def _discard(self, item: Any):
+        if self.on_discard is not None:
+            try:
+                self.on_discard(item)
+            except Exception as e:
+                print(f"Failed to discard an item: {e}")
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Put an item in a queue, giving up if the pipeline is stopped.
+
+        The sentinel is always delivered so that the workers downstream can exit.
+        """
+        while True:
+            if self.stopped() and item is not DONE:
+                self._discard(item)
+                return False
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+    def _run_source(self):
+        first_queue = self.stages[0].queue
+        try:
+            for item in self.source:
+                if self.stopped():
+                    self._discard(item)
+                    break
+                self._put(first_queue, item)
+        except Exception as e:
+            print(f"The source of the pipeline failed: {e}")
+        finally:
+            self._put(first_queue, DONE)
+
+    def _run_worker(self, index: int):
+        stage = self.stages[index]
+        next_queue = (
+            self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+        )
+        while True:
+            item = stage.queue.get()
+            if item is DONE:
+                # Let the other workers of this stage see the sentinel too
+                stage.queue.put(DONE)
+                break
+            if self.stopped():
+                self._discard(item)
+                continue
+
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                print(f"Stage {stage.name} failed: {e}")
+                self._discard(item)
+                result = None
+
+            with stage._lock:
+                stage.num_processed += 1
+                if result is None:
+                    stage.num_dropped += 1
+            if result is not None and next_queue is not None:
+                self._put(next_queue, result)
+
+        with stage._lock:
+            stage._num_workers_alive -= 1
+            last_worker = stage._num_workers_alive == 0
+        if last_worker and next_queue is not None:
+            self._put(next_queue, DONE)
+
+    def run(self):
+        """Run the pipeline until the source is exhausted or `stop` is called."""
+        self._threads = [threading.Thread(target=self._run_source, daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.num_workers):
+                self._threads.append(
+                    threading.Thread(
+                        target=self._run_worker, args=(index,), daemon=True
+                    )
+                )
+        for thread in self._threads:
+            thread.start()
+        for thread in self._threads:
+            thread.join()
+
+        if self.verbose:
+            for stage in self.stages:
+                print(
+                    f"Stage {stage.name}: {stage.num_processed} processed, {stage.num_dropped} dropped"
+                )
@@ -56,14 +56,22 @@ class ClickAction(Action):
 
     @staticmethod
     def get_random_action(
-        driver: webdriver.Chrome, port: int, *args, **kwargs
+        driver: webdriver.Chrome,
+        port: int,
+        *args,
+        url: Optional[str] = None,
+        **kwargs,
     ) -> "ClickAction":
-        """Get a random click action"""
+        """Get a random click action
+
+        The links are restricted to the website, served at `url` (defaults to "http://localhost:{port}").
+        """
+        url = url or f"http://localhost:{port}"
         clickables: List[str] = filter_clickable_elts(
-            find_clickable_elts(driver), url=f"http://localhost:{port}"
+            find_clickable_elts(driver), url=url
         )
         if len(clickables) == 0:
-            return ClickAction(argument=f"http://localhost:{port}")
+            return ClickAction(argument=url)
         link: str = random.choice(clickables)
         return ClickAction(argument=link)
 
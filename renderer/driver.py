@@ -2,17 +2,18 @@ from selenium import webdriver
 import selenium.common.exceptions
 import random
 import time
-from typing import List
+from typing import List, Optional, Tuple, TYPE_CHECKING
 from .action import Action
+from .probe import ProbeOptions, ProbeResult, probe_page
 
+if TYPE_CHECKING:
+    from .pool import DriverPool
 
-def init_driver(
-    url: str, resolution: tuple[int, int] = (1920, 1080)
-) -> webdriver.Chrome:
-    """Initialize the WebDriver
+
+def create_driver(resolution: tuple[int, int] = (1920, 1080)) -> webdriver.Chrome:
+    """Launch a headless Chrome WebDriver
 
     Args:
-        url (str): The URL of the website. Usually "http://localhost:{port}".
         resolution (tuple[int, int], optional): The resolution of the WebDriver. Defaults to (1920, 1080).
 
     Returns:
@@ -25,7 +26,22 @@ def init_driver(
     options.add_argument(
         "--disable-dev-shm-usage"
     )  # Optional: overcome limited resource problems
-    driver = webdriver.Chrome(options=options)
+    return webdriver.Chrome(options=options)
+
+
+def init_driver(
+    url: str, resolution: tuple[int, int] = (1920, 1080)
+) -> webdriver.Chrome:
+    """Initialize the WebDriver
+
+    Args:
+        url (str): The URL of the website. Usually "http://localhost:{port}".
+        resolution (tuple[int, int], optional): The resolution of the WebDriver. Defaults to (1920, 1080).
+
+    Returns:
+        webdriver.Chrome: The Chrome WebDriver
+    """
+    driver = create_driver(resolution)
     driver.get(url)
     return driver
 
@@ -52,48 +68,112 @@ class ScreenshotOptions:
     num_actions_range: tuple[int, int] = (0, 3)
 
 
-def save_random_screenshot(
-    path: str, port: int, options: ScreenshotOptions = ScreenshotOptions()
-) -> List[Action]:
-    """Save a screenshot of a random page
+def take_random_screenshot(
+    port: int,
+    options: ScreenshotOptions = ScreenshotOptions(),
+    driver_pool: Optional["DriverPool"] = None,
+    url: Optional[str] = None,
+    probe_options: Optional[ProbeOptions] = None,
+) -> Tuple[Optional[bytes], List[Action], Optional[ProbeResult]]:
+    """Take a screenshot of a random page, in memory
+
+    With probe options, the page is probed for blankness from its DOM before the screenshot.
+    If the probe is enforced and finds the page blank, no screenshot is taken
+    (except for a random fraction of the pages, to audit the probe).
 
     Args:
-        path (str): The path to save the screenshot
         port (int): The port to use for the website.
         options (ScreenshotOptions, optional): The options to use for taking the screenshot. Defaults to ScreenshotOptions().
+        driver_pool (DriverPool, optional): The pool to take the driver from. If None, a new driver is launched and closed.
+        url (str, optional): The URL of the website. Defaults to "http://localhost:{port}".
+        probe_options (ProbeOptions, optional): The options of the blank page probe. Defaults to None (no probe).
 
     Returns:
+        Optional[bytes]: The screenshot, encoded as PNG by the browser, or None if the probe skipped it
         List[Action]: A list of actions performed to take the screenshot
-
-    Raises:
-        ValueError: If the path does not end with .png
+        Optional[ProbeResult]: The result of the probe, or None if there was no probe
     """
-    if not path.endswith(".png"):
-        raise ValueError("The path should end with .png")
+    url = url or f"http://localhost:{port}"
 
     driver: webdriver.Chrome
     try:
-        driver = init_driver(
-            url=f"http://localhost:{port}", resolution=options.resolution
-        )
+        if driver_pool is not None:
+            driver = driver_pool.acquire(resolution=options.resolution)
+        else:
+            driver = init_driver(url=url, resolution=options.resolution)
     except selenium.common.exceptions.WebDriverException as e:
         raise Exception(f"Failed to initialize the driver: {e}")
     except Exception as e:
         raise Exception(f"An unknown error occurred while initializing the driver: {e}")
 
-    num_actions = random.randint(*options.num_actions_range)
-    actions: List[Action] = [
-        Action.get_random_action(driver, port) for _ in range(num_actions)
-    ]
-    actions = list(set(actions))
-    for action in actions:
-        action.perform(driver)
-        time.sleep(options.delay_between_each_action_ms / 1000.0)
+    broken: bool = False
+    try:
+        if driver_pool is not None:
+            driver.get(url)
+
+        num_actions = random.randint(*options.num_actions_range)
+        actions: List[Action] = [
+            Action.get_random_action(driver, port, url=url) for _ in range(num_actions)
+        ]
+        actions = list(set(actions))
+        for action in actions:
+            action.perform(driver)
+            time.sleep(options.delay_between_each_action_ms / 1000.0)
+
+        # Check if the page is blank before taking the screenshot
+        probe_result: Optional[ProbeResult] = None
+        if probe_options is not None:
+            probe_result = probe_page(driver, probe_options)
+            if (
+                probe_result.blank
+                and probe_options.enforce
+                and random.random() >= probe_options.audit_rate
+            ):
+                return None, actions, probe_result
+
+        # Take a screenshot of the page
+        screenshot = driver.get_screenshot_as_png()
+    except selenium.common.exceptions.WebDriverException:
+        broken = True
+        raise
+    finally:
+        if driver_pool is not None:
+            driver_pool.release(driver, broken=broken)
+        else:
+            close_driver(driver)
+
+    return screenshot, actions, probe_result
+
+
+def save_random_screenshot(
+    path: str,
+    port: int,
+    options: ScreenshotOptions = ScreenshotOptions(),
+    driver_pool: Optional["DriverPool"] = None,
+    url: Optional[str] = None,
+) -> List[Action]:
+    """Save a screenshot of a random page
+
+    Args:
+        path (str): The path to save the screenshot
+        port (int): The port to use for the website.
+        options (ScreenshotOptions, optional): The options to use for taking the screenshot. Defaults to ScreenshotOptions().
+        driver_pool (DriverPool, optional): The pool to take the driver from. If None, a new driver is launched and closed.
+        url (str, optional): The URL of the website. Defaults to "http://localhost:{port}".
 
-    # Take a screenshot of the page
-    driver.save_screenshot(path)
-    close_driver(driver)
+    Returns:
+        List[Action]: A list of actions performed to take the screenshot
 
+    Raises:
+        ValueError: If the path does not end with .png
+    """
+    if not path.endswith(".png"):
+        raise ValueError("The path should end with .png")
+    screenshot, actions, _ = take_random_screenshot(
+        port, options=options, driver_pool=driver_pool, url=url
+    )
+    with open(path, "wb") as f:
+        f.write(screenshot)
     return actions
 
 
@@ -0,0 +1,182 @@
+from selenium import webdriver
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from .driver import create_driver, close_driver
+
+
+class DriverPool:
+    """A pool of long-lived headless Chrome instances.
+
+    Launching Chrome is expensive, so the drivers are kept alive and reset between sites:
+    the cookies and storage of the last site are cleared and a fresh tab is opened.
+    Drivers that crashed are replaced and each driver is recycled after `max_uses` sites
+    to bound the memory used by Chrome.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        resolution: tuple[int, int] = (1920, 1080),
+        max_uses: int = 50,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            size: The maximum number of Chrome instances alive at the same time.
+            resolution: The default window size of the drivers.
+            max_uses: The number of sites a driver renders before being recycled.
+            verbose: Whether to print the progress.
+        """
+        self.size: int = size
+        self.resolution: tuple[int, int] = resolution
+        self.max_uses: int = max_uses
+        self.verbose: bool = verbose
+        self._idle: List[webdriver.Chrome] = []
+        self._uses: Dict[int, int] = {}
+        self._num_alive: int = 0
+        self._closed: bool = False
+        self._condition = threading.Condition()
+
+    def __enter__(self) -> "DriverPool":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def is_alive(driver: webdriver.Chrome) -> bool:
+        """Check if the driver still responds."""
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def _remove(self, driver: webdriver.Chrome):
+        """Free the slot of a driver. Must be called with the lock held.
+
+        The driver is then quit with `_quit` once the lock is released, so that a slow
+        Chrome shutdown does not block the other workers.
+        """
+        self._uses.pop(id(driver), None)
+        self._num_alive -= 1
+        self._condition.notify()
+
+    @staticmethod
+    def _quit(driver: webdriver.Chrome):
+        try:
+            close_driver(driver)
+        except Exception:
+            # The driver probably crashed already
+            pass
+
+    def acquire(self, resolution: Optional[tuple[int, int]] = None) -> webdriver.Chrome:
+        """Take a driver from the pool, launching a new one if none is idle.
+
+        Args:
+            resolution (tuple[int, int], optional): The window size to use. Defaults to the pool resolution.
+
+        Returns:
+            webdriver.Chrome: A driver with a fresh tab
+        """
+        resolution = resolution or self.resolution
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise ValueError("The driver pool is closed")
+                    if self._idle:
+                        driver = self._idle.pop()
+                        break
+                    if self._num_alive < self.size:
+                        # Reserve the slot, the driver is launched outside of the lock
+                        self._num_alive += 1
+                        driver = None
+                        break
+                    self._condition.wait()
+
+            # Chrome is only talked to outside of the lock
+            if driver is None or self.is_alive(driver):
+                break
+            if self.verbose:
+                print("Replacing a crashed driver.")
+            with self._condition:
+                self._remove(driver)
+            self._quit(driver)
+
+        if driver is None:
+            try:
+                driver = create_driver(resolution)
+            except Exception:
+                with self._condition:
+                    self._num_alive -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._uses[id(driver)] = 0
+            if self.verbose:
+                print("Launched a new driver.")
+        else:
+            driver.set_window_size(*resolution)
+        return driver
+
+    def _reset(self, driver: webdriver.Chrome):
+        """Clear the state left by the last site and open a fresh tab."""
+        url = urlparse(driver.current_url)
+        if url.scheme in ("http", "https"):
+            driver.execute_cdp_cmd(
+                "Storage.clearDataForOrigin",
+                {"origin": f"{url.scheme}://{url.netloc}", "storageTypes": "all"},
+            )
+        driver.delete_all_cookies()
+
+        old_handles = driver.window_handles
+        driver.switch_to.new_window("tab")
+        new_handle = driver.current_window_handle
+        for handle in old_handles:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(new_handle)
+
+    def release(self, driver: webdriver.Chrome, broken: bool = False):
+        """Give a driver back to the pool.
+
+        Args:
+            driver (webdriver.Chrome): The driver taken with `acquire`.
+            broken (bool, optional): Whether the driver should be discarded instead of reused. Defaults to False.
+        """
+        with self._condition:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            recycle = broken or self._closed or self._uses[id(driver)] >= self.max_uses
+
+        if not recycle:
+            try:
+                self._reset(driver)
+            except Exception as e:
+                # The driver crashed or its chromedriver is unreachable
+                if self.verbose:
+                    print(f"Failed to reset the driver: {e}")
+                recycle = True
+
+        with self._condition:
+            if recycle:
+                self._remove(driver)
+            else:
+                self._idle.append(driver)
+                self._condition.notify()
+        if recycle:
+            self._quit(driver)
+
+    def close(self):
+        """Quit all the idle drivers. Drivers in use are quit when released."""
+        with self._condition:
+            self._closed = True
+            drivers = self._idle
+            self._idle = []
+            for driver in drivers:
+                self._remove(driver)
+            self._condition.notify_all()
+        for driver in drivers:
+            self._quit(driver)
@@ -0,0 +1,199 @@
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from selenium import webdriver
+
+# Marks the cells of a grid over the viewport covered by elements that paint something
+# (text, media, form controls, background images or colors different from the page),
+# and returns the percentage of covered cells. Bounding boxes overestimate what is
+# painted, so a page is only found blank when it certainly is mostly background.
+PROBE_SCRIPT = """
+const [cols, rows, maxElements] = arguments;
+const vw = window.innerWidth, vh = window.innerHeight;
+const cells = new Uint8Array(cols * rows);
+const isTransparent = (c) => !c || c === "transparent" || /rgba\\(.*,\\s*0\\)$/.test(c);
+const MEDIA = ["IMG", "SVG", "CANVAS", "VIDEO", "IFRAME", "INPUT", "BUTTON", "TEXTAREA",
+               "SELECT", "PICTURE", "OBJECT", "EMBED"];
+
+let pageBackground = "rgb(255, 255, 255)";
+for (const el of [document.body, document.documentElement]) {
+    if (!el) continue;
+    const style = getComputedStyle(el);
+    if (style.backgroundImage !== "none") {
+        return {coverage: 100, num_elements: 0, text_length: 0, num_scanned: 0};
+    }
+    if (!isTransparent(style.backgroundColor)) {
+        pageBackground = style.backgroundColor;
+        break;
+    }
+}
+
+let numElements = 0, textLength = 0;
+const elements = document.body ? document.body.getElementsByTagName("*") : [];
+const numScanned = Math.min(elements.length, maxElements);
+for (let i = 0; i < numScanned; i++) {
+    const el = elements[i];
+    const rect = el.getBoundingClientRect();
+    if (rect.width < 1 || rect.height < 1 || rect.bottom <= 0 || rect.right <= 0
+        || rect.top >= vh || rect.left >= vw) continue;
+    const style = getComputedStyle(el);
+    if (style.visibility === "hidden" || parseFloat(style.opacity) === 0) continue;
+
+    let ownText = 0;
+    for (const node of el.childNodes) {
+        if (node.nodeType === Node.TEXT_NODE) ownText += node.textContent.trim().length;
+    }
+    const painted = ownText > 0
+        || MEDIA.includes(el.tagName.toUpperCase())
+        || style.backgroundImage !== "none"
+        || (!isTransparent(style.backgroundColor) && style.backgroundColor !== pageBackground);
+    if (!painted) continue;
+
+    numElements++;
+    textLength += ownText;
+    const x0 = Math.max(0, Math.floor(rect.left / vw * cols));
+    const x1 = Math.min(cols, Math.ceil(rect.right / vw * cols));
+    const y0 = Math.max(0, Math.floor(rect.top / vh * rows));
+    const y1 = Math.min(rows, Math.ceil(rect.bottom / vh * rows));
+    for (let y = y0; y < y1; y++) {
+        for (let x = x0; x < x1; x++) cells[y * cols + x] = 1;
+    }
+}
+
+let covered = 0;
+for (const cell of cells) covered += cell;
+return {
+    coverage: 100 * covered / cells.length,
+    num_elements: numElements,
+    text_length: textLength,
+    num_scanned: numScanned,
+};
+"""
+
+
+class ProbeOptions:
+    """A class to store the parameters of the blank page probe"""
+
+    """The minimum percentage of the viewport covered by content for a page not to be blank"""
+    min_coverage: float = 5.0
+
+    """The number of columns and rows of the grid the coverage is measured on"""
+    grid_size: Tuple[int, int] = (32, 18)
+
+    """The maximum number of elements to look at"""
+    max_elements: int = 5000
+
+    """Whether to skip the screenshot of blank pages. Otherwise the probe is only recorded"""
+    enforce: bool = False
+
+    """The fraction of blank pages whose screenshot is taken anyway when enforcing, to measure the agreement"""
+    audit_rate: float = 0.1
+
+
+class ProbeResult:
+    """What the probe found on a page"""
+
+    def __init__(self, info: Dict[str, Any], options: ProbeOptions, duration: float):
+        self.coverage: float = float(info["coverage"])
+        self.num_elements: int = int(info["num_elements"])
+        self.text_length: int = int(info["text_length"])
+        self.blank: bool = self.coverage < options.min_coverage
+        self.duration: float = duration
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "blank": self.blank,
+            "coverage": round(self.coverage, 2),
+            "num_elements": self.num_elements,
+            "text_length": self.text_length,
+            "duration": round(self.duration, 4),
+        }
+
+
+def probe_page(
+    driver: webdriver.Chrome, options: ProbeOptions = ProbeOptions()
+) -> ProbeResult:
+    """Check if the page loaded in the driver is blank, from its DOM
+
+    Args:
+        driver (webdriver.Chrome): The Chrome WebDriver, with the page loaded
+        options (ProbeOptions, optional): The options of the probe. Defaults to ProbeOptions().
+
+    Returns:
+        ProbeResult: The coverage of the viewport and whether the page is blank
+    """
+    start = time.monotonic()
+    info = driver.execute_script(
+        PROBE_SCRIPT, options.grid_size[0], options.grid_size[1], options.max_elements
+    )
+    return ProbeResult(info, options, time.monotonic() - start)
+
+
+class ProbeStats:
+    """Count how often the probe agrees with the verdict of the ImageFilter on the screenshot.
+
+    A screenshot is blank for the ImageFilter if it has too many white or background pixels.
+    """
+
+    def __init__(self):
+        self.num_skipped: int = 0  # Blank pages whose screenshot was not taken
+        self.num_both_blank: int = 0
+        self.num_probe_only_blank: int = 0  # The probe would have wrongly skipped these
+        self.num_image_only_blank: int = 0  # The probe missed these
+        self.num_both_content: int = 0
+        self.total_duration: float = 0.0
+        self._lock = threading.Lock()
+
+    def record_skipped(self, result: ProbeResult):
+        with self._lock:
+            self.num_skipped += 1
+            self.total_duration += result.duration
+
+    def record(self, result: ProbeResult, image_blank: bool):
+        with self._lock:
+            self.total_duration += result.duration
+            if result.blank and image_blank:
+                self.num_both_blank += 1
+            elif result.blank:
+                self.num_probe_only_blank += 1
+            elif image_blank:
+                self.num_image_only_blank += 1
+            else:
+                self.num_both_content += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            num_compared = (
+                self.num_both_blank
+                + self.num_probe_only_blank
+                + self.num_image_only_blank
+                + self.num_both_content
+            )
+            num_probed = num_compared + self.num_skipped
+            num_probe_blank = self.num_both_blank + self.num_probe_only_blank
+            return {
+                "probed": num_probed,
+                "skipped": self.num_skipped,
+                "compared": num_compared,
+                "agreement": (
+                    round(
+                        (self.num_both_blank + self.num_both_content) / num_compared, 4
+                    )
+                    if num_compared
+                    else None
+                ),
+                # Among the compared pages the probe found blank, the fraction that really were
+                "blank_precision": (
+                    round(self.num_both_blank / num_probe_blank, 4)
+                    if num_probe_blank
+                    else None
+                ),
+                "both_blank": self.num_both_blank,
+                "probe_only_blank": self.num_probe_only_blank,
+                "image_only_blank": self.num_image_only_blank,
+                "both_content": self.num_both_content,
+                "mean_duration": (
+                    round(self.total_duration / num_probed, 4) if num_probed else None
+                ),
+            }
@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Status of a repository in the checkpoint
+CLAIMED = "claimed"  # Being processed
+REJECTED = "rejected"  # Processed and rejected
+COLLECTED = "collected"  # Processed and kept in the dataset
+INTERRUPTED = "interrupted"  # Was being processed when the crawl stopped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repos (
+    name TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    repo_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    website_index INTEGER,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repos_status ON repos (status);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class CrawlCheckpoint:
+    """Persist the state of a crawl in SQLite so that it can be resumed after a crash.
+
+    The database is opened in WAL mode and every update is its own transaction,
+    so a crash never leaves a half-written state behind.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: The path to the SQLite database, created if it does not exist.
+        """
+        self.db_path: str = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _get_meta(self, key: str) -> Optional[Any]:
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_meta(self, key: str, value: Any):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+
+    def load(self) -> Dict[str, Any]:
+        """Load the state of the previous runs.
+
+        Repositories that were being processed when the crawl stopped are marked as
+        interrupted and returned so that their leftovers can be deleted. They are not retried.
+
+        Returns:
+            Dict[str, Any]: The tried repositories ("repos"), the users already collected from
+                ("users"), the number of websites collected, the index of the next website,
+                the search cursor, the image hashes (only saved without a hash store) and
+                the interrupted repositories ("interrupted", their repo_name)
+        """
+        with self._lock, self._conn:
+            interrupted = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT repo_name FROM repos WHERE status = ?", (CLAIMED,)
+                )
+            ]
+            self._conn.execute(
+                "UPDATE repos SET status = ?, updated_at = ? WHERE status = ?",
+                (INTERRUPTED, time.time(), CLAIMED),
+            )
+            repos = [row[0] for row in self._conn.execute("SELECT name FROM repos")]
+            users = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT user FROM repos WHERE status = ?", (COLLECTED,)
+                )
+            ]
+            hashes = [row[0] for row in self._conn.execute("SELECT hash FROM hashes")]
+            # Interrupted websites leave gaps in the indices, which are not reused
+            last_index = self._conn.execute(
+                "SELECT MAX(website_index) FROM repos WHERE status = ?", (COLLECTED,)
+            ).fetchone()[0]
+            return {
+                "repos": repos,
+                "users": users,
+                "num_websites_collected": self._get_meta("num_websites_collected") or 0,
+                "next_website_index": 0 if last_index is None else last_index + 1,
+                "cursor": self._get_meta("cursor"),
+                "hashes": hashes,
+                "interrupted": interrupted,
+            }
+
+    def claim_repo(self, name: str, user: str, repo_name: str):
+        """Record that a repository is being processed."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO repos (name, user, repo_name, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (name, user, repo_name, CLAIMED, time.time()),
+            )
+
+    def reject_repo(self, name: str):
+        """Record that a repository was rejected."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE repos SET status = ?, updated_at = ? WHERE name = ?",
+                (REJECTED, time.time(), name),
+            )
+
+    def collect_repo(self, name: str, repo_name: str, website_index: int):
+        """Record that a repository was added to the dataset under `repo_name`.
+
+        This should only be called once its screenshot and metadata are on disk: until
+        then, it stays claimed and is cleaned up if the crawl stops.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE repos SET status = ?, repo_name = ?, website_index = ?, updated_at = ? WHERE name = ?",
+                (COLLECTED, repo_name, website_index, time.time(), name),
+            )
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM repos WHERE status = ?", (COLLECTED,)
+            ).fetchone()[0]
+            self._set_meta("num_websites_collected", count)
+
+    def add_hashes(self, hashes: List[str]):
+        """Record image hashes, for crawls that do not use a hash store."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO hashes (hash) VALUES (?)",
+                [(hash,) for hash in hashes],
+            )
+
+    def save_cursor(self, cursor: Dict[str, Any]):
+        """Record the position of the search."""
+        with self._lock, self._conn:
+            self._set_meta("cursor", cursor)
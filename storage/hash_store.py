@@ -0,0 +1,259 @@
+import argparse
+import fcntl
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"HASHSTR1"
+HEADER_SIZE = 16  # Magic, record size and padding
+
+# One record per hash: the packed bits (see imaging.hash_index.pack_hash), the offset
+# of its metadata in the metadata file (-1 if none) and the number of bits of the hash
+RECORD_DTYPE = np.dtype(
+    [
+        ("value", "<u8"),
+        ("metadata_offset", "<i8"),
+        ("num_bits", "<u2"),
+        ("reserved", "<u2", (3,)),
+    ]
+)
+
+# Number of bits set in each byte, for numpy versions without bitwise_count
+_BITS_IN_BYTE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def count_bits(values: np.ndarray) -> np.ndarray:
+    """Count the bits set in each value of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _BITS_IN_BYTE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class HashStore:
+    """An append-only file of image hashes, shared by processes and runs.
+
+    The records have a fixed size and are memory-mapped, so opening a store does not parse
+    anything. Metadata (e.g. the screenshot a hash comes from) is stored as JSON lines in
+    a second file, at the offset given by the record. Appends are serialized between
+    processes with a lock on the file, and records appended by other processes are seen
+    as soon as they are written. Duplicates can be removed offline with `compact`.
+
+    Searching all the records takes a pass over the file, so callers that keep the hashes
+    in memory (see main.ImageFilter) should only search the records appended since they
+    last read them, with `records_since` and the `start` of `find` and `add`.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: The path to the store, created if it does not exist. The metadata is stored next to it.
+        """
+        self.path: str = path
+        self.metadata_path: str = f"{path}.meta.jsonl"
+        self._records: np.ndarray = np.zeros(0, dtype=RECORD_DTYPE)
+        self._file = open(path, "a+b")
+        with self._locked():
+            if os.fstat(self._file.fileno()).st_size == 0:
+                header = MAGIC + np.uint32(RECORD_DTYPE.itemsize).tobytes()
+                self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+                self._file.flush()
+        self._file.seek(0)
+        header = self._file.read(HEADER_SIZE)
+        record_size = int(np.frombuffer(header[8:12], dtype=np.uint32)[0])
+        if header[:8] != MAGIC or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a hash store")
+        self.refresh()
+
+    def close(self):
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _locked(self):
+        return _FileLock(self._file)
+
+    def refresh(self):
+        """Map the records appended since the last refresh, by any process."""
+        size = os.fstat(self._file.fileno()).st_size
+        # Ignore a record being written
+        num_records = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if num_records == len(self._records):
+            return
+        self._records = np.memmap(
+            self.path,
+            dtype=RECORD_DTYPE,
+            mode="r",
+            offset=HEADER_SIZE,
+            shape=(num_records,),
+        )
+
+    def records_since(self, start: int) -> np.ndarray:
+        """Get the records from index `start` on, including the ones appended by other processes."""
+        self.refresh()
+        return self._records[start:]
+
+    def find(
+        self, value: int, num_bits: int, max_distance: int = 0, start: int = 0
+    ) -> Optional[Tuple[int, int]]:
+        """Find a hash of `num_bits` bits within `max_distance` bits of `value`.
+
+        Args:
+            value: The packed hash.
+            num_bits: The number of bits of the hash.
+            max_distance: The maximum number of different bits.
+            start: Only the records from this index on are searched.
+
+        Returns:
+            The index of the closest record and its distance to `value`, or None if there is none.
+        """
+        records = self.records_since(start)
+        if len(records) == 0:
+            return None
+        same_size = records["num_bits"] == num_bits
+        distances = count_bits(records["value"] ^ np.uint64(value))
+        matches = np.flatnonzero(same_size & (distances <= max_distance))
+        if len(matches) == 0:
+            return None
+        closest = matches[np.argmin(distances[matches])]
+        return start + int(closest), int(distances[closest])
+
+    def add(
+        self,
+        value: int,
+        num_bits: int,
+        metadata: Optional[Dict[str, Any]] = None,
+        max_distance: Optional[int] = None,
+        start: int = 0,
+    ) -> bool:
+        """Append a hash.
+
+        Args:
+            value: The packed hash.
+            num_bits: The number of bits of the hash.
+            metadata: Saved along with the hash.
+            max_distance: If given, the hash is not added if a hash within this distance
+                is already stored. The check and the append are atomic across processes.
+            start: Only the records from this index on are checked, the caller having
+                checked the ones before.
+
+        Returns:
+            Whether the hash was added.
+        """
+        with self._locked():
+            if max_distance is not None and self.find(
+                value, num_bits, max_distance, start
+            ):
+                return False
+
+            metadata_offset = -1
+            if metadata is not None:
+                with open(self.metadata_path, "ab") as f:
+                    metadata_offset = f.tell()
+                    f.write(json.dumps(metadata).encode("utf-8") + b"\n")
+
+            # Drop a record left incomplete by a crash, so that records stay aligned
+            size = os.fstat(self._file.fileno()).st_size
+            aligned_size = (
+                HEADER_SIZE
+                + (size - HEADER_SIZE) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+            )
+            if aligned_size != size:
+                self._file.truncate(aligned_size)
+
+            record = np.zeros(1, dtype=RECORD_DTYPE)
+            record["value"] = value
+            record["metadata_offset"] = metadata_offset
+            record["num_bits"] = num_bits
+            self._file.write(record.tobytes())
+            self._file.flush()
+        self.refresh()
+        return True
+
+    def get_metadata(self, index: int) -> Optional[Dict[str, Any]]:
+        """Get the metadata of a record."""
+        self.refresh()
+        offset = int(self._records[index]["metadata_offset"])
+        if offset < 0:
+            return None
+        with open(self.metadata_path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def compact(self) -> int:
+        """Remove the duplicate hashes, keeping the first of each, and their metadata.
+
+        This rewrites the files, so it should not run while other processes use the store.
+
+        Returns:
+            The number of records removed.
+        """
+        with self._locked():
+            self.refresh()
+            records = np.array(self._records)
+            keys = np.stack(
+                [records["value"], records["num_bits"].astype(np.uint64)], axis=1
+            )
+            _, first = np.unique(keys, axis=0, return_index=True)
+            kept = records[np.sort(first)]
+
+            metadata_tmp_path = f"{self.metadata_path}.tmp"
+            with open(metadata_tmp_path, "wb") as f_out:
+                if os.path.exists(self.metadata_path):
+                    with open(self.metadata_path, "rb") as f_in:
+                        for i in range(len(kept)):
+                            offset = int(kept["metadata_offset"][i])
+                            if offset < 0:
+                                continue
+                            f_in.seek(offset)
+                            line = f_in.readline()
+                            kept["metadata_offset"][i] = f_out.tell()
+                            f_out.write(line)
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                self._file.seek(0)
+                f.write(self._file.read(HEADER_SIZE))
+                f.write(kept.tobytes())
+            os.replace(metadata_tmp_path, self.metadata_path)
+            os.replace(tmp_path, self.path)
+
+        # Reopen the compacted file
+        self._file.close()
+        self._file = open(self.path, "a+b")
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.refresh()
+        return len(records) - len(kept)
+
+
+class _FileLock:
+    """An exclusive lock on a file, held across processes."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or compact a hash store")
+    parser.add_argument("path", type=str, help="The path to the hash store")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Remove the duplicate hashes (no crawl should be using the store)",
+    )
+    args = parser.parse_args()
+
+    store = HashStore(args.path)
+    print(f"{len(store)} hashes in {args.path}")
+    if args.compact:
+        print(f"Removed {store.compact()} duplicate hashes")
+    store.close()
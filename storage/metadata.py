@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+METADATA_FILE = "metadata.jsonl"
+INDEX_FILE = "metadata.index.jsonl"
+
+# The columns of a metadata row and their types. Every row has all of them (None when
+# unknown), in this order. The nested results of the filters are flattened, and only
+# the fields of the GitHub API response that are used are kept: the rest (URLs of the
+# API endpoints, the owner's profile, permissions...) made up most of the bytes.
+SCHEMA: Dict[str, type] = {
+    # The repository
+    "repo_name": str,
+    "full_name": str,
+    "owner": str,
+    "html_url": str,
+    "clone_url": str,
+    "description": str,
+    "language": str,
+    "topics": list,
+    "license": str,
+    "default_branch": str,
+    "created_at": str,
+    "pushed_at": str,
+    "size": int,
+    "stargazers_count": int,
+    "forks_count": int,
+    # Where it was saved
+    "repo_path": str,
+    "image_path": str,
+    # The clone (see fetcher.clone.CloneStats)
+    "clone_bytes_transferred": int,
+    "clone_bytes_on_disk": int,
+    "clone_duration": float,
+    # The file filter (see fetcher.filter.analyze_repo)
+    "only_contains_readme": bool,
+    "num_files_total": int,
+    "num_files_code": int,
+    "num_files_style": int,
+    "num_files_asset": int,
+    "num_lines_code": int,
+    "num_lines_style": int,
+    # The blank page probe (see renderer.probe.ProbeResult)
+    "probe_blank": bool,
+    "probe_coverage": float,
+    "probe_num_elements": int,
+    "probe_text_length": int,
+    "probe_duration": float,
+    # The image filter (see main.ImageFilter.check_image)
+    "white_pixels_ratio": float,
+    "most_frequent_color_ratio": float,
+    "hash": str,
+    "stats_max_error": float,
+}
+
+
+def flatten_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn the metadata gathered by the crawl into a row of the schema.
+
+    Args:
+        metadata: The repository returned by the GitHub API, with the results of each stage.
+
+    Returns:
+        Dict[str, Any]: The row, with the columns of SCHEMA
+    """
+    owner = metadata.get("owner") or {}
+    license_info = metadata.get("license") or {}
+    clone_stats = metadata.get("clone_stats") or {}
+    file_filter_results = metadata.get("file_filter_results") or {}
+    num_files = file_filter_results.get("num_files") or {}
+    num_lines = file_filter_results.get("num_lines") or {}
+    probe_results = metadata.get("probe_results") or {}
+    image_filter_results = metadata.get("image_filter_results") or {}
+
+    values = {
+        "repo_name": metadata.get("repo_name"),
+        "full_name": metadata.get("full_name"),
+        "owner": owner.get("login"),
+        "html_url": metadata.get("html_url"),
+        "clone_url": metadata.get("clone_url"),
+        "description": metadata.get("description"),
+        "language": metadata.get("language"),
+        "topics": metadata.get("topics"),
+        "license": license_info.get("spdx_id"),
+        "default_branch": metadata.get("default_branch"),
+        "created_at": metadata.get("created_at"),
+        "pushed_at": metadata.get("pushed_at"),
+        "size": metadata.get("size"),
+        "stargazers_count": metadata.get("stargazers_count"),
+        "forks_count": metadata.get("forks_count"),
+        "repo_path": metadata.get("repo_path"),
+        "image_path": metadata.get("image_path"),
+        "clone_bytes_transferred": clone_stats.get("bytes_transferred"),
+        "clone_bytes_on_disk": clone_stats.get("bytes_on_disk"),
+        "clone_duration": clone_stats.get("duration"),
+        "only_contains_readme": file_filter_results.get("only_contains_readme"),
+        "num_files_total": num_files.get("total"),
+        "num_files_code": num_files.get("code"),
+        "num_files_style": num_files.get("style"),
+        "num_files_asset": num_files.get("asset"),
+        "num_lines_code": num_lines.get("code"),
+        "num_lines_style": num_lines.get("style"),
+        "probe_blank": probe_results.get("blank"),
+        "probe_coverage": probe_results.get("coverage"),
+        "probe_num_elements": probe_results.get("num_elements"),
+        "probe_text_length": probe_results.get("text_length"),
+        "probe_duration": probe_results.get("duration"),
+        "white_pixels_ratio": image_filter_results.get("white_pixels_ratio"),
+        "most_frequent_color_ratio": image_filter_results.get(
+            "most_frequent_color_ratio"
+        ),
+        "hash": image_filter_results.get("hash"),
+        "stats_max_error": image_filter_results.get("stats_max_error"),
+    }
+    return {
+        column: None if values[column] is None else column_type(values[column])
+        for column, column_type in SCHEMA.items()
+    }
+
+
+class MetadataSink:
+    """Append the metadata rows of a dataset to a single JSON lines file.
+
+    Rows are buffered and written in batches, or after `flush_interval` seconds when
+    they come in slowly. An index maps each key to the offset and
+    size of its row, so that a row can be read without parsing the file. Writing to an
+    existing dataset appends to it, and keys already in it are rejected.
+    """
+
+    def __init__(
+        self,
+        dataset_dir: str,
+        batch_size: int = 32,
+        flush_interval: Optional[float] = 5.0,
+    ):
+        """
+        Args:
+            dataset_dir: The directory of the metadata file and its index.
+            batch_size: The number of rows buffered before they are written.
+            flush_interval: The longest time a row stays buffered, in seconds. None
+                only writes full batches (and the last one on close).
+        """
+        self.dataset_dir: str = dataset_dir
+        self.batch_size: int = batch_size
+        os.makedirs(dataset_dir, exist_ok=True)
+
+        self.keys: set = set()
+        index_path = os.path.join(dataset_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            self.keys.update(entry["key"] for entry in read_index(dataset_dir))
+        self._file = open(os.path.join(dataset_dir, METADATA_FILE), "ab")
+        self._index = open(index_path, "a")
+        self._rows: List[Dict[str, Any]] = []
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if flush_interval is not None:
+            self._thread = threading.Thread(
+                target=self._flush_periodically, args=(flush_interval,), daemon=True
+            )
+            self._thread.start()
+
+    def _flush_periodically(self, interval: float):
+        while not self._stop_event.wait(interval):
+            self.flush()
+
+    def add(self, row: Dict[str, Any], on_written: Optional[Callable[[], None]] = None):
+        """Add a row, keyed by its repo_name.
+
+        Args:
+            row: The row, as returned by flatten_metadata.
+            on_written: Called once the row and its index entry are written, by the thread
+                that writes the batch.
+
+        Raises:
+            ValueError: If the row has no repo_name or is already in the dataset
+        """
+        key = row.get("repo_name")
+        if not key:
+            raise ValueError("The row has no repo_name")
+        with self._lock:
+            if key in self.keys:
+                raise ValueError(f"{key} is already in the dataset")
+            self.keys.add(key)
+            self._rows.append(row)
+            if on_written is not None:
+                self._callbacks.append(on_written)
+            callbacks = self._flush() if len(self._rows) >= self.batch_size else []
+        for callback in callbacks:
+            callback()
+
+    def _flush(self) -> List[Callable[[], None]]:
+        """Write the buffered rows. Returns the callbacks of the rows, to call without the lock."""
+        if not self._rows:
+            return []
+        # The rows are written before the index, so that an indexed row is always complete
+        entries: List[Dict[str, Any]] = []
+        offset = self._file.tell()
+        lines: List[bytes] = []
+        for row in self._rows:
+            line = json.dumps(row).encode("utf-8") + b"\n"
+            entries.append(
+                {"key": row["repo_name"], "offset": offset, "size": len(line)}
+            )
+            offset += len(line)
+            lines.append(line)
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        self._index.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._index.flush()
+        self._rows = []
+        callbacks, self._callbacks = self._callbacks, []
+        return callbacks
+
+    def flush(self):
+        """Write the buffered rows."""
+        with self._lock:
+            callbacks = self._flush()
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            callbacks = self._flush()
+            self._file.close()
+            self._index.close()
+        for callback in callbacks:
+            callback()
+
+    def __enter__(self) -> "MetadataSink":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_index(dataset_dir: str) -> Iterator[Dict[str, Any]]:
+    """Yield the entries of the index of a metadata file."""
+    with open(os.path.join(dataset_dir, INDEX_FILE), "r") as f:
+        for line in f:
+            # The last line may be incomplete if the writer crashed
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+class MetadataReader:
+    """Read the rows of a metadata file, by key or all at once."""
+
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir: str = dataset_dir
+        self.path: str = os.path.join(dataset_dir, METADATA_FILE)
+        self.index: Dict[str, Dict[str, Any]] = {
+            entry["key"]: entry for entry in read_index(dataset_dir)
+        }
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def get(self, key: str) -> Dict[str, Any]:
+        entry = self.index[key]
+        with open(self.path, "rb") as f:
+            f.seek(entry["offset"])
+            return json.loads(f.read(entry["size"]))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yield the indexed rows, in the order they were written."""
+        entries = sorted(self.index.values(), key=lambda entry: entry["offset"])
+        with open(self.path, "rb") as f:
+            for entry in entries:
+                # Rows are contiguous unless a crash left an unindexed row between them
+                if f.tell() != entry["offset"]:
+                    f.seek(entry["offset"])
+                yield json.loads(f.read(entry["size"]))
+
+    def columns(self, names: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """Read some columns of all the rows (all of them by default)."""
+        names = names or list(SCHEMA.keys())
+        columns: Dict[str, List[Any]] = {name: [] for name in names}
+        for row in self:
+            for name in names:
+                columns[name].append(row.get(name))
+        return columns
+
+
+def convert_directory(
+    metadata_dir: str, dataset_dir: str, verbose: bool = False
+) -> int:
+    """Convert the metadata saved as one JSON file per repository into rows.
+
+    Rows already in the output are skipped, so a conversion can be resumed.
+
+    Returns:
+        int: The number of rows added
+    """
+    num_added = 0
+    with MetadataSink(dataset_dir) as sink:
+        for file_name in sorted(os.listdir(metadata_dir)):
+            key, extension = os.path.splitext(file_name)
+            if extension != ".json" or key in sink.keys:
+                continue
+            with open(os.path.join(metadata_dir, file_name), "r") as f:
+                metadata = json.load(f)
+            metadata.setdefault("repo_name", key)
+            if "image_path" not in metadata:
+                image_path = os.path.join(
+                    os.path.dirname(os.path.normpath(metadata_dir)),
+                    "images",
+                    f"{key}.png",
+                )
+                if os.path.exists(image_path):
+                    metadata["image_path"] = image_path
+            sink.add(flatten_metadata(metadata))
+            num_added += 1
+            if verbose and num_added % 1000 == 0:
+                print(f"Converted {num_added} files")
+    return num_added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a directory of JSON metadata files into a single JSON lines file"
+    )
+    parser.add_argument(
+        "metadata_dir", type=str, help="The directory with one JSON file per repository"
+    )
+    parser.add_argument(
+        "output_dir", type=str, help="The directory to write the metadata file to"
+    )
+    args = parser.parse_args()
+
+    num_added = convert_directory(args.metadata_dir, args.output_dir, verbose=True)
+    print(f"Added {num_added} rows to {os.path.join(args.output_dir, METADATA_FILE)}")
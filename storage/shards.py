@@ -0,0 +1,297 @@
+import argparse
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+INDEX_FILE = "index.jsonl"
+SHARD_PATTERN = "shard-{:06d}.tar"
+IMAGE_FORMATS = ["png", "webp"]
+
+
+def encode_image(
+    image: bytes, image_format: str, quality: Optional[int] = None
+) -> bytes:
+    """Re-encode a PNG image. WebP is lossless unless a quality is given."""
+    if image_format == "png":
+        return image
+    if image_format != "webp":
+        raise ValueError(
+            f"Unknown image format {image_format}, should be one of {IMAGE_FORMATS}"
+        )
+    buffer = io.BytesIO()
+    if quality is None:
+        Image.open(io.BytesIO(image)).save(buffer, format="WEBP", lossless=True)
+    else:
+        Image.open(io.BytesIO(image)).save(buffer, format="WEBP", quality=quality)
+    return buffer.getvalue()
+
+
+class ShardWriter:
+    """Write samples (a screenshot and its metadata) into size-bounded tar shards.
+
+    The shards follow the WebDataset layout: the files of a sample share their key
+    ("{key}.png" or "{key}.webp" and "{key}.json"). An index maps each key to its shard
+    and to the offsets of its files, so that a sample can be read without scanning the
+    shards. Writing to an existing dataset starts a new shard.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        max_shard_bytes: int = 1024 * 1024 * 1024,
+        image_format: str = "png",
+        quality: Optional[int] = None,
+        verbose: bool = False,
+    ):
+        """
+        Args:
+            output_dir: The directory of the shards and the index.
+            max_shard_bytes: A new shard is started once a shard is larger than this.
+            image_format: The format the screenshots are stored in: "png" (as is) or "webp".
+            quality: The quality of lossy WebP. None means lossless.
+            verbose: Whether to print the shards as they are completed.
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(
+                f"Unknown image format {image_format}, should be one of {IMAGE_FORMATS}"
+            )
+        self.output_dir: str = output_dir
+        self.max_shard_bytes: int = max_shard_bytes
+        self.image_format: str = image_format
+        self.quality: Optional[int] = quality
+        self.verbose: bool = verbose
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.keys: set = set()
+        self.num_shards: int = 0
+        index_path = os.path.join(output_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            for entry in read_index(output_dir):
+                self.keys.add(entry["key"])
+                self.num_shards = max(self.num_shards, entry["shard"] + 1)
+        self._index = open(index_path, "a")
+        self._tar: Optional[tarfile.TarFile] = None
+        self._shard: int = -1
+        self._lock = threading.Lock()
+
+    def _open_shard(self):
+        self._shard = self.num_shards
+        self.num_shards += 1
+        path = os.path.join(self.output_dir, SHARD_PATTERN.format(self._shard))
+        self._tar = tarfile.open(path, "w", format=tarfile.USTAR_FORMAT)
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            if self.verbose:
+                print(f"Completed {SHARD_PATTERN.format(self._shard)}")
+            self._tar = None
+
+    def _add_file(self, name: str, data: bytes) -> Tuple[int, int]:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        # The data follows the header of the member
+        header = info.tobuf(self._tar.format, self._tar.encoding, self._tar.errors)
+        offset_data = self._tar.offset + len(header)
+        self._tar.addfile(info, io.BytesIO(data))
+        return offset_data, info.size
+
+    def add(self, key: str, image: bytes, metadata: Dict[str, Any]):
+        """Add a sample.
+
+        Args:
+            key: The key of the sample, e.g. the name of the repository. It cannot contain dots.
+            image: The screenshot, encoded as PNG.
+            metadata: The metadata of the sample.
+
+        Raises:
+            ValueError: If the key contains a dot or is already in the dataset
+        """
+        if "." in key or "/" in key:
+            raise ValueError(f"Keys cannot contain dots or slashes: {key}")
+        image = encode_image(image, self.image_format, self.quality)
+        metadata_bytes = json.dumps(metadata).encode("utf-8")
+        with self._lock:
+            if key in self.keys:
+                raise ValueError(f"{key} is already in the dataset")
+            if self._tar is None:
+                self._open_shard()
+            files = {
+                self.image_format: self._add_file(f"{key}.{self.image_format}", image),
+                "json": self._add_file(f"{key}.json", metadata_bytes),
+            }
+            self._tar.fileobj.flush()
+            self._index.write(
+                json.dumps({"key": key, "shard": self._shard, "files": files}) + "\n"
+            )
+            self._index.flush()
+            self.keys.add(key)
+            if self._tar.offset >= self.max_shard_bytes:
+                self._close_shard()
+
+    def close(self):
+        with self._lock:
+            self._close_shard()
+            self._index.close()
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_index(dataset_dir: str) -> Iterator[Dict[str, Any]]:
+    """Yield the entries of the index of a sharded dataset."""
+    with open(os.path.join(dataset_dir, INDEX_FILE), "r") as f:
+        for line in f:
+            # The last line may be incomplete if the writer crashed
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+class ShardReader:
+    """Read the samples of a sharded dataset, by key or as a stream."""
+
+    def __init__(self, dataset_dir: str):
+        self.dataset_dir: str = dataset_dir
+        self.index: Dict[str, Dict[str, Any]] = {
+            entry["key"]: entry for entry in read_index(dataset_dir)
+        }
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def keys(self) -> List[str]:
+        return list(self.index.keys())
+
+    def shard_paths(self) -> List[str]:
+        shards = sorted({entry["shard"] for entry in self.index.values()})
+        return [
+            os.path.join(self.dataset_dir, SHARD_PATTERN.format(shard))
+            for shard in shards
+        ]
+
+    def get(self, key: str) -> Dict[str, bytes]:
+        """Read the files of a sample, keyed by their extension (e.g. "png" and "json")."""
+        entry = self.index[key]
+        path = os.path.join(self.dataset_dir, SHARD_PATTERN.format(entry["shard"]))
+        sample: Dict[str, bytes] = {}
+        with open(path, "rb") as f:
+            for extension, (offset, size) in entry["files"].items():
+                f.seek(offset)
+                sample[extension] = f.read(size)
+        return sample
+
+    def get_metadata(self, key: str) -> Dict[str, Any]:
+        return json.loads(self.get(key)["json"])
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, bytes]]]:
+        """Stream the samples shard by shard, reading each shard sequentially."""
+        for path in self.shard_paths():
+            key: Optional[str] = None
+            sample: Dict[str, bytes] = {}
+            with tarfile.open(path, "r|") as tar:
+                for member in tar:
+                    member_key, extension = member.name.split(".", 1)
+                    if member_key != key:
+                        if sample and key in self.index:
+                            yield key, sample
+                        key, sample = member_key, {}
+                    sample[extension] = tar.extractfile(member).read()
+            if sample and key in self.index:
+                yield key, sample
+
+
+def convert_directory(
+    data_dir: str,
+    output_dir: str,
+    max_shard_bytes: int = 1024 * 1024 * 1024,
+    image_format: str = "png",
+    quality: Optional[int] = None,
+    verbose: bool = False,
+) -> int:
+    """Convert a dataset saved as files (images/*.png and metadata/*.json) into shards.
+
+    Samples already in the output are skipped, so a conversion can be resumed.
+
+    Returns:
+        int: The number of samples added
+    """
+    metadata_dir = os.path.join(data_dir, "metadata")
+    num_added = 0
+    with ShardWriter(
+        output_dir,
+        max_shard_bytes=max_shard_bytes,
+        image_format=image_format,
+        quality=quality,
+        verbose=verbose,
+    ) as writer:
+        for file_name in sorted(os.listdir(metadata_dir)):
+            key, extension = os.path.splitext(file_name)
+            image_path = os.path.join(data_dir, "images", f"{key}.png")
+            if extension != ".json" or key in writer.keys:
+                continue
+            if not os.path.exists(image_path):
+                if verbose:
+                    print(f"No screenshot for {key}. Skipping...")
+                continue
+            with open(os.path.join(metadata_dir, file_name), "r") as f:
+                metadata = json.load(f)
+            with open(image_path, "rb") as f:
+                image = f.read()
+            writer.add(key, image, metadata)
+            num_added += 1
+    return num_added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a dataset directory into shards"
+    )
+    parser.add_argument(
+        "data_dir", type=str, help="The directory with images/ and metadata/"
+    )
+    parser.add_argument(
+        "output_dir", type=str, help="The directory to write the shards to"
+    )
+    parser.add_argument(
+        "--max_shard_mb",
+        type=float,
+        default=1024,
+        help="The maximum size of a shard in MB",
+    )
+    parser.add_argument(
+        "--image_format",
+        type=str,
+        default="png",
+        choices=IMAGE_FORMATS,
+        help="The format to store the screenshots in",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=None,
+        help="The quality of lossy WebP (lossless if not given)",
+    )
+    args = parser.parse_args()
+
+    num_added = convert_directory(
+        args.data_dir,
+        args.output_dir,
+        max_shard_bytes=int(args.max_shard_mb * 1024 * 1024),
+        image_format=args.image_format,
+        quality=args.quality,
+        verbose=True,
+    )
+    print(f"Added {num_added} samples to {args.output_dir}")
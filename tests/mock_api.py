@@ -0,0 +1,73 @@
+import json
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# A response of the mock: status code, headers and JSON body
+Response = Tuple[int, Dict[str, str], Any]
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    def __init__(self, *args, api: "MockAPI", **kwargs):
+        self.api = api
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        status, headers, body = self.api.respond(url.path, parse_qs(url.query))
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockAPI:
+    """A local stand-in for the GitHub API, answering each path with a list of canned responses.
+
+    The responses of a path are given in order, the last one being repeated. Unknown
+    paths get a 404. The requests received are kept in `requests`.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, List[Response]] = {}
+        self.requests: List[Tuple[str, Dict[str, List[str]]]] = []
+        self._lock = threading.Lock()
+        handler = partial(_MockRequestHandler, api=self)
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._httpd.daemon_threads = True
+        self.url: str = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, path: str, *responses: Response):
+        self.routes.setdefault(path, []).extend(responses)
+
+    def respond(self, path: str, query: Dict[str, List[str]]) -> Response:
+        with self._lock:
+            self.requests.append((path, query))
+            responses = self.routes.get(path)
+            if not responses:
+                return 404, {}, {"message": "Not Found"}
+            return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            return sum(1 for request_path, _ in self.requests if request_path == path)
+
+    def __enter__(self) -> "MockAPI":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
@@ -0,0 +1,77 @@
+import os
+
+import imagehash
+import numpy as np
+from PIL import Image
+
+from imaging.writer import ImageWriter
+from main import ImageFilter
+from storage.checkpoint import CrawlCheckpoint
+from storage.metadata import MetadataReader, MetadataSink
+
+
+def test_only_collected_websites_survive_a_restart(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+    for i, name in enumerate(["a", "b", "c"]):
+        checkpoint.claim_repo(name, f"user_{name}", name)
+    # "b" was reserved the index 1 but was not saved when the crawl stopped
+    checkpoint.collect_repo("a", "0_a", 0)
+    checkpoint.collect_repo("c", "2_c", 2)
+    checkpoint.close()
+
+    checkpoint = CrawlCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+    saved = checkpoint.load()
+    assert saved["num_websites_collected"] == 2
+    assert saved["next_website_index"] == 3
+    assert saved["interrupted"] == ["b"]
+    assert sorted(saved["users"]) == ["user_a", "user_c"]
+    checkpoint.close()
+
+
+def test_callbacks_run_once_on_disk(tmp_path):
+    written = []
+    sink = MetadataSink(str(tmp_path), batch_size=2)
+    sink.add({"repo_name": "a"}, on_written=lambda: written.append("a"))
+    assert written == []
+    sink.add({"repo_name": "b"}, on_written=lambda: written.append("b"))
+    assert written == ["a", "b"]
+    assert len(MetadataReader(str(tmp_path))) == 2
+    sink.add({"repo_name": "c"}, on_written=lambda: written.append("c"))
+    sink.close()
+    assert written == ["a", "b", "c"]
+
+    image_path = str(tmp_path / "image.png")
+    on_disk = []
+    with ImageWriter() as writer:
+        writer.write(
+            image_path,
+            b"png",
+            on_written=lambda: on_disk.append(os.path.exists(image_path)),
+        )
+        # A failed write does not call back
+        writer.write(
+            str(tmp_path / "missing" / "image.png"),
+            b"png",
+            on_written=lambda: on_disk.append(False),
+        )
+    assert on_disk == [True]
+
+
+def test_hashes_survive_a_restart_without_a_hash_store(tmp_path):
+    image = Image.fromarray(
+        np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+    )
+    checkpoint = CrawlCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+    image_filter = ImageFilter(
+        on_hash_added=lambda hash: checkpoint.add_hashes([str(hash)])
+    )
+    assert image_filter.add_hash(image)[0]
+    checkpoint.close()
+
+    checkpoint = CrawlCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+    image_filter = ImageFilter()
+    image_filter.restore_hashes(
+        imagehash.hex_to_hash(hash) for hash in checkpoint.load()["hashes"]
+    )
+    assert not image_filter.add_hash(image)[0]
+    checkpoint.close()
@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import threading
+import time
+
+import pytest
+
+from fetcher.client import GitHubSearchClient, Prefetcher
+import main
+from main import iterate_github_repos
+
+from .mock_api import MockAPI
+
+SEARCH = "/search/repositories"
+
+
+def page(*names: str):
+    return {
+        "total_count": len(names),
+        "incomplete_results": False,
+        "items": [{"full_name": f"owner/{name}"} for name in names],
+    }
+
+
+@pytest.fixture
+def api():
+    with MockAPI() as api:
+        yield api
+
+
+def test_search_waits_for_rate_limit_reset(api):
+    reset_at = int(time.time()) + 1
+    api.add(
+        SEARCH,
+        (
+            200,
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset_at)},
+            page("a"),
+        ),
+        (200, {"X-RateLimit-Remaining": "29"}, page("b")),
+    )
+    client = GitHubSearchClient(api_url=api.url)
+    assert client.search("q")["items"] == [{"full_name": "owner/a"}]
+    assert client.rate_limit.remaining == 0
+    assert 0 < client.rate_limit.wait_time() <= 2
+
+    client.search("q")
+    assert time.time() >= reset_at
+    assert client.rate_limit.remaining == 29
+
+
+def test_search_retries_after_retry_after(api):
+    api.add(
+        SEARCH,
+        (429, {"Retry-After": "1"}, {"message": "secondary rate limit"}),
+        (200, {}, page("a")),
+    )
+    outcomes = []
+    client = GitHubSearchClient(
+        api_url=api.url, on_search=lambda outcome, _: outcomes.append(outcome)
+    )
+    start = time.monotonic()
+    assert client.search("q")["items"] == [{"full_name": "owner/a"}]
+    assert time.monotonic() - start >= 0.9
+    assert api.count(SEARCH) == 2
+    assert outcomes == ["fetched"]
+
+
+def test_search_does_not_retry_422(api):
+    api.add(SEARCH, (422, {}, {"message": "Validation Failed"}))
+    outcomes = []
+    client = GitHubSearchClient(
+        api_url=api.url, on_search=lambda outcome, _: outcomes.append(outcome)
+    )
+    with pytest.raises(Exception, match="422"):
+        client.search("q", page=11)
+    assert api.count(SEARCH) == 1
+    assert outcomes == ["error"]
+
+
+def test_iterate_moves_to_previous_dates_after_422(api):
+    api.add(
+        SEARCH,
+        (200, {}, page("a", "b")),
+        (422, {}, {"message": "Only the first 1000 search results are available"}),
+        (200, {}, page("c")),
+    )
+    created_after = datetime.date.today() - datetime.timedelta(days=2)
+    args = argparse.Namespace(
+        query_limits=2,
+        day_interval=1,
+        query_created_after=created_after.isoformat(),
+        query_language=None,
+        query_max_size_kb=None,
+    )
+    start = time.monotonic()
+    results = list(iterate_github_repos(args, GitHubSearchClient(api_url=api.url)))
+    # The 422 is the end of the results of a window, not a reason to wait
+    assert time.monotonic() - start < 5
+    assert [repo["full_name"] for _, repo in results] == [
+        "owner/a",
+        "owner/b",
+        "owner/c",
+    ]
+    assert [cursor["page"] for cursor, _ in results] == [1, 1, 1]
+    assert results[0][0]["date_start"] != results[2][0]["date_start"]
+    assert [query["page"] for _, query in api.requests] == [["1"], ["2"], ["1"]]
+
+
+def test_prefetcher_is_bounded():
+    produced = []
+    lock = threading.Lock()
+
+    def produce():
+        for i in range(20):
+            with lock:
+                produced.append(i)
+            yield i
+
+    prefetcher = Prefetcher(produce(), buffer_size=3)
+    time.sleep(0.3)
+    # Up to 3 items in the buffer and one waiting to be put in it
+    with lock:
+        assert len(produced) == 4
+    assert list(prefetcher) == list(range(20))
+
+
+def test_prefetcher_raises_errors_of_the_iterator():
+    def produce():
+        yield 1
+        raise Exception("Failed to retrieve data: 500")
+
+    prefetcher = Prefetcher(produce(), buffer_size=3)
+    assert next(prefetcher) == 1
+    with pytest.raises(Exception, match="500"):
+        next(prefetcher)
+
+
+def test_prefetcher_close_stops_the_producer():
+    produced = []
+
+    def produce():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    prefetcher = Prefetcher(produce(), buffer_size=2)
+    time.sleep(0.2)
+    prefetcher.close()
+    prefetcher._thread.join(timeout=1)
+    assert not prefetcher._thread.is_alive()
+    assert len(produced) == 3
+
+
+def make_args(days_back: int = 2) -> argparse.Namespace:
+    created_after = datetime.date.today() - datetime.timedelta(days=days_back)
+    return argparse.Namespace(
+        query_limits=2,
+        day_interval=1,
+        query_created_after=created_after.isoformat(),
+        query_language=None,
+        query_max_size_kb=None,
+    )
+
+
+def test_iterate_retries_failed_page(api, monkeypatch):
+    monkeypatch.setattr(main, "SEARCH_RETRY_INITIAL_DELAY", 0.01)
+    api.add(
+        SEARCH,
+        (200, {}, page("a", "b")),
+        (502, {}, {"message": "Bad Gateway"}),
+        (500, {}, {"message": "Server Error"}),
+        (200, {}, page("c")),
+        (200, {}, page()),
+    )
+    results = list(
+        iterate_github_repos(make_args(), GitHubSearchClient(api_url=api.url))
+    )
+    assert [repo["full_name"] for _, repo in results] == [
+        "owner/a",
+        "owner/b",
+        "owner/c",
+    ]
+    # The failed page is requested again, not skipped
+    assert [cursor["page"] for cursor, _ in results] == [1, 1, 2]
+    assert [query["page"] for _, query in api.requests] == [
+        ["1"],
+        ["2"],
+        ["2"],
+        ["2"],
+        ["1"],
+    ]
+
+
+def test_iterate_stops_after_max_retries(api, monkeypatch):
+    monkeypatch.setattr(main, "SEARCH_RETRY_INITIAL_DELAY", 0.01)
+    monkeypatch.setattr(main, "SEARCH_MAX_RETRIES", 2)
+    api.add(SEARCH, (200, {}, page("a", "b")), (503, {}, None))
+    results = list(
+        iterate_github_repos(make_args(), GitHubSearchClient(api_url=api.url))
+    )
+    assert [repo["full_name"] for _, repo in results] == ["owner/a", "owner/b"]
+    # No other page or date window is searched
+    assert [query["page"] for _, query in api.requests] == [["1"], ["2"], ["2"], ["2"]]
@@ -0,0 +1,117 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+from fetcher.clone import (
+    CloneOptions,
+    _run_with_budget,
+    checkout_repo,
+    clone_with_options,
+)
+
+
+def git(*args: str, cwd: str):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def bare_repo(tmp_path) -> str:
+    """A bare repository with two commits, a few small files and a large incompressible one"""
+    work = tmp_path / "work"
+    work.mkdir()
+    git("init", "--quiet", "--initial-branch=main", cwd=work)
+    git("config", "user.email", "test@example.com", cwd=work)
+    git("config", "user.name", "Test", cwd=work)
+    (work / "index.html").write_text("<html>v1</html>")
+    git("add", "-A", cwd=work)
+    git("commit", "--quiet", "-m", "first", cwd=work)
+    (work / "index.html").write_text("<html>v2</html>")
+    (work / "_config.yml").write_text("title: test\n")
+    (work / "assets").mkdir()
+    (work / "assets" / "big.bin").write_bytes(os.urandom(1024 * 1024))
+    git("add", "-A", cwd=work)
+    git("commit", "--quiet", "-m", "second", cwd=work)
+
+    bare = tmp_path / "repo.git"
+    git("clone", "--quiet", "--bare", str(work), str(bare), cwd=tmp_path)
+    # Partial clones (blob_size_limit) need the server to allow filters
+    git("config", "uploadpack.allowFilter", "true", cwd=bare)
+    return f"file://{bare}"
+
+
+def make_options(**kwargs) -> CloneOptions:
+    options = CloneOptions()
+    for key, value in kwargs.items():
+        setattr(options, key, value)
+    return options
+
+
+def count_commits(repo_path: str) -> int:
+    output = subprocess.run(
+        ["git", "-C", repo_path, "rev-list", "--count", "HEAD"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return int(output)
+
+
+def test_clone_depth(bare_repo, tmp_path):
+    shallow = str(tmp_path / "shallow")
+    stats = clone_with_options(bare_repo, shallow, make_options(depth=1))
+    assert count_commits(shallow) == 1
+    assert open(os.path.join(shallow, "index.html")).read() == "<html>v2</html>"
+    assert stats.bytes_on_disk >= stats.bytes_transferred > 0
+
+    full = str(tmp_path / "full")
+    clone_with_options(bare_repo, full, make_options(depth=None))
+    assert count_commits(full) == 2
+
+
+def test_clone_sparse(bare_repo, tmp_path):
+    repo_path = str(tmp_path / "sparse")
+    clone_with_options(bare_repo, repo_path, make_options(sparse_paths=["*.html"]))
+    assert os.path.exists(os.path.join(repo_path, "index.html"))
+    assert not os.path.exists(os.path.join(repo_path, "_config.yml"))
+    assert not os.path.exists(os.path.join(repo_path, "assets"))
+
+
+def test_clone_without_checkout(bare_repo, tmp_path):
+    repo_path = str(tmp_path / "later")
+    options = make_options(checkout=False)
+    clone_with_options(bare_repo, repo_path, options)
+    assert not os.path.exists(os.path.join(repo_path, "index.html"))
+
+    checkout_repo(repo_path, options)
+    assert os.path.exists(os.path.join(repo_path, "assets", "big.bin"))
+
+
+def test_clone_budget(bare_repo, tmp_path):
+    repo_path = str(tmp_path / "too_big")
+    with pytest.raises(Exception, match="Budget exceeded"):
+        clone_with_options(bare_repo, repo_path, make_options(max_bytes=512 * 1024))
+
+    # Without the large blob, which is neither fetched nor checked out, the same budget is enough
+    repo_path = str(tmp_path / "small")
+    clone_with_options(
+        bare_repo,
+        repo_path,
+        make_options(
+            max_bytes=512 * 1024,
+            blob_size_limit="100k",
+            sparse_paths=["*.html", "*.yml"],
+        ),
+    )
+    assert os.path.exists(os.path.join(repo_path, "_config.yml"))
+
+
+def test_budget_watcher_returns_when_git_exits(tmp_path):
+    options = make_options(poll_interval=5)
+    start = time.monotonic()
+    _run_with_budget(
+        ["git", "--version"], str(tmp_path), options, start + options.timeout
+    )
+    # Not a whole poll interval
+    assert time.monotonic() - start < 2
@@ -0,0 +1,137 @@
+import os
+import random
+import subprocess
+
+import pytest
+
+from fetcher.filter import (
+    RepoFilterParams,
+    filter_repo,
+    filter_repo_objects,
+    filter_repo_streaming,
+)
+
+CODE = ["js", "html", "md", "py", "rb", "php", "java", "c", "cpp"]
+OTHER = ["css", "png", "svg", "mp4", "txt", "yml", "json", "scss"]
+NAMES = ["index", "about", "main", "page", "post", "style", "logo", "README"]
+DIRS = ["", "", "assets", "assets/img", "_posts", "_layouts", "docs/sub"]
+SPECIAL = ["LICENSE.md", "Gemfile", "Gemfile.lock", "_config.yml", ".hidden.md"]
+
+
+def make_params() -> RepoFilterParams:
+    # Small limits, so that random trees end up on both sides of each of them
+    params = RepoFilterParams()
+    params.min_lines = 10
+    params.max_num_files_code = 5
+    params.max_num_assets = 3
+    params.max_num_lines_code = 60
+    params.max_num_lines_style = 30
+    return params
+
+
+def make_content(rng: random.Random) -> str:
+    lines = [
+        rng.choice(["", "x", "<div></div>", "a = 1"])
+        for _ in range(rng.choice([0, 1, 3, 8, 15, 25, 40]))
+    ]
+    content = "\n".join(lines)
+    if lines and rng.random() < 0.7:
+        content += "\n"
+    if rng.random() < 0.1:
+        content = content.replace("\n", "\r\n")
+    return content
+
+
+def make_tree(path: str, rng: random.Random):
+    os.makedirs(path)
+    files = set()
+    if rng.random() < 0.2:
+        files.add("README.md")
+    for _ in range(rng.randint(0, 9)):
+        extension = rng.choice(CODE + OTHER)
+        directory = rng.choice(DIRS)
+        files.add(os.path.join(directory, f"{rng.choice(NAMES)}.{extension}"))
+    files.update(rng.sample(SPECIAL, rng.randint(0, 2)))
+    for file in files:
+        file_path = os.path.join(path, file)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w", newline="") as f:
+            f.write(make_content(rng))
+
+
+def commit(path: str):
+    for command in [
+        ["git", "init", "--quiet"],
+        ["git", "add", "-A"],
+        [
+            "git",
+            "-c",
+            "user.email=test@example.com",
+            "-c",
+            "user.name=Test",
+            "commit",
+            "--quiet",
+            "--allow-empty",
+            "-m",
+            "tree",
+        ],
+    ]:
+        subprocess.run(command, cwd=path, check=True, capture_output=True)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_streaming_and_objects_filters_match_filter_repo(tmp_path, seed):
+    rng = random.Random(seed)
+    params = make_params()
+    decisions = []
+    for i in range(25):
+        path = str(tmp_path / f"repo_{i}")
+        make_tree(path, rng)
+        commit(path)
+
+        expected, analysis = filter_repo(path, params)
+        streaming, streaming_analysis = filter_repo_streaming(path, params)
+        objects, objects_analysis = filter_repo_objects(path, params)
+        assert streaming == expected, (path, analysis, streaming_analysis)
+        assert objects == expected, (path, analysis, objects_analysis)
+        if expected:
+            # The analysis is complete when the repository passes
+            for results in [streaming_analysis, objects_analysis]:
+                assert results["num_files"] == analysis["num_files"]
+                assert results["num_lines"] == analysis["num_lines"]
+        decisions.append(expected)
+    # The trees are on both sides of the filter
+    assert any(decisions) and not all(decisions)
+
+
+def test_rejection_rules(tmp_path):
+    params = make_params()
+    cases = {
+        "too_few_lines": {"index.html": "a\nb\n"},
+        "only_readme": {"README.md": "line\n" * 20},
+        "too_many_code_files": {f"page{i}.html": "a\nb\nc\n" for i in range(6)},
+        "too_many_assets": {
+            "index.html": "line\n" * 20,
+            **{f"img{i}.png": "" for i in range(4)},
+        },
+        "too_many_code_lines": {"index.html": "line\n" * 61},
+        "too_many_style_lines": {
+            "index.html": "line\n" * 20,
+            "style.css": "line\n" * 31,
+        },
+        "passes": {
+            "index.html": "line\n" * 20,
+            "style.css": "line\n" * 30,
+            "README.md": "line\n" * 40,
+        },
+    }
+    for name, files in cases.items():
+        path = tmp_path / name
+        path.mkdir()
+        for file, content in files.items():
+            (path / file).write_text(content)
+        commit(str(path))
+        expected = name == "passes"
+        assert filter_repo(str(path), params)[0] == expected, name
+        assert filter_repo_streaming(str(path), params)[0] == expected, name
+        assert filter_repo_objects(str(path), params)[0] == expected, name
@@ -0,0 +1,54 @@
+import numpy as np
+from PIL import Image
+
+from main import ImageFilter
+from storage.hash_store import HashStore
+
+
+def make_image(seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 255, (64, 64, 3), dtype=np.uint8))
+
+
+def test_find_from_start(tmp_path):
+    store = HashStore(str(tmp_path / "hashes.bin"))
+    for value in [0b1111, 0b0000, 0b1110]:
+        assert store.add(value, 25)
+    assert store.find(0b1111, 25, max_distance=1) == (0, 0)
+    # The records before start are left out
+    assert store.find(0b1111, 25, max_distance=1, start=1) == (2, 1)
+    assert store.find(0b1111, 25, max_distance=0, start=1) is None
+    assert not store.add(0b1111, 25, max_distance=1, start=2)
+    assert store.add(0b1111, 25, max_distance=0, start=1)
+    assert len(store.records_since(3)) == 1
+    store.close()
+
+
+def test_filters_share_the_store(tmp_path):
+    path = str(tmp_path / "hashes.bin")
+    # Two filters with their own handle on the store, like two processes
+    first = ImageFilter(hash_store=HashStore(path))
+    second = ImageFilter(hash_store=HashStore(path))
+
+    assert first.add_hash(make_image(0))[0]
+    assert second.add_hash(make_image(1))[0]
+    # Appended by the other filter since its last sync
+    assert not first.add_hash(make_image(1))[0]
+    assert not second.add_hash(make_image(0))[0]
+    assert len(first.hash_store) == 2
+    assert first.num_synced_hashes == 2
+
+    # Already in the index of the filter, the store is not searched again
+    assert not first.add_hash(make_image(0))[0]
+    assert len(second.hash_store) == 2
+
+
+def test_hashes_are_loaded_at_startup(tmp_path):
+    path = str(tmp_path / "hashes.bin")
+    first = ImageFilter(hash_store=HashStore(path))
+    for seed in range(3):
+        assert first.add_hash(make_image(seed))[0]
+
+    second = ImageFilter(hash_store=HashStore(path))
+    assert second.num_synced_hashes == 3
+    assert sum(len(index) for index in second.hash_indexes.values()) == 3
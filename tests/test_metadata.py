@@ -0,0 +1,15 @@
+import time
+
+from storage.metadata import MetadataReader, MetadataSink
+
+
+def test_rows_are_flushed_periodically(tmp_path):
+    written = []
+    sink = MetadataSink(str(tmp_path), batch_size=32, flush_interval=0.1)
+    sink.add({"repo_name": "a"}, on_written=lambda: written.append("a"))
+    deadline = time.monotonic() + 2
+    while not written and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert written == ["a"]
+    assert "a" in MetadataReader(str(tmp_path))
+    sink.close()
@@ -0,0 +1,80 @@
+import datetime
+from typing import Any, Dict, List
+
+from fetcher.planner import PartitionPlanner, SearchPartition
+
+
+class FakeClient:
+    """Answer the searches of the planner with canned counts, by query"""
+
+    def __init__(self):
+        self.responses: Dict[str, List[Dict[str, Any]]] = {}
+        self.queries: List[str] = []
+
+    def add(self, partition: SearchPartition, *counts: int, incomplete: bool = False):
+        self.responses[partition.query()] = [
+            {"total_count": count, "incomplete_results": incomplete, "items": []}
+            for count in counts
+        ]
+
+    def search(self, query: str, per_page: int = 100, page: int = 1):
+        self.queries.append(query)
+        responses = self.responses[query]
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+
+def days(root: SearchPartition) -> List[SearchPartition]:
+    return root.split(3, [])
+
+
+def make_root() -> SearchPartition:
+    return SearchPartition(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 3))
+
+
+def test_every_part_is_counted():
+    root = make_root()
+    client = FakeClient()
+    client.add(root, 1800)
+    first, second, last = days(root)
+    client.add(first, 500)
+    client.add(second, 700)
+    # More results than the total of the root leaves, e.g. created since it was counted
+    client.add(last, 900)
+
+    planner = PartitionPlanner(client)
+    partitions = list(planner.iter_partitions(root))
+    assert [count for _, count in partitions] == [900, 700, 500]
+    assert last.query() in client.queries
+    assert planner.stats()["incomplete_counts"] == 0
+
+
+def test_incomplete_count_is_retried():
+    root = make_root()
+    client = FakeClient()
+    client.add(root, 1800)
+    first, second, last = days(root)
+    client.add(first, 500)
+    client.add(second, 100, 700)
+    client.responses[second.query()][0]["incomplete_results"] = True
+    client.add(last, 600)
+
+    planner = PartitionPlanner(client)
+    partitions = list(planner.iter_partitions(root))
+    assert [count for _, count in partitions] == [600, 700, 500]
+    assert client.queries.count(second.query()) == 2
+
+
+def test_incomplete_count_of_last_part_is_bounded_by_the_total():
+    root = make_root()
+    client = FakeClient()
+    client.add(root, 1800)
+    first, second, last = days(root)
+    client.add(first, 500)
+    client.add(second, 700)
+    client.add(last, 100, incomplete=True)
+
+    planner = PartitionPlanner(client, max_count_retries=1)
+    partitions = list(planner.iter_partitions(root))
+    assert [count for _, count in partitions] == [600, 700, 500]
+    assert client.queries.count(last.query()) == 2
+    assert planner.stats()["incomplete_counts"] == 1
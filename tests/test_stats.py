@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from imaging.stats import compute_image_stats
+from main import ImageFilter
+
+
+# The implementation of the ratios before compute_image_stats, kept as the reference
+def old_percentage_of_white_pixels(image_np: np.ndarray) -> float:
+    image_array = image_np
+    if len(image_array.shape) == 3:
+        image_array = np.mean(image_array, axis=2)
+    white_pixels = np.sum(image_array == 255)
+    return (white_pixels / (image_array.shape[0] * image_array.shape[1])) * 100
+
+
+def old_percentage_of_most_frequent_color(image_np: np.ndarray) -> float:
+    pixels = image_np.reshape(-1, image_np.shape[2])
+    _, counts = np.unique([tuple(row) for row in pixels], axis=0, return_counts=True)
+    return (np.max(counts) / (image_np.shape[0] * image_np.shape[1])) * 100
+
+
+def make_images():
+    rng = np.random.default_rng(0)
+    white = np.full((48, 64, 3), 255, dtype=np.uint8)
+
+    noisy = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+    # A few pixels with one channel at 255 are not white
+    mostly_white = np.full((48, 64, 3), 255, dtype=np.uint8)
+    mostly_white[rng.random((48, 64)) < 0.3] = (255, 254, 255)
+    mostly_white[:5, :5] = rng.integers(0, 256, (5, 5, 3), dtype=np.uint8)
+
+    one_color = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    one_color[rng.random((48, 64)) < 0.7] = (12, 34, 200)
+
+    # Few colors, so that several have close counts
+    palette = np.array([(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 255, 0)])
+    few_colors = palette[rng.integers(0, 4, (48, 64))].astype(np.uint8)
+
+    rgba = np.concatenate(
+        [one_color, rng.integers(254, 256, (48, 64, 1), dtype=np.uint8)], axis=2
+    )
+    return {
+        "white": white,
+        "noisy": noisy,
+        "mostly_white": mostly_white,
+        "one_color": one_color,
+        "few_colors": few_colors,
+        "rgba": rgba,
+    }
+
+
+@pytest.mark.parametrize("name", list(make_images().keys()))
+def test_exact_stats_match_the_old_implementation(name):
+    image_np = make_images()[name]
+    expected_white = old_percentage_of_white_pixels(image_np)
+    expected_color = old_percentage_of_most_frequent_color(image_np)
+
+    stats = compute_image_stats(image_np)
+    assert stats.max_error == 0
+    assert stats.white_pixels_ratio == pytest.approx(expected_white, abs=1e-9)
+    assert stats.most_frequent_color_ratio == pytest.approx(expected_color, abs=1e-9)
+
+    stats = ImageFilter().compute_stats(image_np)
+    assert stats.white_pixels_ratio == pytest.approx(expected_white, abs=1e-9)
+    assert stats.most_frequent_color_ratio == pytest.approx(expected_color, abs=1e-9)
@@ -0,0 +1,124 @@
+import subprocess
+import time
+
+import pytest
+
+from fetcher.client import GitHubSearchClient
+from fetcher.tree import TreePrefilter
+
+from .mock_api import MockAPI
+
+
+def tree(*paths: str, truncated: bool = False):
+    return {
+        "tree": [{"path": path, "type": "blob"} for path in paths],
+        "truncated": truncated,
+    }
+
+
+def repo(name: str):
+    return {"full_name": f"owner/{name}", "default_branch": "main"}
+
+
+@pytest.fixture
+def api():
+    with MockAPI() as api:
+        trees = "/repos/owner/{}/git/trees/main"
+        api.add(trees.format("site"), (200, {}, tree("index.html", "style.css")))
+        api.add(trees.format("readme"), (200, {}, tree("README.md")))
+        # Only complete lists can be rejected for the README-only rule
+        api.add(
+            trees.format("truncated"),
+            (200, {}, tree("README.md", truncated=True)),
+        )
+        api.add(
+            trees.format("assets"),
+            (200, {}, tree("index.html", *[f"img/{i}.png" for i in range(10)])),
+        )
+        api.add(
+            trees.format("code"),
+            (200, {}, tree(*[f"page{i}.html" for i in range(10)])),
+        )
+        yield api
+
+
+def test_prefilter_api(api):
+    prefilter = TreePrefilter(source="api", client=GitHubSearchClient(api_url=api.url))
+    results = {
+        name: prefilter.check(repo(name))[0]
+        for name in ["site", "readme", "truncated", "assets", "code", "missing"]
+    }
+    assert results == {
+        "site": True,
+        "readme": False,
+        "truncated": True,
+        "assets": False,
+        "code": False,
+        # The listing failed (404), so the repository is let through
+        "missing": True,
+    }
+    assert prefilter.stats() == {"checked": 6, "clones_saved": 3, "errors": 1}
+    assert api.requests[0][1] == {"recursive": ["1"]}
+
+
+def test_prefilter_shares_rate_limit(api):
+    path = "/repos/owner/limited/git/trees/main"
+    api.add(
+        path,
+        (403, {"Retry-After": "1", "X-RateLimit-Remaining": "0"}, None),
+        (200, {"X-RateLimit-Remaining": "4999"}, tree("README.md")),
+    )
+    client = GitHubSearchClient(api_url=api.url)
+    prefilter = TreePrefilter(source="api", client=client)
+
+    start = time.monotonic()
+    may_pass, _ = prefilter.check(repo("limited"))
+    assert time.monotonic() - start >= 0.9
+    assert not may_pass
+    assert api.count(path) == 2
+    assert client.num_requests == 2
+    # The trees API counts against the "core" budget, not the one of the search
+    assert client.rate_limits["core"].remaining == 4999
+    assert client.rate_limit.remaining is None
+
+
+def test_prefilter_git(tmp_path):
+    work = tmp_path / "work"
+    work.mkdir()
+    for i in range(10):
+        (work / f"{i}.png").write_bytes(b"png")
+    (work / "index.html").write_text("<html></html>")
+    for command in [
+        ["git", "init", "--quiet", "--initial-branch=main"],
+        ["git", "add", "-A"],
+        [
+            "git",
+            "-c",
+            "user.email=test@example.com",
+            "-c",
+            "user.name=Test",
+            "commit",
+            "--quiet",
+            "-m",
+            "first",
+        ],
+    ]:
+        subprocess.run(command, cwd=work, check=True, capture_output=True)
+    bare = tmp_path / "assets.git"
+    subprocess.run(
+        ["git", "clone", "--quiet", "--bare", str(work), str(bare)],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        ["git", "-C", str(bare), "config", "uploadpack.allowFilter", "true"],
+        check=True,
+    )
+
+    prefilter = TreePrefilter(source="git")
+    may_pass, analysis = prefilter.check(
+        {"full_name": "owner/assets", "clone_url": f"file://{bare}"}
+    )
+    assert not may_pass
+    assert analysis["num_files"]["asset"] == 10
+    assert prefilter.stats() == {"checked": 1, "clones_saved": 1, "errors": 0}